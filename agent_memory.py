@@ -1,11 +1,31 @@
-from typing import Dict, List, Optional, Any
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Any, Sequence, Set, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+import itertools
 import json
+import logging
+import os
 import sqlite3
+import threading
+import uuid
+import zlib
 import numpy as np
 from pathlib import Path
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 @dataclass
 class MemoryRecord:
     timestamp: datetime
@@ -13,14 +33,955 @@ class MemoryRecord:
     content: Dict[str, Any]
     importance: float
     context: Optional[Dict[str, Any]] = None
+    embedding: Optional[np.ndarray] = None
+    id: Optional[int] = None
     
+INSERT_MEMORY_SQL = """
+INSERT INTO memories (id, agent_id, timestamp, category, content, importance, context, embedding_row)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SELECT_BY_CATEGORY_SQL = """
+SELECT id, timestamp, category, content, importance, context, embedding_row
+FROM memories
+WHERE agent_id = ? AND category = ?
+ORDER BY importance DESC, timestamp DESC
+LIMIT ?
+"""
+
+INSERT_SEARCH_SQL = """
+INSERT INTO memories_fts (rowid, text, agent_id, category, importance)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+ARCHIVE_COLUMNS = "id, agent_id, timestamp, category, content, importance, context, embedding_row"
+
+SELECT_NEW_EMBEDDINGS_SQL = """
+SELECT id, agent_id, category, importance, timestamp, embedding_row
+FROM memories
+WHERE id > ? AND embedding_row IS NOT NULL
+ORDER BY id
+LIMIT ?
+"""
+
+class MemoryCodec:
+    """Binary codec for memory content and context payloads.
+
+    Every encoded payload starts with a format byte: the low bits select the
+    serializer (JSON or msgpack) and ``FORMAT_ZSTD`` marks a zstd frame, in
+    which case a 4-byte dictionary id (0 for none) follows. Rows written
+    before the codec existed hold JSON text and are decoded unchanged.
+    msgpack and zstandard are optional; without them payloads are stored as
+    uncompressed JSON bytes.
+    """
+
+    FORMAT_JSON = 1
+    FORMAT_MSGPACK = 2
+    FORMAT_ZSTD = 0x80
+
+    def __init__(
+        self,
+        serializer: Optional[str] = None,
+        compress: Optional[bool] = None,
+        level: int = 3,
+        min_compress_size: int = 64,
+        dictionary_loader: Optional[Callable[[int], Optional[bytes]]] = None
+    ):
+        serializer = serializer or ("msgpack" if msgpack is not None else "json")
+        if serializer == "msgpack" and msgpack is None:
+            raise ImportError("msgpack is required for the msgpack memory codec")
+        if compress is None:
+            compress = zstandard is not None
+        elif compress and zstandard is None:
+            raise ImportError("zstandard is required for compressed memory payloads")
+        self.format = self.FORMAT_MSGPACK if serializer == "msgpack" else self.FORMAT_JSON
+        self.compress = compress
+        self.level = level
+        self.min_compress_size = min_compress_size
+        self.dictionary_loader = dictionary_loader
+        self.lock = threading.Lock()
+        self.dictionaries: Dict[int, Any] = {}
+        self.agent_dictionaries: Dict[str, int] = {}
+        # zstd (de)compressors are not thread-safe, so each thread keeps its own
+        self._local = threading.local()
+
+    def serialize(self, value: Any) -> bytes:
+        if self.format == self.FORMAT_MSGPACK:
+            return msgpack.packb(value, use_bin_type=True)
+        return json.dumps(value).encode()
+
+    def use_dictionary(self, agent_id: str, dictionary_id: int, data: bytes):
+        """Compress this agent's future payloads with a trained dictionary."""
+        with self.lock:
+            self.dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(data)
+            self.agent_dictionaries[agent_id] = dictionary_id
+
+    def _dictionary(self, dictionary_id: int) -> Any:
+        with self.lock:
+            dictionary = self.dictionaries.get(dictionary_id)
+        if dictionary is None:
+            data = self.dictionary_loader(dictionary_id) if self.dictionary_loader else None
+            if data is None:
+                raise ValueError(f"Unknown compression dictionary {dictionary_id}")
+            dictionary = zstandard.ZstdCompressionDict(data)
+            with self.lock:
+                self.dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def _coder(self, kind: str, dictionary_id: int) -> Any:
+        coders = self._local.__dict__.setdefault(kind, {})
+        coder = coders.get(dictionary_id)
+        if coder is None:
+            dictionary = self._dictionary(dictionary_id) if dictionary_id else None
+            if kind == "compressor":
+                coder = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+            else:
+                coder = zstandard.ZstdDecompressor(dict_data=dictionary)
+            coders[dictionary_id] = coder
+        return coder
+
+    def encode(self, value: Any, agent_id: Optional[str] = None) -> Optional[bytes]:
+        if value is None:
+            return None
+        body = self.serialize(value)
+        if self.compress and len(body) >= self.min_compress_size:
+            dictionary_id = self.agent_dictionaries.get(agent_id, 0)
+            frame = self._coder("compressor", dictionary_id).compress(body)
+            if len(frame) + 4 < len(body):
+                return bytes([self.format | self.FORMAT_ZSTD]) + dictionary_id.to_bytes(4, "little") + frame
+        return bytes([self.format]) + body
+
+    def decode(self, data: Any) -> Any:
+        if data is None:
+            return None
+        if isinstance(data, str):
+            # Rows written before the codec existed are plain JSON text
+            return json.loads(data)
+        data = memoryview(data)
+        payload_format = data[0]
+        body = data[1:]
+        if payload_format & self.FORMAT_ZSTD:
+            dictionary_id = int.from_bytes(body[:4], "little")
+            body = self._coder("decompressor", dictionary_id).decompress(body[4:])
+        kind = payload_format & ~self.FORMAT_ZSTD
+        if kind == self.FORMAT_MSGPACK:
+            if msgpack is None:
+                raise ImportError("msgpack is required to read msgpack memory payloads")
+            return msgpack.unpackb(body, raw=False)
+        if kind == self.FORMAT_JSON:
+            return json.loads(bytes(body))
+        raise ValueError(f"Unknown memory payload format {payload_format}")
+
+def _decode_row(row: tuple, codec: MemoryCodec, embeddings: Optional['EmbeddingFile'] = None) -> MemoryRecord:
+    """Build a record from (id, timestamp, category, content, importance, context, embedding_row)."""
+    return MemoryRecord(
+        timestamp=datetime.fromisoformat(row[1]),
+        category=row[2],
+        content=codec.decode(row[3]),
+        importance=row[4],
+        context=codec.decode(row[5]) if row[5] else None,
+        embedding=embeddings.view()[row[6]] if embeddings is not None and row[6] is not None else None,
+        id=row[0]
+    )
+
+def _search_text(*values: Any) -> str:
+    """Flatten content and context into the text indexed for full-text search."""
+    parts: List[str] = []
+    stack = list(values)
+    while stack:
+        value = stack.pop()
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            for key, item in value.items():
+                parts.append(str(key))
+                stack.append(item)
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        else:
+            parts.append(str(value))
+    return " ".join(parts)
+
+def _rank(record: MemoryRecord) -> tuple:
+    return (record.importance, record.timestamp, record.id)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class EmbeddingFile:
+    """Append-only, memory-mapped matrix of normalized memory embeddings.
+
+    Row ``n`` of the file is referenced by ``memories.embedding_row``. Readers
+    get a read-only ``np.memmap`` view, so scans run straight over the mapped
+    pages and every process opening the same file shares them through the OS
+    page cache. Appends only happen inside a SQLite write transaction, which
+    serializes them across processes.
+    """
+
+    MAGIC = b"AXEMB\x01"
+    HEADER_SIZE = 64
+    DTYPES = {"f4": np.float32, "f2": np.float16}
+
+    def __init__(self, path: str, dtype: Any = np.float32):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._dim: Optional[int] = None
+        self._view: Optional[np.memmap] = None
+        if os.path.exists(self.path):
+            self._read_header()
+
+    def _read_header(self):
+        with open(self.path, "rb") as f:
+            header = f.read(self.HEADER_SIZE)
+        if not header.startswith(self.MAGIC):
+            raise ValueError(f"{self.path} is not an embedding file")
+        code = header[len(self.MAGIC):len(self.MAGIC) + 2].decode()
+        self.dtype = np.dtype(self.DTYPES[code])
+        self._dim = int(np.frombuffer(header, dtype=np.uint32, count=1, offset=8)[0])
+
+    def _write_header(self, dim: int):
+        code = next(c for c, t in self.DTYPES.items() if np.dtype(t) == self.dtype)
+        header = self.MAGIC + code.encode() + np.uint32(dim).tobytes()
+        with open(self.path, "wb") as f:
+            f.write(header.ljust(self.HEADER_SIZE, b"\0"))
+        self._dim = dim
+
+    @property
+    def dim(self) -> Optional[int]:
+        if self._dim is None and os.path.exists(self.path):
+            # Another process may have created the file since we opened it
+            self._read_header()
+        return self._dim
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    @property
+    def rows(self) -> int:
+        if self.dim is None:
+            return 0
+        return (os.path.getsize(self.path) - self.HEADER_SIZE) // self.row_bytes
+
+    def append(self, vectors: np.ndarray) -> np.ndarray:
+        """Append vectors and return the row numbers they were written to."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self._write_header(vectors.shape[1])
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, store has {self.dim}")
+        with open(self.path, "r+b") as f:
+            start = self.rows
+            # A torn append from a crashed writer is overwritten in place
+            f.seek(self.HEADER_SIZE + start * self.row_bytes)
+            f.write(_normalize(vectors).astype(self.dtype).tobytes())
+            f.truncate()
+        return np.arange(start, start + len(vectors))
+
+    def view(self) -> np.ndarray:
+        """Return a read-only (rows, dim) view, remapping only when the file grew."""
+        rows = self.rows
+        if self._view is None or len(self._view) != rows:
+            if rows == 0:
+                self._view = np.empty((0, self.dim or 0), dtype=self.dtype)
+            else:
+                self._view = np.memmap(self.path, dtype=self.dtype, mode="r",
+                                       offset=self.HEADER_SIZE, shape=(rows, self.dim))
+        return self._view
+
+class EmbeddingIndex:
+    """In-process cosine-similarity index over an EmbeddingFile.
+
+    The index only holds small filter columns (memory id, agent, category,
+    importance, timestamp) in RAM, addressed by embedding file row; vectors are
+    read from the memory-mapped file. Small indexes are scanned with a single
+    matrix-vector product over the mapping. Once ``ivf_threshold`` vectors are
+    loaded the index trains k-means centroids and only scores the ``nprobe``
+    partitions closest to the query. The index follows SQLite through a row id
+    watermark, so ``MemoryStore.sync_embeddings`` only reads rows added since
+    the previous sync.
+    """
+
+    def __init__(self, embedding_file: EmbeddingFile, ivf_threshold: int = 50000, nprobe: int = 8):
+        self.embedding_file = embedding_file
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.lock = threading.RLock()
+        self.size = 0
+        self.count = 0
+        self.watermark = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.agents = np.empty(0, dtype=np.int32)
+        self.categories = np.empty(0, dtype=np.int32)
+        self.importance = np.empty(0, dtype=np.float32)
+        self.timestamps = np.empty(0, dtype=np.float64)
+        self.alive = np.empty(0, dtype=bool)
+        self.partitions = np.empty(0, dtype=np.int32)
+        self.positions: Dict[int, int] = {}
+        self.codes: Dict[str, int] = {}
+        self.centroids: Optional[np.ndarray] = None
+        self.loaded_segments: Set[int] = set()
+        self._trained_size = 0
+
+    def _code(self, value: str) -> int:
+        return self.codes.setdefault(value, len(self.codes))
+
+    def _grow(self, needed: int):
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        for name in ("ids", "agents", "categories", "importance", "timestamps", "alive", "partitions"):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def add(self, rows: List[tuple], advance_watermark: bool = True):
+        """Add rows of (id, agent_id, category, importance, timestamp, embedding_row).
+
+        Rows loaded from cold segments pass ``advance_watermark=False`` since
+        their ids say nothing about which SQLite rows have been synced.
+        """
+        with self.lock:
+            if advance_watermark and rows:
+                self.watermark = max(self.watermark, rows[-1][0])
+            rows = [row for row in rows if row[0] not in self.positions]
+            if not rows:
+                return
+            positions = np.array([row[5] for row in rows], dtype=np.int64)
+            self._grow(int(positions.max()) + 1)
+            self.ids[positions] = [row[0] for row in rows]
+            self.agents[positions] = [self._code(row[1]) for row in rows]
+            self.categories[positions] = [self._code(row[2]) for row in rows]
+            self.importance[positions] = [row[3] for row in rows]
+            self.timestamps[positions] = [datetime.fromisoformat(row[4]).timestamp() for row in rows]
+            self.alive[positions] = True
+            for row in rows:
+                self.positions[row[0]] = row[5]
+            self.size = max(self.size, int(positions.max()) + 1)
+            self.count += len(rows)
+
+            if self.centroids is not None:
+                vectors = self.embedding_file.view()[positions].astype(np.float32)
+                self.partitions[positions] = np.argmax(vectors @ self.centroids.T, axis=1)
+            if self.count >= self.ivf_threshold and self.count >= 2 * self._trained_size:
+                self._train()
+
+    def remove(self, ids: List[int]):
+        with self.lock:
+            for memory_id in ids:
+                position = self.positions.pop(memory_id, None)
+                if position is not None:
+                    self.alive[position] = False
+                    self.count -= 1
+
+    def _train(self, iterations: int = 8):
+        # Spherical k-means on a sample, then assign every vector to a partition
+        vectors = self.embedding_file.view()
+        live = np.flatnonzero(self.alive[:self.size])
+        partitions = max(1, int(np.sqrt(len(live))))
+        rng = np.random.default_rng(0)
+        sample = np.asarray(vectors[np.sort(rng.choice(live, size=min(len(live), partitions * 20), replace=False))],
+                            dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=partitions, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+        self.centroids = centroids
+        for start in range(0, self.size, 65536):
+            end = min(start + 65536, self.size)
+            chunk = np.asarray(vectors[start:end], dtype=np.float32)
+            self.partitions[start:end] = np.argmax(chunk @ centroids.T, axis=1)
+        self._trained_size = self.count
+
+    def _scan(self, query: np.ndarray) -> np.ndarray:
+        vectors = self.embedding_file.view()[:self.size]
+        if vectors.dtype == np.float32:
+            return vectors @ query
+        # Half precision has no BLAS path; score it in bounded chunks instead
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), 65536):
+            scores[start:start + 65536] = vectors[start:start + 65536].astype(np.float32) @ query
+        return scores
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int,
+        agent_id: Optional[str] = None,
+        categories: Optional[List[str]] = None,
+        min_importance: Optional[float] = None,
+        since: Optional[datetime] = None
+    ) -> List[tuple]:
+        """Return up to k (memory id, cosine similarity) pairs, best first."""
+        with self.lock:
+            if self.count == 0:
+                return []
+            query = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+            dim = self.embedding_file.dim
+            if query.shape[0] != dim:
+                raise ValueError(f"Embedding has {query.shape[0]} dimensions, store has {dim}")
+
+            mask = self.alive[:self.size].copy()
+            if agent_id is not None:
+                if agent_id not in self.codes:
+                    return []
+                mask &= self.agents[:self.size] == self.codes[agent_id]
+            if categories is not None:
+                codes = [self.codes[c] for c in categories if c in self.codes]
+                mask &= np.isin(self.categories[:self.size], codes)
+            if min_importance is not None:
+                mask &= self.importance[:self.size] >= min_importance
+            if since is not None:
+                mask &= self.timestamps[:self.size] >= since.timestamp()
+
+            candidates = None
+            if self.centroids is not None:
+                probes = np.argsort(self.centroids @ query)[-self.nprobe:]
+                candidates = np.flatnonzero(mask & np.isin(self.partitions[:self.size], probes))
+            if candidates is not None and len(candidates) >= k:
+                scores = np.asarray(self.embedding_file.view()[candidates], dtype=np.float32) @ query
+            else:
+                # Full scan over the mapping, also used when the probed partitions are too sparse
+                candidates = np.flatnonzero(mask)
+                scores = self._scan(query)[candidates]
+            if len(candidates) == 0:
+                return []
+
+            top = min(k, len(scores))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best])]
+            return [(int(self.ids[candidates[i]]), float(scores[i])) for i in best]
+
+class ColdSegment:
+    """Immutable, compressed file of archived memories with a columnar index.
+
+    Layout: magic, zlib-compressed JSON blocks of ``block_size`` rows, a
+    compressed footer holding the block offsets plus one index entry per
+    record (id, agent, category, importance, timestamp, embedding row, block),
+    and an 8-byte footer offset. Only the footer is loaded when the segment is
+    opened; blocks are decompressed on demand and kept in a small LRU. The
+    file never changes after it is written; deleted records are masked out
+    through ``live``.
+    """
+
+    MAGIC = b"AXSEG\x01"
+
+    def __init__(self, path: str, cached_blocks: int = 8):
+        self.path = path
+        self.cached_blocks = cached_blocks
+        self._blocks: "OrderedDict[int, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        with open(path, "rb") as f:
+            if f.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f"{path} is not a memory segment")
+            f.seek(-8, os.SEEK_END)
+            end = f.tell()
+            footer_offset = int.from_bytes(f.read(8), "little")
+            f.seek(footer_offset)
+            footer = json.loads(zlib.decompress(f.read(end - footer_offset)))
+        self.block_offsets = footer["blocks"]
+        self.agent_names = footer["agent_names"]
+        self.category_names = footer["category_names"]
+        self.ids = np.array(footer["ids"], dtype=np.int64)
+        self.agents = np.array(footer["agents"], dtype=np.int32)
+        self.categories = np.array(footer["categories"], dtype=np.int32)
+        self.importance = np.array(footer["importance"], dtype=np.float64)
+        self.timestamps = np.array(footer["timestamps"], dtype=np.float64)
+        self.embedding_rows = np.array(footer["embedding_rows"], dtype=np.int64)
+        self.block_of = np.array(footer["block"], dtype=np.int32)
+        self.block_starts = np.searchsorted(self.block_of, np.arange(len(self.block_offsets))).tolist()
+        self.live = np.ones(len(self.ids), dtype=bool)
+
+    @classmethod
+    def write(cls, path: str, rows: List[tuple], block_size: int = 256) -> 'ColdSegment':
+        """Write (id, agent_id, timestamp, category, content, importance, context,
+        embedding_row) rows, sorted by id, atomically to ``path``."""
+        rows = sorted(rows, key=lambda row: row[0])
+        agent_names = sorted({row[1] for row in rows})
+        category_names = sorted({row[3] for row in rows})
+        agent_codes = {name: i for i, name in enumerate(agent_names)}
+        category_codes = {name: i for i, name in enumerate(category_names)}
+        tmp_path = f"{path}.tmp"
+        blocks = []
+        with open(tmp_path, "wb") as f:
+            f.write(cls.MAGIC)
+            for start in range(0, len(rows), block_size):
+                data = zlib.compress(json.dumps(rows[start:start + block_size]).encode())
+                blocks.append([f.tell(), len(data)])
+                f.write(data)
+            footer = {
+                "blocks": blocks,
+                "agent_names": agent_names,
+                "category_names": category_names,
+                "ids": [row[0] for row in rows],
+                "agents": [agent_codes[row[1]] for row in rows],
+                "categories": [category_codes[row[3]] for row in rows],
+                "importance": [row[5] for row in rows],
+                "timestamps": [datetime.fromisoformat(row[2]).timestamp() for row in rows],
+                "embedding_rows": [-1 if row[7] is None else row[7] for row in rows],
+                "block": [i // block_size for i in range(len(rows))]
+            }
+            footer_offset = f.tell()
+            f.write(zlib.compress(json.dumps(footer).encode()))
+            f.write(footer_offset.to_bytes(8, "little"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def select(
+        self,
+        agent_id: Optional[str] = None,
+        category: Optional[str] = None,
+        since: Optional[datetime] = None
+    ) -> np.ndarray:
+        """Return positions of live records matching the filters."""
+        mask = self.live.copy()
+        if agent_id is not None:
+            if agent_id not in self.agent_names:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.agents == self.agent_names.index(agent_id)
+        if category is not None:
+            if category not in self.category_names:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.categories == self.category_names.index(category)
+        if since is not None:
+            mask &= self.timestamps >= since.timestamp()
+        return np.flatnonzero(mask)
+
+    def positions_of(self, ids: np.ndarray, include_deleted: bool = False) -> np.ndarray:
+        """Return the position of each id, or -1 where the segment lacks it."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.searchsorted(self.ids, ids)
+        positions[positions >= len(self.ids)] = 0
+        found = self.ids[positions] == ids
+        if not include_deleted:
+            found &= self.live[positions]
+        return np.where(found, positions, -1)
+
+    def mark_deleted(self, ids: Iterable[int]):
+        positions = self.positions_of(np.fromiter(ids, dtype=np.int64), include_deleted=True)
+        self.live[positions[positions >= 0]] = False
+
+    def live_agents(self) -> Set[str]:
+        return {self.agent_names[code] for code in np.unique(self.agents[self.live])}
+
+    def after(self, positions: np.ndarray, rank: Tuple[float, float, int]) -> np.ndarray:
+        """Keep the positions ranked strictly below ``rank`` in (importance, timestamp, id) order."""
+        importance, timestamp, memory_id = rank
+        imp, ts, ids = self.importance[positions], self.timestamps[positions], self.ids[positions]
+        below = (imp < importance) | ((imp == importance) & (
+            (ts < timestamp) | ((ts == timestamp) & (ids < memory_id))
+        ))
+        return positions[below]
+
+    def top(self, positions: np.ndarray, k: int) -> np.ndarray:
+        """Return the ``k`` best-ranked of ``positions``, best first, in O(len(positions))."""
+        if len(positions) > k:
+            # Everything tied with the k-th importance survives the cut, so
+            # the exact order is settled by the sort below
+            imp = self.importance[positions]
+            cutoff = np.partition(imp, len(imp) - k)[len(imp) - k]
+            positions = positions[imp >= cutoff]
+        order = np.lexsort((-self.ids[positions], -self.timestamps[positions], -self.importance[positions]))
+        return positions[order[:k]]
+
+    def row(self, position: int) -> list:
+        block = int(self.block_of[position])
+        with self._lock:
+            rows = self._blocks.get(block)
+            if rows is None:
+                offset, length = self.block_offsets[block]
+                with open(self.path, "rb") as f:
+                    f.seek(offset)
+                    rows = json.loads(zlib.decompress(f.read(length)))
+                self._blocks[block] = rows
+                if len(self._blocks) > self.cached_blocks:
+                    self._blocks.popitem(last=False)
+            else:
+                self._blocks.move_to_end(block)
+        return rows[int(position) - self.block_starts[block]]
+
+    def index_rows(self) -> List[tuple]:
+        """Embedding index rows of (id, agent_id, category, importance, timestamp, embedding_row)."""
+        return [
+            (
+                int(self.ids[i]),
+                self.agent_names[self.agents[i]],
+                self.category_names[self.categories[i]],
+                float(self.importance[i]),
+                datetime.fromtimestamp(self.timestamps[i]).isoformat(),
+                int(self.embedding_rows[i])
+            )
+            for i in np.flatnonzero((self.embedding_rows >= 0) & self.live)
+        ]
+
+def _cold_record(row: list, embeddings: Optional['EmbeddingFile'] = None) -> MemoryRecord:
+    return MemoryRecord(
+        timestamp=datetime.fromisoformat(row[2]),
+        category=row[3],
+        content=row[4],
+        importance=row[5],
+        context=row[6],
+        embedding=embeddings.view()[row[7]] if embeddings is not None and row[7] is not None else None,
+        id=row[0]
+    )
+
+class ColdTier:
+    """Registry of the cold segments of a MemoryStore.
+
+    Segments are listed in the ``memory_segments`` table and deleted records
+    in ``memory_tombstones``, so every process sharing the database sees the
+    same set. Only the footers of the ``max_open_segments`` most recently used
+    segments are held in memory; the rest are reopened on demand.
+    """
+
+    def __init__(self, store: 'MemoryStore', max_open_segments: int = 16):
+        self.store = store
+        self.directory = f"{store.db_path}.segments"
+        self.max_open_segments = max_open_segments
+        # Segment id -> (file name, min id, max id) for every registered segment
+        self.registry: Dict[int, Tuple[str, int, int]] = {}
+        self.open_segments: "OrderedDict[int, ColdSegment]" = OrderedDict()
+        self.lock = threading.RLock()
+        # Segments opened later read their tombstones when they are opened
+        self.tombstone_seq = self.store.reader().execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM memory_tombstones"
+        ).fetchone()[0]
+
+    def refresh(self):
+        """Pick up segments and tombstones written since the last call."""
+        with self.lock:
+            reader = self.store.reader()
+            self.registry = {
+                segment_id: (path, min_id, max_id)
+                for segment_id, path, min_id, max_id in reader.execute(
+                    "SELECT id, path, min_id, max_id FROM memory_segments ORDER BY id"
+                )
+            }
+            for segment_id in [i for i in self.open_segments if i not in self.registry]:
+                del self.open_segments[segment_id]
+            rows = reader.execute(
+                "SELECT seq, id FROM memory_tombstones WHERE seq > ? ORDER BY seq", (self.tombstone_seq,)
+            ).fetchall()
+            if rows:
+                self.mark_deleted([memory_id for _, memory_id in rows])
+                self.tombstone_seq = rows[-1][0]
+
+    def segment_ids(self) -> List[int]:
+        self.refresh()
+        with self.lock:
+            return list(self.registry)
+
+    def segment(self, segment_id: int) -> Optional[ColdSegment]:
+        """Return the open segment, loading its footer and tombstones if needed."""
+        with self.lock:
+            segment = self.open_segments.get(segment_id)
+            if segment is not None:
+                self.open_segments.move_to_end(segment_id)
+                return segment
+            entry = self.registry.get(segment_id)
+            if entry is None:
+                return None
+            path, min_id, max_id = entry
+            segment = ColdSegment(os.path.join(self.directory, path))
+            segment.mark_deleted(row[0] for row in self.store.reader().execute(
+                "SELECT id FROM memory_tombstones WHERE id BETWEEN ? AND ?", (min_id, max_id)
+            ))
+            self.open_segments[segment_id] = segment
+            if len(self.open_segments) > self.max_open_segments:
+                self.open_segments.popitem(last=False)
+            return segment
+
+    def mark_deleted(self, ids: List[int]):
+        with self.lock:
+            for segment in self.open_segments.values():
+                segment.mark_deleted(ids)
+
+    def _holding(self, wanted: np.ndarray) -> Iterator[ColdSegment]:
+        # Segments whose id range overlaps the sorted ids in ``wanted``
+        for segment_id, (_, min_id, max_id) in list(self.registry.items()):
+            if np.searchsorted(wanted, min_id) < np.searchsorted(wanted, max_id, side="right"):
+                segment = self.segment(segment_id)
+                if segment is not None:
+                    yield segment
+
+    def ranked(
+        self,
+        agent_id: str,
+        category: Optional[str] = None,
+        since: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        batch_size: int = 1000
+    ) -> Iterator[list]:
+        """Yield matching rows in (importance, timestamp, id) descending order.
+
+        Rows are produced a batch at a time: each batch takes the best
+        remaining candidates of every segment below the last rank yielded, so
+        memory stays bounded by ``batch_size`` and the open segments however
+        deep the walk goes.
+        """
+        segment_ids = self.segment_ids()
+        rank = None
+        yielded = 0
+        while limit is None or yielded < limit:
+            want = batch_size if limit is None else min(batch_size, limit - yielded)
+            candidates = []
+            for segment_id in segment_ids:
+                segment = self.segment(segment_id)
+                if segment is None:
+                    continue
+                positions = segment.select(agent_id, category, since)
+                if rank is not None and len(positions):
+                    positions = segment.after(positions, rank)
+                for position in segment.top(positions, want):
+                    candidates.append((
+                        float(segment.importance[position]),
+                        float(segment.timestamps[position]),
+                        int(segment.ids[position]),
+                        segment_id,
+                        int(position)
+                    ))
+            if not candidates:
+                return
+            candidates.sort(key=lambda candidate: candidate[:3], reverse=True)
+            batch = []
+            for candidate in candidates:
+                # A record archived twice has the same rank in both segments
+                if batch and candidate[2] == batch[-1][2]:
+                    continue
+                batch.append(candidate)
+                if len(batch) == want:
+                    break
+            for _, _, _, segment_id, position in batch:
+                segment = self.segment(segment_id)
+                if segment is not None:
+                    yield segment.row(position)
+            yielded += len(batch)
+            rank = batch[-1][:3]
+
+    def lookup(self, ids: List[int]) -> Dict[int, list]:
+        self.refresh()
+        found: Dict[int, list] = {}
+        wanted = np.unique(np.asarray(ids, dtype=np.int64))
+        for segment in self._holding(wanted):
+            if not len(wanted):
+                break
+            positions = segment.positions_of(wanted)
+            for memory_id, position in zip(wanted[positions >= 0], positions[positions >= 0]):
+                found[int(memory_id)] = segment.row(position)
+            wanted = wanted[positions < 0]
+        return found
+
+    def contains(self, ids: List[int]) -> Set[int]:
+        self.refresh()
+        present: Set[int] = set()
+        wanted = np.unique(np.asarray(ids, dtype=np.int64))
+        for segment in self._holding(wanted):
+            present.update(int(i) for i in wanted[segment.positions_of(wanted) >= 0])
+        return present
+
+@dataclass
+class RetentionPolicy:
+    """Decay model and thresholds for ``MemoryStore.apply_retention``.
+
+    A memory's score is its importance halved every ``half_life_days`` since
+    it was written or last read, plus ``access_weight * log1p(access_count)``.
+    Memories scoring below ``delete_below`` are deleted and those below
+    ``archive_below`` move to the cold tier. Memories younger than
+    ``min_age_days`` are never touched.
+    """
+    half_life_days: float = 30.0
+    access_weight: float = 0.05
+    delete_below: float = 0.02
+    archive_below: float = 0.1
+    min_age_days: float = 1.0
+
+def decay_importance(
+    importance: np.ndarray,
+    timestamps: np.ndarray,
+    access_counts: np.ndarray,
+    last_accessed: np.ndarray,
+    now: np.datetime64,
+    policy: RetentionPolicy
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (decayed score, age in days) for columns of memories.
+
+    ``last_accessed`` may hold NaT for memories that were never read.
+    """
+    day = np.timedelta64(86400 * 10 ** 6, "us")
+    touched = np.where(np.isnat(last_accessed), timestamps, np.maximum(timestamps, last_accessed))
+    idle_days = (now - touched) / day
+    scores = importance * np.exp2(-np.maximum(idle_days, 0) / policy.half_life_days)
+    scores += policy.access_weight * np.log1p(access_counts)
+    return scores, (now - timestamps) / day
+
+class MemoryWriteBuffer:
+    """Write-behind buffer that batches memory rows into single transactions.
+
+    Appends never touch the database. A background thread flushes whenever
+    ``batch_size`` rows are pending or ``flush_interval`` seconds have passed,
+    and ``flush()`` forces pending rows to disk at durability points. Rows are
+    validated when they are appended, and a batch whose insert fails (say,
+    because another process holds the database) stays queued for the next
+    flush.
+    """
+
+    def __init__(self, store: 'MemoryStore', batch_size: int = 256, flush_interval: float = 1.0):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self._pending: List[tuple] = []
+        self._accesses: Dict[int, int] = {}
+        # Dimension of queued embeddings while the embedding file has none
+        self._dim: Optional[int] = None
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        with self.lock:
+            return len(self._pending)
+
+    def append(self, row: tuple):
+        self.extend([row])
+
+    def record_access(self, ids: Iterable[int]):
+        """Count reads of persisted memories; counts are written on the next flush."""
+        with self.lock:
+            for memory_id in ids:
+                self._accesses[memory_id] = self._accesses.get(memory_id, 0) + 1
+
+    def _check(self, rows: List[tuple]):
+        dim = self.store.embedding_file.dim or self._dim
+        for row in rows:
+            if len(row) not in (7, 8):
+                raise ValueError(f"Memory row has {len(row)} fields, expected 7 or 8")
+            if row[6] is None:
+                continue
+            shape = np.shape(row[6])
+            if len(shape) != 1 or (dim is not None and shape[0] != dim):
+                raise ValueError(f"Embedding has shape {shape}, store expects ({dim},)")
+            dim = shape[0]
+        self._dim = dim
+
+    def extend(self, rows: List[tuple]):
+        with self.lock:
+            self._check(rows)
+            self._pending.extend(rows)
+            due = len(self._pending) >= self.batch_size
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, daemon=True)
+                self._flusher.start()
+        if due:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        # Holding the store's write lock across the swap keeps flushes ordered,
+        # so a returning flush() guarantees every earlier append is committed
+        with self.store.write_lock:
+            with self.lock:
+                pending, self._pending = self._pending, []
+                accesses, self._accesses = self._accesses, {}
+            try:
+                if accesses:
+                    self.store.update_access_stats(accesses)
+                    accesses = {}
+                if pending:
+                    self.store.insert_rows(pending)
+            except Exception:
+                # Requeue ahead of anything appended meanwhile so order holds
+                with self.lock:
+                    self._pending[:0] = pending
+                    for memory_id, count in accesses.items():
+                        self._accesses[memory_id] = self._accesses.get(memory_id, 0) + count
+                raise
+            return len(pending)
+
+    async def flush_async(self) -> int:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.flush)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Failed to flush buffered memories")
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
 class MemoryStore:
-    def __init__(self, db_path: str = "agent_memory.db"):
+    """SQLite-backed memory store with one shared writer and per-thread readers.
+
+    Connections live for the lifetime of the store so statements stay compiled
+    in each connection's statement cache. The database runs in WAL mode, which
+    lets readers proceed while the writer commits.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "agent_memory.db",
+        cache_size_kb: int = 65536,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        embedding_dtype: Any = np.float32,
+        codec: Optional[MemoryCodec] = None
+    ):
         self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self.writer = self._connect()
+        # Bumped by every delete so agents can drop cached results
+        self.deletions = 0
+        self.embedding_file = EmbeddingFile(f"{db_path}.embeddings", embedding_dtype)
+        self.codec = codec or MemoryCodec()
+        self.codec.dictionary_loader = self._load_dictionary
         self._initialize_db()
-        
+        self._load_agent_dictionaries()
+        self._migrate_embeddings()
+        self.write_buffer = MemoryWriteBuffer(self, batch_size, flush_interval)
+        self.embedding_index = EmbeddingIndex(self.embedding_file)
+        self.cold_tier = ColdTier(self)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+        # Must precede the WAL switch, which initializes a new file; existing
+        # databases keep their mode. Retention reclaims pages incrementally
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{self.cache_size_kb}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
     def _initialize_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.write() as conn:
             conn.execute("""
             CREATE TABLE IF NOT EXISTS memories (
                 id INTEGER PRIMARY KEY,
@@ -35,130 +996,1005 @@ class MemoryStore:
             """)
             conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_time ON memories(agent_id, timestamp)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_importance ON memories(importance)")
+            # Keyset pagination walks these in (importance, timestamp, id) order
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_rank ON memories(agent_id, importance, timestamp, id)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_agent_category_rank "
+                "ON memories(agent_id, category, importance, timestamp, id)"
+            )
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_segments (
+                id INTEGER PRIMARY KEY,
+                path TEXT,
+                rows INTEGER,
+                min_id INTEGER,
+                max_id INTEGER,
+                created_at DATETIME
+            )
+            """)
+            # Deleted memories that may still sit in a cold segment
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_tombstones (
+                seq INTEGER PRIMARY KEY,
+                id INTEGER
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tombstone_id ON memory_tombstones(id)")
+            # Highest memory id ever handed out, so deletes never free an id
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+            """)
+            conn.execute("INSERT OR IGNORE INTO memory_counters (name, value) VALUES ('memory_id', 0)")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory_dictionaries (
+                id INTEGER PRIMARY KEY,
+                agent_id TEXT,
+                data BLOB,
+                created_at DATETIME
+            )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(memories)")}
+            if "embedding_row" not in columns:
+                conn.execute("ALTER TABLE memories ADD COLUMN embedding_row INTEGER")
+            if "access_count" not in columns:
+                conn.execute("ALTER TABLE memories ADD COLUMN access_count INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE memories ADD COLUMN last_accessed DATETIME")
+
+            # Payloads are binary, so the search index is fed by the writer
+            # rather than by triggers; archived rows keep their entries
+            self.fts_enabled = True
+            backfill = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'memories_fts'"
+            ).fetchone() is None
+            try:
+                conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+                    text, agent_id UNINDEXED, category UNINDEXED, importance UNINDEXED
+                )
+                """)
+            except sqlite3.OperationalError:
+                logging.warning("SQLite was built without FTS5; memory search is disabled")
+                self.fts_enabled = False
+                backfill = False
+        if backfill:
+            self._backfill_search_index()
+
+    def _backfill_search_index(self, chunk_size: int = 10000):
+        last_id = 0
+        while True:
+            rows = self.reader().execute("""
+            SELECT id, agent_id, category, content, importance, context FROM memories
+            WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            with self.write() as conn:
+                conn.executemany(INSERT_SEARCH_SQL, [
+                    (row[0], _search_text(self.codec.decode(row[3]), self.codec.decode(row[5])),
+                     row[1], row[2], row[4])
+                    for row in rows
+                ])
+            last_id = rows[-1][0]
+
+    def _load_dictionary(self, dictionary_id: int) -> Optional[bytes]:
+        row = self.reader().execute("SELECT data FROM memory_dictionaries WHERE id = ?", (dictionary_id,)).fetchone()
+        return row[0] if row else None
+
+    def _load_agent_dictionaries(self):
+        if zstandard is None:
+            return
+        rows = self.reader().execute("""
+        SELECT agent_id, id, data FROM memory_dictionaries
+        WHERE id IN (SELECT MAX(id) FROM memory_dictionaries GROUP BY agent_id)
+        """).fetchall()
+        for agent_id, dictionary_id, data in rows:
+            self.codec.use_dictionary(agent_id, dictionary_id, data)
+
+    def train_dictionary(self, agent_id: str, dict_size: int = 16384, sample_limit: int = 5000) -> Optional[int]:
+        """Train a zstd dictionary on an agent's recent payloads and use it for new writes.
+
+        Returns the dictionary id, or None when zstandard is unavailable or the
+        agent has too little data to train on. Existing rows keep whichever
+        dictionary they were written with.
+        """
+        if zstandard is None or not self.codec.compress:
+            return None
+        self.write_buffer.flush()
+        rows = self.reader().execute("""
+        SELECT content, context FROM memories WHERE agent_id = ?
+        ORDER BY id DESC LIMIT ?
+        """, (agent_id, sample_limit)).fetchall()
+        samples = [self.codec.serialize(self.codec.decode(value)) for row in rows for value in row if value]
+        try:
+            data = zstandard.train_dictionary(dict_size, samples).as_bytes()
+        except zstandard.ZstdError:
+            return None
+        with self.write() as conn:
+            dictionary_id = conn.execute(
+                "INSERT INTO memory_dictionaries (agent_id, data, created_at) VALUES (?, ?, ?)",
+                (agent_id, data, datetime.now().isoformat())
+            ).lastrowid
+        self.codec.use_dictionary(agent_id, dictionary_id, data)
+        return dictionary_id
+
+    def search(
+        self,
+        query: str,
+        agent_id: Optional[str] = None,
+        limit: int = 10,
+        category: Optional[str] = None,
+        importance_weight: float = 0.0
+    ) -> List[Tuple[int, str, float]]:
+        """Return (memory id, agent id, score) triples matching an FTS5 query, best first.
+
+        The score is the BM25 relevance (higher is better) plus
+        ``importance_weight`` times the memory's importance. Without
+        ``agent_id`` every agent's memories are searched.
+        """
+        if not self.fts_enabled:
+            raise RuntimeError("Memory search requires SQLite with FTS5")
+        self.write_buffer.flush()
+        filters = "memories_fts MATCH ?"
+        params: List[Any] = [query]
+        if agent_id is not None:
+            filters += " AND agent_id = ?"
+            params.append(agent_id)
+        if category is not None:
+            filters += " AND category = ?"
+            params.append(category)
+        cursor = self.reader().execute(f"""
+        SELECT rowid, agent_id, -bm25(memories_fts) + ? * importance AS score
+        FROM memories_fts WHERE {filters}
+        ORDER BY score DESC LIMIT ?
+        """, [importance_weight] + params + [limit])
+        return cursor.fetchall()
+
+    def store_for(self, agent_id: str) -> 'MemoryStore':
+        """Return the store holding ``agent_id``; a single store holds every agent."""
+        return self
+
+    def agent_ids(self) -> Set[str]:
+        """Return every agent with memories in SQLite or the cold tier."""
+        self.write_buffer.flush()
+        agents = {row[0] for row in self.reader().execute("SELECT DISTINCT agent_id FROM memories")}
+        for segment_id in self.cold_tier.segment_ids():
+            segment = self.cold_tier.segment(segment_id)
+            if segment is not None:
+                agents.update(segment.live_agents())
+        return agents
+
+    def decode_row(self, row: tuple) -> MemoryRecord:
+        return _decode_row(row, self.codec, self.embedding_file)
+
+    def _migrate_embeddings(self, chunk_size: int = 10000):
+        # Move embeddings stored as per-row BLOBs into the embedding file
+        while True:
+            with self.write() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                rows = conn.execute("""
+                SELECT id, embedding FROM memories
+                WHERE embedding IS NOT NULL AND embedding_row IS NULL
+                LIMIT ?
+                """, (chunk_size,)).fetchall()
+                if rows:
+                    vectors = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                    positions = self.embedding_file.append(vectors)
+                    conn.executemany(
+                        "UPDATE memories SET embedding_row = ?, embedding = NULL WHERE id = ?",
+                        [(int(position), row[0]) for position, row in zip(positions, rows)]
+                    )
+            if len(rows) < chunk_size:
+                return
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Run a single transaction on the shared writer connection."""
+        with self.write_lock, self.writer:
+            yield self.writer
+
+    def reader(self) -> sqlite3.Connection:
+        """Return the calling thread's read connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def _max_id(self, conn: sqlite3.Connection) -> int:
+        # The counter survives deletes; live and archived ids cover rows
+        # written before it existed
+        return conn.execute("""
+        SELECT MAX((SELECT value FROM memory_counters WHERE name = 'memory_id'),
+                   COALESCE((SELECT MAX(id) FROM memories), 0),
+                   COALESCE((SELECT MAX(max_id) FROM memory_segments), 0))
+        """).fetchone()[0]
+
+    def max_id(self) -> int:
+        return self._max_id(self.reader())
+
+    def insert_rows(self, rows: List[tuple]) -> List[int]:
+        """Insert (agent_id, timestamp, category, content, importance, context, embedding,
+        search_text) rows in one transaction and return their ids.
+
+        Ids are assigned explicitly under ``BEGIN IMMEDIATE`` so embedding file
+        rows can be linked to their memories before the rows are committed.
+        They come from a counter that deletes never lower, so an id is never
+        handed out twice.
+        """
+        with self.write() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            first_id = self._max_id(conn) + 1
+            embedding_rows: List[Optional[int]] = [None] * len(rows)
+            embedded = [i for i, row in enumerate(rows) if row[6] is not None]
+            if embedded:
+                positions = self.embedding_file.append(np.stack([rows[i][6] for i in embedded]))
+                for i, position in zip(embedded, positions):
+                    embedding_rows[i] = int(position)
+            conn.executemany(INSERT_MEMORY_SQL, [
+                (first_id + i,) + tuple(row[:6]) + (embedding_rows[i],)
+                for i, row in enumerate(rows)
+            ])
+            conn.execute(
+                "UPDATE memory_counters SET value = ? WHERE name = 'memory_id'", (first_id + len(rows) - 1,)
+            )
+            if self.fts_enabled:
+                conn.executemany(INSERT_SEARCH_SQL, [
+                    (first_id + i, row[7], row[0], row[2], row[4])
+                    for i, row in enumerate(rows) if len(row) > 7 and row[7]
+                ])
+        return list(range(first_id, first_id + len(rows)))
+
+    def sync_embeddings(self, chunk_size: int = 10000) -> EmbeddingIndex:
+        """Load embeddings written since the last sync into the in-process index."""
+        index = self.embedding_index
+        with index.lock:
+            for segment_id in self.cold_tier.segment_ids():
+                if segment_id not in index.loaded_segments:
+                    segment = self.cold_tier.segment(segment_id)
+                    if segment is not None:
+                        index.add(segment.index_rows(), advance_watermark=False)
+                    index.loaded_segments.add(segment_id)
+            while True:
+                rows = self.reader().execute(SELECT_NEW_EMBEDDINGS_SQL, (index.watermark, chunk_size)).fetchall()
+                index.add(rows)
+                if len(rows) < chunk_size:
+                    return index
+
+    def fetch_memories(self, ids: List[int], promote: bool = True) -> Dict[int, MemoryRecord]:
+        """Fetch records by id from any tier, promoting cold hits back into SQLite."""
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        cursor = self.reader().execute(f"""
+        SELECT id, timestamp, category, content, importance, context, embedding_row
+        FROM memories WHERE id IN ({placeholders})
+        """, ids)
+        records = {row[0]: self.decode_row(row) for row in cursor.fetchall()}
+        missing = [memory_id for memory_id in ids if memory_id not in records]
+        if missing:
+            cold_rows = self.cold_tier.lookup(missing)
+            if promote:
+                self.promote(list(cold_rows.values()))
+            for memory_id, row in cold_rows.items():
+                records[memory_id] = _cold_record(row, self.embedding_file)
+        return records
+
+    def promote(self, rows: List[list]):
+        """Copy cold rows back into SQLite under their original ids."""
+        if not rows:
+            return
+        with self.write() as conn:
+            conn.executemany(INSERT_MEMORY_SQL.replace("INSERT", "INSERT OR IGNORE", 1), [
+                (row[0], row[1], row[2], row[3], self.codec.encode(row[4], row[1]), row[5],
+                 self.codec.encode(row[6], row[1]) if row[6] else None, row[7])
+                for row in rows
+            ])
+
+    def archive(
+        self,
+        older_than: datetime,
+        max_importance: float,
+        agent_id: Optional[str] = None,
+        segment_size: int = 100000
+    ) -> int:
+        """Move old, low-importance memories out of SQLite into cold segments.
+
+        Returns the number of rows removed from SQLite. Rows that were
+        promoted from a segment earlier are dropped without being rewritten.
+        """
+        self.write_buffer.flush()
+        filters = "timestamp < ? AND importance < ?"
+        params: List[Any] = [older_than.isoformat(), max_importance]
+        if agent_id is not None:
+            filters += " AND agent_id = ?"
+            params.append(agent_id)
+        archived = 0
+        while True:
+            with self.write_lock:
+                rows = self.writer.execute(f"""
+                SELECT {ARCHIVE_COLUMNS} FROM memories WHERE {filters} ORDER BY id LIMIT ?
+                """, params + [segment_size]).fetchall()
+                self._archive_rows(rows)
+            archived += len(rows)
+            if len(rows) < segment_size:
+                break
+        self.cold_tier.refresh()
+        return archived
+
+    def archive_ids(self, ids: List[int], segment_size: int = 100000) -> int:
+        """Move the given memories into cold segments and return how many moved."""
+        archived = 0
+        for start in range(0, len(ids), segment_size):
+            chunk = ids[start:start + segment_size]
+            with self.write_lock:
+                rows = []
+                for offset in range(0, len(chunk), 900):
+                    batch = chunk[offset:offset + 900]
+                    rows.extend(self.writer.execute(f"""
+                    SELECT {ARCHIVE_COLUMNS} FROM memories WHERE id IN ({",".join("?" * len(batch))})
+                    """, batch).fetchall())
+                self._archive_rows(sorted(rows))
+            archived += len(rows)
+        self.cold_tier.refresh()
+        return archived
+
+    def _archive_rows(self, rows: List[tuple]):
+        # Caller holds the write lock; the segment is registered and the rows
+        # deleted in one transaction
+        if not rows:
+            return
+        os.makedirs(self.cold_tier.directory, exist_ok=True)
+        already_cold = self.cold_tier.contains([row[0] for row in rows])
+        fresh = [
+            (row[0], row[1], row[2], row[3], self.codec.decode(row[4]), row[5],
+             self.codec.decode(row[6]) if row[6] else None, row[7])
+            for row in rows if row[0] not in already_cold
+        ]
+        with self.write() as conn:
+            if fresh:
+                name = f"segment-{uuid.uuid4().hex}.seg"
+                ColdSegment.write(os.path.join(self.cold_tier.directory, name), fresh)
+                conn.execute("""
+                INSERT INTO memory_segments (path, rows, min_id, max_id, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """, (name, len(fresh), fresh[0][0], fresh[-1][0], datetime.now().isoformat()))
+            conn.executemany("DELETE FROM memories WHERE id = ?", [(row[0],) for row in rows])
+
+    def apply_retention(
+        self,
+        policy: Optional['RetentionPolicy'] = None,
+        now: Optional[datetime] = None,
+        chunk_size: int = 100000,
+        batch_size: int = 20000,
+        vacuum_pages: int = 1000
+    ) -> Dict[str, int]:
+        """Decay every warm memory's importance and delete or archive the faded ones.
+
+        Rows are scored in column chunks read from a reader connection, so the
+        scan never holds the write lock. Deletes and archives then run in
+        ``batch_size`` transactions and freed pages are returned to the file
+        system ``vacuum_pages`` at a time, letting other writers interleave.
+        """
+        policy = policy or RetentionPolicy()
+        now = np.datetime64(now or datetime.now(), "us")
+        self.write_buffer.flush()
+        stats = {"scanned": 0, "deleted": 0, "archived": 0, "vacuumed_pages": 0}
+        last_id = 0
+        while True:
+            rows = self.reader().execute("""
+            SELECT id, importance, timestamp, access_count, last_accessed FROM memories
+            WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            ids, importance, timestamps, access_counts, last_accessed = zip(*rows)
+            ids = np.array(ids, dtype=np.int64)
+            scores, age_days = decay_importance(
+                np.array(importance, dtype=np.float64),
+                np.array(timestamps, dtype="datetime64[us]"),
+                np.array(access_counts, dtype=np.float64),
+                np.array(last_accessed, dtype="datetime64[us]"),
+                now,
+                policy
+            )
+            eligible = age_days >= policy.min_age_days
+            doomed = ids[eligible & (scores < policy.delete_below)].tolist()
+            demoted = ids[eligible & (scores >= policy.delete_below) & (scores < policy.archive_below)].tolist()
+            for start in range(0, len(doomed), batch_size):
+                self.delete_memories(doomed[start:start + batch_size])
+            if demoted:
+                stats["archived"] += self.archive_ids(demoted, segment_size=batch_size)
+            stats["scanned"] += len(rows)
+            stats["deleted"] += len(doomed)
+            if len(rows) < chunk_size:
+                break
+        if stats["deleted"] or stats["archived"]:
+            stats["vacuumed_pages"] = self.incremental_vacuum(vacuum_pages)
+        return stats
+
+    def incremental_vacuum(self, step_pages: int = 1000) -> int:
+        """Release free pages in short transactions; returns the pages released.
+
+        Databases created before auto_vacuum was enabled need one full VACUUM
+        before this has any effect.
+        """
+        if self.reader().execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        released = 0
+        while True:
+            with self.write_lock:
+                free = self.writer.execute("PRAGMA freelist_count").fetchone()[0]
+                if not free:
+                    return released
+                # executescript steps the pragma to completion; execute() frees one page
+                self.writer.executescript(f"PRAGMA incremental_vacuum({step_pages});")
+                released += free - self.writer.execute("PRAGMA freelist_count").fetchone()[0]
+
+    def drop_agent(self, agent_id: str) -> int:
+        """Delete every memory of ``agent_id`` from SQLite and the cold tier.
+
+        Cold segments holding the agent are rewritten without its rows, so no
+        other process may have them open. Returns the number of memories
+        removed.
+        """
+        self.write_buffer.flush()
+        with self.write_lock:
+            ids = [row[0] for row in self.writer.execute("SELECT id FROM memories WHERE agent_id = ?", (agent_id,))]
+            replaced = []
+            for segment_id in self.cold_tier.segment_ids():
+                segment = self.cold_tier.segment(segment_id)
+                if segment is None:
+                    continue
+                positions = segment.select(agent_id)
+                if not len(positions):
+                    continue
+                ids.extend(int(i) for i in segment.ids[positions])
+                # Deleted records are left out of the rewrite as well
+                kept = [segment.row(p) for p in np.setdiff1d(np.flatnonzero(segment.live), positions)]
+                name = None
+                if kept:
+                    name = f"segment-{uuid.uuid4().hex}.seg"
+                    ColdSegment.write(os.path.join(self.cold_tier.directory, name), kept)
+                replaced.append((segment_id, segment, name, kept))
+            with self.write() as conn:
+                for segment_id, _, name, kept in replaced:
+                    conn.execute("DELETE FROM memory_segments WHERE id = ?", (segment_id,))
+                    if name is not None:
+                        conn.execute("""
+                        INSERT INTO memory_segments (path, rows, min_id, max_id, created_at)
+                        VALUES (?, ?, ?, ?, ?)
+                        """, (name, len(kept), kept[0][0], kept[-1][0], datetime.now().isoformat()))
+            for _, segment, _, _ in replaced:
+                os.remove(segment.path)
+            self.delete_memories(ids)
+        self.cold_tier.refresh()
+        return len(set(ids))
+
+    def update_access_stats(self, accesses: Dict[int, int]):
+        now = datetime.now().isoformat()
+        with self.write() as conn:
+            conn.executemany(
+                "UPDATE memories SET access_count = access_count + ?, last_accessed = ? WHERE id = ?",
+                [(count, now, memory_id) for memory_id, count in accesses.items()]
+            )
+
+    def delete_memories(self, ids: List[int]):
+        """Delete memories from every tier.
+
+        Promoted memories still sit in their cold segment, so those ids get a
+        tombstone that hides them from every process reading the cold tier.
+        """
+        self.deletions += 1
+        cold = sorted(self.cold_tier.contains(ids)) if ids else []
+        with self.write() as conn:
+            conn.executemany("DELETE FROM memories WHERE id = ?", [(i,) for i in ids])
+            if self.fts_enabled:
+                conn.executemany("DELETE FROM memories_fts WHERE rowid = ?", [(i,) for i in ids])
+            conn.executemany("INSERT INTO memory_tombstones (id) VALUES (?)", [(i,) for i in cold])
+        self.cold_tier.mark_deleted(cold)
+        self.embedding_index.remove(ids)
+
+    def close(self):
+        self.write_buffer.close()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        with self.write_lock:
+            self.writer.close()
+
+class RetentionEngine:
+    """Runs ``MemoryStore.apply_retention`` on a background schedule."""
+
+    def __init__(self, store: MemoryStore, policy: Optional[RetentionPolicy] = None, interval: float = 3600.0):
+        self.store = store
+        self.policy = policy or RetentionPolicy()
+        self.interval = interval
+        self.last_result: Optional[Dict[str, int]] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict[str, int]:
+        self.last_result = self.store.apply_retention(self.policy)
+        logging.info(f"Retention pass: {self.last_result}")
+        return self.last_result
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logging.exception("Retention pass failed")
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+def _hashable(value: Any) -> Any:
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return json.dumps(value, sort_keys=True, default=str)
+
+class SpaceSavingCounter:
+    """Approximate top-k counter (Metwally's space-saving) in bounded memory.
+
+    Items outside the tracked set replace the current minimum and inherit its
+    count, so heavy hitters are always retained and counts over-estimate by at
+    most the evicted minimum.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.counts: Dict[Any, int] = {}
+
+    def add(self, item: Any):
+        if item in self.counts:
+            self.counts[item] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = 1
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            self.counts[item] = self.counts.pop(victim) + 1
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[Any, int]]:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+class StreamingQuantile:
+    """P-square estimator (Jain & Chlamtac) of a single quantile in O(1) memory."""
+
+    def __init__(self, quantile: float = 0.75):
+        self.quantile = quantile
+        self.count = 0
+        self.heights: List[float] = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * quantile, 4 * quantile, 2 + 2 * quantile, 4]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value: float):
+        self.count += 1
+        if self.count <= 5:
+            self.heights.append(value)
+            self.heights.sort()
+            return
+
+        q, n = self.heights, self.positions
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= value < q[i + 1])
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if q[i - 1] < parabolic < q[i + 1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def value(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            return float(np.percentile(self.heights, self.quantile * 100))
+        return self.heights[2]
+
+class CategoryStats:
+    """Running pattern, context and importance statistics for one category."""
+
+    def __init__(self, sketch_size: int = 64, quantile: float = 0.75):
+        self.sketch_size = sketch_size
+        self.count = 0
+        self.patterns: Dict[str, SpaceSavingCounter] = {}
+        self.contexts = SpaceSavingCounter(sketch_size)
+        self.importance = StreamingQuantile(quantile)
+
+    def observe(self, content: Dict[str, Any], importance: float, context: Optional[Dict[str, Any]]):
+        self.count += 1
+        for key, value in content.items():
+            if key not in self.patterns:
+                self.patterns[key] = SpaceSavingCounter(self.sketch_size)
+            self.patterns[key].add(_hashable(value))
+        self.importance.add(importance)
+        if context:
+            self.contexts.add(json.dumps(context, sort_keys=True))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "patterns": {key: counter.most_common(1)[0][0] for key, counter in self.patterns.items()},
+            "importance_threshold": self.importance.value(),
+            "frequent_contexts": dict(self.contexts.most_common())
+        }
+
+class RetrievalCache:
+    """Size-bounded LRU of decoded retrieval results keyed by (category, limit).
+
+    Each category carries a generation number that invalidation bumps, so a
+    result read before a concurrent write to its category is never cached.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Tuple[str, int], List[MemoryRecord]]" = OrderedDict()
+        self.generations: Dict[str, int] = {}
+        self.clears = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, int]) -> Optional[List[MemoryRecord]]:
+        with self.lock:
+            records = self.entries.get(key)
+            if records is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return records
+
+    def generation(self, category: str) -> int:
+        with self.lock:
+            return self.generations.get(category, 0) + self.clears
+
+    def put(self, key: Tuple[str, int], records: List[MemoryRecord], generation: int):
+        with self.lock:
+            if self.max_entries <= 0 or self.generations.get(key[0], 0) + self.clears != generation:
+                return
+            self.entries[key] = records
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, categories: Iterable[str]):
+        with self.lock:
+            categories = set(categories)
+            for category in categories:
+                self.generations[category] = self.generations.get(category, 0) + 1
+            for key in [key for key in self.entries if key[0] in categories]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.clears += 1
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
 
 class AgentMemory:
-    def __init__(self, agent_id: str, capacity: int = 1000):
+    def __init__(
+        self,
+        agent_id: str,
+        capacity: int = 1000,
+        store: Optional[MemoryStore] = None,
+        cache_size: int = 128
+    ):
         self.agent_id = agent_id
         self.capacity = capacity
-        self.store = MemoryStore()
-        self.short_term: List[MemoryRecord] = []
+        # Sharded stores hand back the shard that owns this agent
+        self.store = (store or MemoryStore()).store_for(agent_id)
+        self.retrieval_cache = RetrievalCache(cache_size)
+        self.category_stats: Dict[str, CategoryStats] = {}
+        self._bootstrapped: Set[str] = set()
+        self.store.write_buffer.flush()
+        self._history_watermark = self.store.max_id()
+        self._seen_deletions = self.store.deletions
+        # Min-heap of [importance, sequence, record, persisted]; the root is
+        # always the next eviction candidate
+        self._short_term: List[list] = []
+        self._sequence = itertools.count()
         self.learning_rate = 0.1
+
+    @property
+    def short_term(self) -> List[MemoryRecord]:
+        """Short-term memories, most important first."""
+        return [entry[2] for entry in sorted(self._short_term, reverse=True)]
         
-    def add_memory(self, category: str, content: Dict[str, Any], importance: float, context: Optional[Dict[str, Any]] = None):
+    def add_memory(
+        self,
+        category: str,
+        content: Dict[str, Any],
+        importance: float,
+        context: Optional[Dict[str, Any]] = None,
+        embedding: Optional[Sequence[float]] = None
+    ):
         record = MemoryRecord(
             timestamp=datetime.now(),
             category=category,
             content=content,
             importance=importance,
-            context=context
+            context=context,
+            embedding=np.asarray(embedding, dtype=np.float32) if embedding is not None else None
         )
+        dim = self.store.embedding_file.dim
+        if record.embedding is not None and dim is not None and record.embedding.shape != (dim,):
+            raise ValueError(f"Embedding has shape {record.embedding.shape}, store expects ({dim},)")
         
+        self.category_stats.setdefault(category, CategoryStats()).observe(content, importance, context)
+
+        # Queue important memories for persistence right away
+        persisted = importance > 0.7
+        if persisted:
+            self._persist_memory(record)
+
         # Add to short-term memory
-        self.short_term.append(record)
-        if len(self.short_term) > self.capacity:
+        heapq.heappush(self._short_term, [importance, next(self._sequence), record, persisted])
+        if len(self._short_term) > self.capacity:
             self._consolidate_memories()
             
-        # Persist important memories immediately
-        if importance > 0.7:
-            self._persist_memory(record)
-            
+    def flush(self) -> int:
+        return self.store.write_buffer.flush()
+
+    async def flush_async(self) -> int:
+        return await self.store.write_buffer.flush_async()
+
     def retrieve_memories(self, category: str, limit: int = 10) -> List[MemoryRecord]:
-        with sqlite3.connect(self.store.db_path) as conn:
-            cursor = conn.execute("""
-            SELECT timestamp, category, content, importance, context
-            FROM memories
-            WHERE agent_id = ? AND category = ?
-            ORDER BY importance DESC, timestamp DESC
-            LIMIT ?
-            """, (self.agent_id, category, limit))
-            
-            return [
-                MemoryRecord(
-                    timestamp=datetime.fromisoformat(row[0]),
-                    category=row[1],
-                    content=json.loads(row[2]),
-                    importance=row[3],
-                    context=json.loads(row[4]) if row[4] else None
-                )
-                for row in cursor.fetchall()
-            ]
+        # Retention and other agents' deletes bypass this agent's cache
+        if self.store.deletions != self._seen_deletions:
+            self._seen_deletions = self.store.deletions
+            self.retrieval_cache.clear()
+        key = (category, limit)
+        cached = self.retrieval_cache.get(key)
+        if cached is not None:
+            self.store.write_buffer.record_access(record.id for record in cached)
+            return list(cached)
+
+        generation = self.retrieval_cache.generation(category)
+        # Read-your-writes: buffered rows are committed before querying
+        if self.store.write_buffer.pending:
+            self.flush()
+        cursor = self.store.reader().execute(SELECT_BY_CATEGORY_SQL, (self.agent_id, category, limit))
+        records = [self.store.decode_row(row) for row in cursor.fetchall()]
+
+        # Fan out to the cold tier; records promoted earlier are already warm
+        warm_ids = {record.id for record in records}
+        cold_rows = []
+        for row in self.store.cold_tier.ranked(self.agent_id, category):
+            if len(cold_rows) >= limit:
+                break
+            if row[0] not in warm_ids:
+                cold_rows.append(row)
+        if cold_rows:
+            cold = {row[0]: row for row in cold_rows}
+            records.extend(_cold_record(row, self.store.embedding_file) for row in cold_rows)
+            records = sorted(records, key=_rank, reverse=True)[:limit]
+            self.store.promote([cold[record.id] for record in records if record.id in cold])
+
+        self.retrieval_cache.put(key, records, generation)
+        self.store.write_buffer.record_access(record.id for record in records)
+        return list(records)
+
+    def iter_memories(
+        self,
+        category: Optional[str] = None,
+        since: Optional[datetime] = None,
+        batch_size: int = 1000
+    ) -> Iterator[MemoryRecord]:
+        """Stream persisted memories in retrieve_memories order using constant memory.
+
+        SQLite pages are fetched by keyset pagination on (importance,
+        timestamp, id), so each page is an index range scan no matter how deep
+        the walk is, and are merged with the cold tier's ranked records.
+        """
+        if self.store.write_buffer.pending:
+            self.flush()
+        cold = (
+            _cold_record(row, self.store.embedding_file)
+            for row in self.store.cold_tier.ranked(self.agent_id, category, since)
+        )
+        previous = None
+        for record in heapq.merge(self._iter_warm(category, since, batch_size), cold, key=_rank, reverse=True):
+            # A promoted record sits in both tiers with an identical rank
+            if previous is not None and record.id == previous:
+                continue
+            previous = record.id
+            yield record
+
+    def _iter_warm(
+        self,
+        category: Optional[str],
+        since: Optional[datetime],
+        batch_size: int
+    ) -> Iterator[MemoryRecord]:
+        filters = "agent_id = ?"
+        params: List[Any] = [self.agent_id]
+        if category is not None:
+            filters += " AND category = ?"
+            params.append(category)
+        if since is not None:
+            filters += " AND timestamp >= ?"
+            params.append(since.isoformat())
+
+        first_page = f"""
+        SELECT id, timestamp, category, content, importance, context, embedding_row
+        FROM memories WHERE {filters}
+        ORDER BY importance DESC, timestamp DESC, id DESC
+        LIMIT ?
+        """
+        next_page = f"""
+        SELECT id, timestamp, category, content, importance, context, embedding_row
+        FROM memories WHERE {filters} AND (importance, timestamp, id) < (?, ?, ?)
+        ORDER BY importance DESC, timestamp DESC, id DESC
+        LIMIT ?
+        """
+        rows = self.store.reader().execute(first_page, params + [batch_size]).fetchall()
+        while rows:
+            for row in rows:
+                yield self.store.decode_row(row)
+            if len(rows) < batch_size:
+                return
+            last = rows[-1]
+            rows = self.store.reader().execute(
+                next_page, params + [last[4], last[1], last[0], batch_size]
+            ).fetchall()
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.retrieval_cache.stats()
+
+    def recall_similar(
+        self,
+        vector: Sequence[float],
+        k: int = 10,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[MemoryRecord, float]]:
+        """Return the k persisted memories most similar to ``vector`` with their scores.
+
+        Supported filters are ``category`` (a name or list of names),
+        ``min_importance`` and ``since`` (a datetime).
+        """
+        if self.store.write_buffer.pending:
+            self.flush()
+        filters = filters or {}
+        categories = filters.get("category")
+        if isinstance(categories, str):
+            categories = [categories]
+        index = self.store.sync_embeddings()
+        hits = index.search(
+            np.asarray(vector, dtype=np.float32),
+            k,
+            agent_id=self.agent_id,
+            categories=categories,
+            min_importance=filters.get("min_importance"),
+            since=filters.get("since")
+        )
+        records = self.store.fetch_memories([memory_id for memory_id, _ in hits])
+        stale = [memory_id for memory_id, _ in hits if memory_id not in records]
+        if stale:
+            index.remove(stale)
+        self.store.write_buffer.record_access(records)
+        return [(records[memory_id], score) for memory_id, score in hits if memory_id in records]
             
     def _consolidate_memories(self):
-        # Sort by importance
-        self.short_term.sort(key=lambda x: x.importance, reverse=True)
-        
-        # Keep important memories and persist them
-        keep_count = self.capacity // 2
-        for memory in self.short_term[:keep_count]:
-            self._persist_memory(memory)
-            
-        # Clear short-term memory
-        self.short_term = self.short_term[:keep_count]
+        # Evict the least important memories and stream them to long-term
+        # storage; records persisted on admission are not written twice
+        evicted = []
+        while len(self._short_term) > self.capacity:
+            _, _, record, persisted = heapq.heappop(self._short_term)
+            if not persisted:
+                evicted.append(record)
+        if evicted:
+            self.retrieval_cache.invalidate(record.category for record in evicted)
+            self.store.write_buffer.extend([self._to_row(record) for record in evicted])
         
     def _persist_memory(self, record: MemoryRecord):
-        with sqlite3.connect(self.store.db_path) as conn:
-            conn.execute("""
-            INSERT INTO memories (agent_id, timestamp, category, content, importance, context)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                self.agent_id,
-                record.timestamp.isoformat(),
-                record.category,
-                json.dumps(record.content),
-                record.importance,
-                json.dumps(record.context) if record.context else None
-            ))
+        self.retrieval_cache.invalidate([record.category])
+        self.store.write_buffer.append(self._to_row(record))
+
+    def _to_row(self, record: MemoryRecord) -> tuple:
+        return (
+            self.agent_id,
+            record.timestamp.isoformat(),
+            record.category,
+            self.store.codec.encode(record.content, self.agent_id),
+            record.importance,
+            self.store.codec.encode(record.context, self.agent_id) if record.context else None,
+            record.embedding,
+            _search_text(record.content, record.context)
+        )
             
     def learn_from_experience(self, category: str) -> Dict[str, Any]:
-        memories = self.retrieve_memories(category, limit=100)
-        
-        if not memories:
+        if category not in self._bootstrapped:
+            self._bootstrap_stats(category)
+        stats = self.category_stats.get(category)
+        if stats is None or stats.count == 0:
             return {}
-            
-        # Analyze patterns and extract learnings
-        learnings = {
-            "patterns": self._extract_patterns(memories),
-            "importance_threshold": self._calculate_importance_threshold(memories),
-            "frequent_contexts": self._analyze_contexts(memories)
-        }
-        
-        return learnings
-        
-    def _extract_patterns(self, memories: List[MemoryRecord]) -> Dict[str, Any]:
-        patterns = {}
-        for memory in memories:
-            # Extract common patterns from memory content
-            for key, value in memory.content.items():
-                if key not in patterns:
-                    patterns[key] = []
-                patterns[key].append(value)
-                
-        # Analyze frequency of patterns
-        return {
-            key: max(set(values), key=values.count)
-            for key, values in patterns.items()
-        }
-        
-    def _calculate_importance_threshold(self, memories: List[MemoryRecord]) -> float:
-        importances = [m.importance for m in memories]
-        return np.percentile(importances, 75)
-        
-    def _analyze_contexts(self, memories: List[MemoryRecord]) -> Dict[str, int]:
-        contexts = {}
-        for memory in memories:
-            if memory.context:
-                context_key = json.dumps(memory.context, sort_keys=True)
-                contexts[context_key] = contexts.get(context_key, 0) + 1
-        return contexts
+        return stats.summary()
+
+    def _bootstrap_stats(self, category: str):
+        # Fold in history persisted before this instance started, across all
+        # tiers; anything newer was already observed by add_memory
+        stats = self.category_stats.setdefault(category, CategoryStats())
+        for record in self.iter_memories(category):
+            if record.id <= self._history_watermark:
+                stats.observe(record.content, record.importance, record.context)
+        self._bootstrapped.add(category)
         
+    def archive_old_memories(self, days_threshold: int = 90, importance_threshold: float = 0.5) -> int:
+        """Move this agent's old, low-importance memories to the cold tier."""
+        threshold_date = datetime.now() - timedelta(days=days_threshold)
+        return self.store.archive(threshold_date, importance_threshold, agent_id=self.agent_id)
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        category: Optional[str] = None,
+        importance_weight: float = 0.0
+    ) -> List[Tuple[MemoryRecord, float]]:
+        """Keyword search over memory content and context, ranked by BM25.
+
+        ``query`` uses FTS5 syntax. A positive ``importance_weight`` blends the
+        memory's importance into the ranking. Archived memories are searchable
+        and are promoted back to SQLite when returned.
+        """
+        hits = self.store.search(query, self.agent_id, limit, category, importance_weight)
+        records = self.store.fetch_memories([memory_id for memory_id, _, _ in hits])
+        self.store.write_buffer.record_access(records)
+        return [(records[memory_id], score) for memory_id, _, score in hits if memory_id in records]
+
+    def train_compression_dictionary(self) -> Optional[int]:
+        return self.store.train_dictionary(self.agent_id)
+
     def cleanup_old_memories(self, days_threshold: int = 30):
-        threshold_date = datetime.now().replace(days=-days_threshold)
+        threshold_date = datetime.now() - timedelta(days=days_threshold)
         
-        with sqlite3.connect(self.store.db_path) as conn:
-            conn.execute("""
-            DELETE FROM memories 
-            WHERE agent_id = ? 
-            AND timestamp < ? 
-            AND importance < 0.8
-            """, (self.agent_id, threshold_date.isoformat()))
+        self.flush()
+        cursor = self.store.reader().execute("""
+        SELECT id, category FROM memories 
+        WHERE agent_id = ? 
+        AND timestamp < ? 
+        AND importance < 0.8
+        """, (self.agent_id, threshold_date.isoformat()))
+        rows = cursor.fetchall()
+        self.store.delete_memories([row[0] for row in rows])
+        self.retrieval_cache.invalidate({row[1] for row in rows})
 
@@ -1,12 +1,27 @@
-from typing import Dict, List, Callable, Any, Optional
+from typing import Dict, Iterable, Iterator, List, Callable, Any, Optional, Tuple
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
 from enum import Enum
+import ctypes
+import ctypes.util
 import json
 import asyncio
+import logging
+import os
+import sqlite3
+import struct
 import threading
+import time
 from datetime import datetime
 import uuid
 from dataclasses import dataclass, asdict
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 class AgentState(Enum):
     INITIALIZING = "initializing"
     IDLE = "idle"
@@ -31,9 +46,345 @@ class Event:
     data: Dict[str, Any]
     target_id: Optional[str] = None
 
+def _event_to_dict(sequence: int, event: Event) -> Dict[str, Any]:
+    return {
+        "seq": sequence,
+        "event_type": event.event_type.value,
+        "source_id": event.source_id,
+        "timestamp": event.timestamp,
+        "data": event.data,
+        "target_id": event.target_id
+    }
+
+def _event_from_dict(record: Dict[str, Any]) -> Event:
+    return Event(
+        event_type=EventType(record["event_type"]),
+        source_id=record["source_id"],
+        timestamp=record["timestamp"],
+        data=record["data"],
+        target_id=record["target_id"]
+    )
+
+class EventLog:
+    """Append-only event log split into size-bounded segments.
+
+    Each segment ``events-<first seq>.log`` holds one JSON event per line and
+    has a sparse ``.idx`` companion. Every ``index_interval`` events the index
+    records (largest timestamp before this point, byte offset), and a sealed
+    segment ends with an entry for its end of file. Since the timestamps are
+    running maxima, ``read(since)`` can seek past every event older than
+    ``since`` even when publishers' clocks disagree.
+
+    A log directory belongs to one process at a time: opening it takes an
+    exclusive lock on ``LOCK`` inside it, and a second opener gets a
+    RuntimeError instead of interleaving its own sequence numbers.
+    """
+
+    INDEX_ENTRY = struct.Struct("<dQ")
+
+    def __init__(self, directory: str = "event_log", segment_bytes: int = 64 * 2 ** 20, index_interval: int = 256):
+        self.directory = os.path.abspath(directory)
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        # Appends run on the event loop, sync and compact on a checkpointer thread
+        self._io_lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, "LOCK"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f"Event log {self.directory} is in use by another process")
+        self.segments: List[int] = sorted(
+            int(name[len("events-"):-len(".log")])
+            for name in os.listdir(directory)
+            if name.startswith("events-") and name.endswith(".log")
+        )
+        self.next_sequence = 1
+        self._file = None
+        self._index_file = None
+        if self.segments:
+            self._resume(self.segments[-1])
+
+    def _path(self, first_sequence: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"events-{first_sequence:012d}{suffix}")
+
+    def _resume(self, first_sequence: int):
+        # Reopen the newest segment, dropping a torn final line
+        path = self._path(first_sequence, ".log")
+        valid_bytes = 0
+        self._count = 0
+        self._max_timestamp = float("-inf")
+        self.next_sequence = first_sequence
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+                self._count += 1
+                self._max_timestamp = max(self._max_timestamp, record["timestamp"])
+                self.next_sequence = record["seq"] + 1
+        with open(path, "r+b") as f:
+            f.truncate(valid_bytes)
+        self._file = open(path, "ab")
+        self._index_file = open(self._path(first_sequence, ".idx"), "ab")
+
+    def _roll(self):
+        if self._file is not None:
+            self._index_file.write(self.INDEX_ENTRY.pack(self._max_timestamp, self._file.tell()))
+            self._file.close()
+            self._index_file.close()
+        self.segments.append(self.next_sequence)
+        self._file = open(self._path(self.next_sequence, ".log"), "ab")
+        self._index_file = open(self._path(self.next_sequence, ".idx"), "ab")
+        self._count = 0
+        self._max_timestamp = float("-inf")
+
+    def append(self, event: Event) -> int:
+        """Append ``event`` and return its sequence number."""
+        with self._io_lock:
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._roll()
+            sequence = self.next_sequence
+            line = json.dumps(_event_to_dict(sequence, event), default=str).encode() + b"\n"
+            if self._count % self.index_interval == 0:
+                self._index_file.write(self.INDEX_ENTRY.pack(self._max_timestamp, self._file.tell()))
+            self._file.write(line)
+            self._count += 1
+            self._max_timestamp = max(self._max_timestamp, event.timestamp)
+            self.next_sequence += 1
+        return sequence
+
+    def flush(self):
+        with self._io_lock:
+            if self._file is not None:
+                self._file.flush()
+                self._index_file.flush()
+
+    def sync(self):
+        """Flush and fsync the active segment, making every appended event durable."""
+        with self._io_lock:
+            if self._file is not None:
+                self.flush()
+                os.fsync(self._file.fileno())
+                os.fsync(self._index_file.fileno())
+
+    def skip_to(self, sequence: int):
+        """Never hand out sequence numbers below ``sequence`` again."""
+        with self._io_lock:
+            self.next_sequence = max(self.next_sequence, sequence)
+
+    def _start_offset(self, first_sequence: int, since: Optional[float]) -> Optional[int]:
+        # Offset of the first line that may hold an event at or after ``since``,
+        # or None when the whole segment is older
+        if since is None:
+            return 0
+        with open(self._path(first_sequence, ".idx"), "rb") as f:
+            entries = list(self.INDEX_ENTRY.iter_unpack(f.read()))
+        sealed = first_sequence != self.segments[-1]
+        if sealed and entries and entries[-1][0] < since:
+            return None
+        maxima = [entry[0] for entry in entries]
+        position = bisect_left(maxima, since)
+        return entries[position - 1][1] if position else 0
+
+    def read(self, since: Optional[float] = None, after: int = 0) -> Iterator[Tuple[int, Event]]:
+        """Yield (sequence, event) pairs in log order.
+
+        Events timestamped before ``since`` or numbered ``after`` or lower are
+        skipped; segments lying entirely below ``after`` are not opened.
+        """
+        self.flush()
+        segments = list(self.segments)
+        for i, first_sequence in enumerate(segments):
+            if i + 1 < len(segments) and segments[i + 1] <= after + 1:
+                continue
+            try:
+                offset = self._start_offset(first_sequence, since)
+                if offset is None:
+                    continue
+                f = open(self._path(first_sequence, ".log"), "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record["seq"] > after and (since is None or record["timestamp"] >= since):
+                        yield record["seq"], _event_from_dict(record)
+
+    def compact(self, before_sequence: int) -> int:
+        """Delete sealed segments holding only events numbered below ``before_sequence``."""
+        removed = 0
+        with self._io_lock:
+            while len(self.segments) > 1 and self.segments[1] <= before_sequence:
+                first_sequence = self.segments.pop(0)
+                for suffix in (".log", ".idx"):
+                    try:
+                        os.remove(self._path(first_sequence, suffix))
+                    except FileNotFoundError:
+                        pass
+                removed += 1
+        return removed
+
+    def close(self):
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._index_file.close()
+                self._file = None
+            if not self._lock_file.closed:
+                self._lock_file.close()
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+class Subscription:
+    """A subscriber's bounded queue and the consumer task draining it.
+
+    Events are handed to the callback in publish order. When the queue is
+    full, ``BLOCK`` makes the publisher wait for space, while ``DROP_OLDEST``
+    and ``DROP_NEWEST`` discard an event and count it in ``dropped``. A
+    subscription may be restricted to events for one ``target_id`` or from
+    one ``source_id`` and further narrowed by a ``predicate``. A named
+    subscription is durable: its ``cursor`` (the sequence number of the last
+    event it handled) is saved in runtime snapshots. ``pending`` counts the
+    events handed to it that it has not finished with yet.
+    """
+
+    def __init__(
+        self,
+        event_type: EventType,
+        callback: Callable,
+        target_id: Optional[str] = None,
+        source_id: Optional[str] = None,
+        predicate: Optional[Callable[[Event], bool]] = None,
+        max_queue: int = 1000,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        name: Optional[str] = None
+    ):
+        self.event_type = event_type
+        self.callback = callback
+        self.name = name
+        self.cursor = 0
+        self.pending = 0
+        self.target_id = target_id
+        self.source_id = source_id
+        self.predicate = predicate
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.queue: Optional[asyncio.Queue] = None
+        self.consumer: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def matches(self, event: Event) -> bool:
+        return (
+            (self.target_id is None or event.target_id == self.target_id)
+            and (self.source_id is None or event.source_id == self.source_id)
+            and (self.predicate is None or self.predicate(event))
+        )
+
+    def _ensure_consumer(self):
+        # The queue and task belong to whichever loop is publishing
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self.consumer is None or self.consumer.done():
+            self.queue = asyncio.Queue(self.max_queue)
+            self.pending = 0
+            self._loop = loop
+            self.consumer = loop.create_task(self._consume())
+
+    async def put(self, event: Event, sequence: int = 0):
+        self._ensure_consumer()
+        # Counted before any await so the bus never advances the cursor past
+        # an event this subscription is still waiting to queue
+        self.pending += 1
+        item = (sequence, event, time.monotonic())
+        if self.overflow == OverflowPolicy.BLOCK:
+            await self.queue.put(item)
+            return
+        if self.queue.full():
+            self.dropped += 1
+            self.pending -= 1
+            if self.overflow == OverflowPolicy.DROP_NEWEST:
+                return
+            self.queue.get_nowait()
+            self.queue.task_done()
+        self.queue.put_nowait(item)
+
+    async def _consume(self):
+        while True:
+            sequence, event, enqueued_at = await self.queue.get()
+            self.last_lag = time.monotonic() - enqueued_at
+            self.max_lag = max(self.max_lag, self.last_lag)
+            try:
+                await self.callback(event)
+                self.delivered += 1
+            except Exception:
+                self.failed += 1
+                logging.exception(f"Subscriber {self.callback!r} failed on {event.event_type.value}")
+            finally:
+                self.cursor = max(self.cursor, sequence)
+                self.pending -= 1
+                self.queue.task_done()
+
+    async def join(self):
+        if self.queue is not None and self._loop is asyncio.get_running_loop():
+            await self.queue.join()
+
+    def close(self):
+        if self.consumer is not None:
+            self.consumer.cancel()
+            self.consumer = None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "event_type": self.event_type.value,
+            "callback": getattr(self.callback, "__qualname__", repr(self.callback)),
+            "name": self.name,
+            "cursor": self.cursor,
+            "target_id": self.target_id,
+            "source_id": self.source_id,
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue": self.max_queue,
+            "overflow": self.overflow.value,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag
+        }
+
 class EventBus:
+    """Process-wide event bus.
+
+    The last ``history_size`` events stay in memory in ``event_history``.
+    Setting ``log_directory`` before the bus is created also appends every
+    event to a segmented log there; ``replay`` then streams both back. The
+    log is off by default because nothing trims it unless a
+    RuntimeCheckpointer runs, and each process needs a directory of its own.
+    A durable cursor whose name nobody has subscribed under for
+    ``stale_cursor_after`` seconds is forgotten so it stops pinning the log.
+    """
+
     _instance = None
     _lock = threading.Lock()
+    history_size = 10000
+    log_directory: Optional[str] = None
+    segment_bytes = 64 * 2 ** 20
+    stale_cursor_after = 3600.0
 
     def __new__(cls):
         with cls._lock:
@@ -43,27 +394,489 @@ class EventBus:
             return cls._instance
 
     def _initialize(self):
-        self.subscribers: Dict[EventType, List[Callable]] = {}
-        self.event_history: List[Event] = []
-        self.event_loop = asyncio.get_event_loop()
+        # Dispatch index: untargeted subscriptions by type, targeted ones by
+        # (type, target_id) or (type, source_id); a subscription naming both
+        # ids is filed under its target
+        self.subscribers: Dict[EventType, List[Subscription]] = {}
+        self.by_target: Dict[Tuple[EventType, str], List[Subscription]] = {}
+        self.by_source: Dict[Tuple[EventType, str], List[Subscription]] = {}
+        self.event_history: deque = deque(maxlen=self.history_size)
+        self.event_log = EventLog(self.log_directory, self.segment_bytes) if self.log_directory else None
+        self.next_sequence = self.event_log.next_sequence if self.event_log else 1
+        # Cursors of durable subscriptions restored from a snapshot or left
+        # by unsubscribe, and when (wall clock) each name was last released
+        self.cursors: Dict[str, int] = {}
+        self.cursor_released: Dict[str, float] = {}
+        # Sequences still being dispatched or held back for coalescing; every
+        # sequence below the smallest has reached each subscription it matches
+        self._undecided: set = set()
+        # Coalescing: per event type, the window and the latest pending
+        # (sequence, event) per (source_id, target_id) until the window closes
+        self.coalesce_windows: Dict[EventType, float] = {}
+        self._coalesced: Dict[EventType, Dict[Tuple[str, Optional[str]], Tuple[int, Event]]] = {}
+        self._coalesce_timers: Dict[EventType, asyncio.TimerHandle] = {}
+        self._coalesce_flushes: set = set()
+        self.coalesced = 0
 
-    def subscribe(self, event_type: EventType, callback: Callable) -> None:
-        if event_type not in self.subscribers:
-            self.subscribers[event_type] = []
-        self.subscribers[event_type].append(callback)
+    def subscribe(
+        self,
+        event_type: EventType,
+        callback: Callable,
+        target_id: Optional[str] = None,
+        source_id: Optional[str] = None,
+        predicate: Optional[Callable[[Event], bool]] = None,
+        max_queue: int = 1000,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        name: Optional[str] = None
+    ) -> Subscription:
+        """Subscribe ``callback`` to ``event_type``.
 
-    async def publish(self, event: Event) -> None:
+        With ``target_id`` or ``source_id`` the subscription only sees events
+        for that agent, and publishing only visits subscriptions whose ids
+        match the event. A ``name`` makes the subscription durable; if a
+        snapshot holds a cursor for it, ``catch_up`` redelivers what it missed.
+        """
+        subscription = Subscription(
+            event_type, callback, target_id, source_id, predicate, max_queue, overflow, name
+        )
+        if name is not None:
+            subscription.cursor = self.cursors.get(name, 0)
+            self.cursor_released.pop(name, None)
+        self._slot(subscription).append(subscription)
+        return subscription
+
+    async def catch_up(self, subscription: Subscription) -> int:
+        """Redeliver logged events after the subscription's cursor.
+
+        Call this before publishing resumes. Returns the number of events
+        enqueued.
+        """
+        if self.event_log is None:
+            return 0
+        delivered = 0
+        for sequence, event in self.event_log.read(after=subscription.cursor):
+            if event.event_type == subscription.event_type and subscription.matches(event):
+                await subscription.put(event, sequence)
+                delivered += 1
+        return delivered
+
+    def cursor_positions(self) -> Dict[str, int]:
+        """Sequence each durable subscription has fully handled.
+
+        A subscription with nothing pending has also seen every event that
+        did not match it, so its cursor moves up to the dispatch watermark.
+        Released names older than ``stale_cursor_after`` are dropped.
+        """
+        watermark = min(self._undecided, default=self.next_sequence) - 1
+        expired_before = time.time() - self.stale_cursor_after
+        for name, released in list(self.cursor_released.items()):
+            if released < expired_before:
+                self.cursors.pop(name, None)
+                del self.cursor_released[name]
+        positions = dict(self.cursors)
+        for subscription in self._all_subscriptions():
+            if subscription.name is not None:
+                if subscription.pending == 0:
+                    subscription.cursor = max(subscription.cursor, watermark)
+                positions[subscription.name] = subscription.cursor
+        return positions
+
+    def _slot(self, subscription: Subscription) -> List[Subscription]:
+        if subscription.target_id is not None:
+            return self.by_target.setdefault((subscription.event_type, subscription.target_id), [])
+        if subscription.source_id is not None:
+            return self.by_source.setdefault((subscription.event_type, subscription.source_id), [])
+        return self.subscribers.setdefault(subscription.event_type, [])
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        slot = self._slot(subscription)
+        if subscription in slot:
+            slot.remove(subscription)
+        if subscription.name is not None:
+            self.cursors[subscription.name] = subscription.cursor
+            self.cursor_released[subscription.name] = time.time()
+        subscription.close()
+
+    def _candidates(self, event: Event) -> List[Subscription]:
+        candidates = list(self.subscribers.get(event.event_type, ()))
+        if event.target_id is not None:
+            candidates.extend(self.by_target.get((event.event_type, event.target_id), ()))
+        candidates.extend(self.by_source.get((event.event_type, event.source_id), ()))
+        return candidates
+
+    def _matching(self, event: Event) -> List[Subscription]:
+        return [subscription for subscription in self._candidates(event) if subscription.matches(event)]
+
+    def _all_subscriptions(self) -> List[Subscription]:
+        return [
+            subscription
+            for index in (self.subscribers, self.by_target, self.by_source)
+            for subscriptions in list(index.values())
+            for subscription in list(subscriptions)
+        ]
+
+    def set_coalescing(self, event_type: EventType, window: Optional[float]) -> None:
+        """Coalesce deliveries of ``event_type`` over ``window`` seconds.
+
+        Within a window only the latest event per ``source_id`` and
+        ``target_id`` reaches the handlers, so events for different targets
+        never replace each other; every event is still kept in the history
+        and the log. A window of None or 0 turns coalescing off again.
+        """
+        if window:
+            self.coalesce_windows[event_type] = window
+        else:
+            self.coalesce_windows.pop(event_type, None)
+
+    def skip_to(self, sequence: int) -> None:
+        """Number the next event at least ``sequence``."""
+        self.next_sequence = max(self.next_sequence, sequence)
+        if self.event_log is not None:
+            self.event_log.skip_to(sequence)
+
+    def _record(self, event: Event) -> int:
+        sequence = self.next_sequence
+        self._undecided.add(sequence)
         self.event_history.append(event)
-        if event.event_type in self.subscribers:
-            for callback in self.subscribers[event.event_type]:
-                await self.event_loop.create_task(callback(event))
+        if self.event_log is not None:
+            self.event_log.append(event)
+        self.next_sequence += 1
+        return sequence
+
+    def _coalesce(self, event: Event, sequence: int) -> None:
+        pending = self._coalesced.get(event.event_type)
+        if pending is None:
+            pending = self._coalesced[event.event_type] = {}
+            self._coalesce_timers[event.event_type] = asyncio.get_running_loop().call_later(
+                self.coalesce_windows[event.event_type], self._start_coalesced_flush, event.event_type
+            )
+        key = (event.source_id, event.target_id)
+        if key in pending:
+            self.coalesced += 1
+            self._undecided.discard(pending[key][0])
+        pending[key] = (sequence, event)
+
+    def _start_coalesced_flush(self, event_type: EventType) -> None:
+        task = asyncio.ensure_future(self._flush_coalesced(event_type))
+        self._coalesce_flushes.add(task)
+        task.add_done_callback(self._coalesce_flushes.discard)
+
+    async def _flush_coalesced(self, event_type: EventType) -> None:
+        timer = self._coalesce_timers.pop(event_type, None)
+        if timer is not None:
+            timer.cancel()
+        for sequence, event in self._coalesced.pop(event_type, {}).values():
+            for subscription in self._matching(event):
+                await subscription.put(event, sequence)
+            self._undecided.discard(sequence)
+
+    async def flush_coalesced(self) -> None:
+        """Deliver every coalesced event now instead of at the end of its window."""
+        for event_type in list(self._coalesced):
+            await self._flush_coalesced(event_type)
+        if self._coalesce_flushes:
+            await asyncio.gather(*list(self._coalesce_flushes))
+
+    async def publish(self, event: Event) -> None:
+        """Enqueue ``event`` for every subscriber without waiting for handlers.
+
+        Only a full queue with the BLOCK policy makes the publisher wait.
+        """
+        sequence = self._record(event)
+        if event.event_type in self.coalesce_windows:
+            self._coalesce(event, sequence)
+            return
+        for subscription in self._matching(event):
+            await subscription.put(event, sequence)
+        self._undecided.discard(sequence)
+
+    async def publish_many(self, events: Iterable[Event]) -> int:
+        """Publish a batch of events in order; returns the number of deliveries enqueued.
+
+        Subscription lookups are shared by events with the same type and ids,
+        and coalesced types collapse to the latest event per source and
+        target before any handler sees them.
+        """
+        candidates: Dict[Tuple[EventType, Optional[str], str], List[Subscription]] = {}
+        delivered = 0
+        for event in events:
+            sequence = self._record(event)
+            if event.event_type in self.coalesce_windows:
+                self._coalesce(event, sequence)
+                continue
+            key = (event.event_type, event.target_id, event.source_id)
+            if key not in candidates:
+                candidates[key] = self._candidates(event)
+            for subscription in candidates[key]:
+                if subscription.matches(event):
+                    await subscription.put(event, sequence)
+                    delivered += 1
+            self._undecided.discard(sequence)
+        return delivered
+
+    def replay(
+        self,
+        since: Optional[float] = None,
+        event_types: Optional[Iterable[EventType]] = None
+    ) -> Iterator[Event]:
+        """Lazily yield past events in publish order, optionally filtered.
+
+        Events still in the ring buffer are served from memory; older ones
+        are read from the log one line at a time.
+        """
+        types = set(event_types) if event_types is not None else None
+        recent = list(self.event_history)
+        first_recent = self.next_sequence - len(recent)
+
+        def wanted(event: Event) -> bool:
+            return (since is None or event.timestamp >= since) and (types is None or event.event_type in types)
+
+        if self.event_log is not None:
+            for sequence, event in self.event_log.read(since):
+                if sequence >= first_recent:
+                    break
+                if wanted(event):
+                    yield event
+        for event in recent:
+            if wanted(event):
+                yield event
+
+    async def join(self) -> None:
+        """Wait until every event published so far has been handled.
+
+        Events held back for coalescing are delivered first.
+        """
+        await self.flush_coalesced()
+        for subscription in self._all_subscriptions():
+            await subscription.join()
+
+    def metrics(self) -> List[Dict[str, Any]]:
+        return [subscription.metrics() for subscription in self._all_subscriptions()]
+
+    def close(self) -> None:
+        for timer in self._coalesce_timers.values():
+            timer.cancel()
+        self._coalesce_timers.clear()
+        self._coalesced.clear()
+        self._undecided.clear()
+        for subscription in self._all_subscriptions():
+            subscription.close()
+        if self.event_log is not None:
+            self.event_log.close()
+
+def _atomic_write(path: str, data: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+@contextmanager
+def _file_lock(path: str, exclusive: bool = True) -> Iterator[None]:
+    # Advisory lock shared by every process (and every open of the file)
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+class SharedStateStore:
+    """Agent states in a SQLite WAL database shared by any number of processes.
+
+    Each row carries a version that every write increments. ``compare_and_set``
+    only writes when the caller's expected version is still current, so
+    read-modify-write cycles racing in different processes cannot lose
+    updates. Every write is a single short statement; nothing holds a lock
+    between reading a state and writing it back.
+    """
+
+    def __init__(self, db_path: str = "agent_states.db", timeout: float = 30.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self.connection().execute("""
+        CREATE TABLE IF NOT EXISTS agent_states (
+            agent_id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            last_updated TEXT NOT NULL,
+            metadata TEXT NOT NULL,
+            version INTEGER NOT NULL
+        )
+        """)
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the calling thread's autocommit connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _row_to_state(row: tuple) -> Dict[str, Any]:
+        return {"state": row[1], "last_updated": row[2], "metadata": json.loads(row[3]), "version": row[4]}
+
+    def get_agent_state(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connection().execute(
+            "SELECT agent_id, state, last_updated, metadata, version FROM agent_states WHERE agent_id = ?",
+            (agent_id,)
+        ).fetchone()
+        return self._row_to_state(row) if row else None
+
+    def get_agent_states(self, agent_ids: Iterable[str], chunk_size: int = 500) -> Dict[str, Dict[str, Any]]:
+        """Fetch many agents' states; agents without a state are omitted."""
+        agent_ids = list(agent_ids)
+        states = {}
+        for start in range(0, len(agent_ids), chunk_size):
+            chunk = agent_ids[start:start + chunk_size]
+            rows = self.connection().execute(f"""
+            SELECT agent_id, state, last_updated, metadata, version FROM agent_states
+            WHERE agent_id IN ({",".join("?" * len(chunk))})
+            """, chunk).fetchall()
+            states.update((row[0], self._row_to_state(row)) for row in rows)
+        return states
+
+    def set_agent_state(self, agent_id: str, state: Dict[str, Any]) -> int:
+        """Write ``state`` unconditionally and return its new version."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+            INSERT INTO agent_states (agent_id, state, last_updated, metadata, version)
+            VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT(agent_id) DO UPDATE SET
+                state = excluded.state,
+                last_updated = excluded.last_updated,
+                metadata = excluded.metadata,
+                version = agent_states.version + 1
+            """, (agent_id, state["state"], state["last_updated"], json.dumps(state["metadata"])))
+            version = conn.execute("SELECT version FROM agent_states WHERE agent_id = ?", (agent_id,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+
+    def compare_and_set(self, agent_id: str, expected_version: int, state: Dict[str, Any]) -> Optional[int]:
+        """Write ``state`` only if the stored version is ``expected_version``.
+
+        Use 0 for an agent that has no state yet. Returns the new version, or
+        None when another writer got there first.
+        """
+        params = (state["state"], state["last_updated"], json.dumps(state["metadata"]))
+        if expected_version == 0:
+            cursor = self.connection().execute("""
+            INSERT OR IGNORE INTO agent_states (state, last_updated, metadata, agent_id, version)
+            VALUES (?, ?, ?, ?, 1)
+            """, params + (agent_id,))
+        else:
+            cursor = self.connection().execute("""
+            UPDATE agent_states SET state = ?, last_updated = ?, metadata = ?, version = version + 1
+            WHERE agent_id = ? AND version = ?
+            """, params + (agent_id, expected_version))
+        return expected_version + 1 if cursor.rowcount == 1 else None
+
+    def update(
+        self,
+        agent_id: str,
+        fn: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]],
+        retries: int = 100
+    ) -> Dict[str, Any]:
+        """Apply ``fn`` to the current state and retry on conflicts until it sticks."""
+        for _ in range(retries):
+            current = self.get_agent_state(agent_id)
+            state = fn(current)
+            version = self.compare_and_set(agent_id, current["version"] if current else 0, state)
+            if version is not None:
+                return dict(state, version=version)
+        raise RuntimeError(f"Gave up updating {agent_id} after {retries} conflicting writes")
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
 
 class StateManager:
-    def __init__(self):
+    """In-memory agent states persisted as a snapshot plus an append-only journal.
+
+    Updates only touch memory; a background thread appends them to
+    ``<state_file>.journal`` every ``flush_interval`` seconds or once
+    ``flush_updates`` are pending. After ``compact_every`` journal entries the
+    snapshot and journal on disk are folded into a new ``state_file`` and a
+    fresh journal is started, both by atomic rename. Appends and compactions
+    hold a lock on ``<state_file>.lock``, so any number of StateManagers, in
+    this process or others, can share the files without losing updates.
+
+    With a ``shared_store`` the states live in that SharedStateStore instead,
+    so several processes can update them safely; ``agent_states`` is then a
+    local cache and reads go to the store. Writes to the store run in the
+    default executor, so lock contention never stalls the event loop.
+
+    ``StateManager.default()`` is the process-wide manager that handlers and
+    synchronizers share when they are not given one, so a process runs one
+    flusher thread however many agents it hosts. The flusher sleeps until an
+    update is pending.
+    """
+
+    _default: Optional['StateManager'] = None
+    _default_lock = threading.Lock()
+
+    def __init__(
+        self,
+        state_file: str = "agent_states.json",
+        flush_interval: float = 0.05,
+        flush_updates: int = 256,
+        compact_every: int = 10000,
+        shared_store: Optional[SharedStateStore] = None
+    ):
+        self.shared_store = shared_store
         self.agent_states: Dict[str, Dict[str, Any]] = {}
         self.event_bus = EventBus()
         self.lock = threading.Lock()
-        self.state_file = "agent_states.json"
+        self.state_file = os.path.abspath(state_file)
+        self.journal_file = f"{self.state_file}.journal"
+        self.lock_file = f"{self.state_file}.lock"
+        self.flush_interval = flush_interval
+        self.flush_updates = flush_updates
+        self.compact_every = compact_every
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        self._journal_entries = 0
+        # Where load_states/refresh stopped reading
+        self._journal_inode: Optional[int] = None
+        self._journal_offset = 0
+        self._snapshot_signature: Optional[Tuple[int, int, int]] = None
+        # Serializes journal appends and compactions
+        self._io_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # Set once updates are pending, so an idle flusher never wakes
+        self._queued = threading.Event()
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+
+    @classmethod
+    def default(cls) -> 'StateManager':
+        """Return the shared manager for ``agent_states.json`` on the current EventBus."""
+        with cls._default_lock:
+            manager = cls._default
+            if manager is None or manager._closed or manager.event_bus is not EventBus():
+                if manager is not None and not manager._closed:
+                    manager.close()
+                manager = cls._default = cls()
+            return manager
 
     async def update_agent_state(
         self, 
@@ -71,96 +884,493 @@ class StateManager:
         state: AgentState, 
         metadata: Optional[Dict] = None
     ) -> None:
+        current_state = {
+            "state": state.value,
+            "last_updated": datetime.now().isoformat(),
+            "metadata": metadata or {}
+        }
+        if self.shared_store is not None:
+            # The write may wait out other processes' locks; keep the loop free
+            loop = asyncio.get_running_loop()
+            current_state["version"] = await loop.run_in_executor(
+                None, self.shared_store.set_agent_state, agent_id, current_state
+            )
+            with self.lock:
+                self.agent_states[agent_id] = current_state
+        else:
+            with self.lock:
+                self.agent_states[agent_id] = current_state
+                self._pending.append((agent_id, current_state))
+                self._queued.set()
+                due = len(self._pending) >= self.flush_updates
+                if self._flusher is None and not self._closed:
+                    self._flusher = threading.Thread(target=self._run, daemon=True)
+                    self._flusher.start()
+            if due:
+                self._wakeup.set()
+        await self._publish_state(agent_id, current_state)
+
+    async def compare_and_set_agent_state(
+        self,
+        agent_id: str,
+        expected_version: int,
+        state: AgentState,
+        metadata: Optional[Dict] = None
+    ) -> bool:
+        """Update the state only if its version is still ``expected_version``.
+
+        Requires a shared store. Returns False when another writer changed
+        the state first; re-read it with ``get_agent_state`` and retry.
+        """
+        if self.shared_store is None:
+            raise RuntimeError("compare_and_set_agent_state requires a shared_store")
+        current_state = {
+            "state": state.value,
+            "last_updated": datetime.now().isoformat(),
+            "metadata": metadata or {}
+        }
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(
+            None, self.shared_store.compare_and_set, agent_id, expected_version, current_state
+        )
+        if version is None:
+            return False
+        current_state["version"] = version
         with self.lock:
-            current_state = {
-                "state": state.value,
-                "last_updated": datetime.now().isoformat(),
-                "metadata": metadata or {}
-            }
             self.agent_states[agent_id] = current_state
-            
-            await self.event_bus.publish(Event(
-                event_type=EventType.STATE_CHANGE,
-                source_id=agent_id,
-                timestamp=datetime.now().timestamp(),
-                data=current_state
-            ))
-            
-            self._persist_states()
+        await self._publish_state(agent_id, current_state)
+        return True
+
+    async def _publish_state(self, agent_id: str, current_state: Dict[str, Any]) -> None:
+        # Publish outside the lock: a blocked publisher must not hold it while
+        # handlers that update state wait for it
+        await self.event_bus.publish(Event(
+            event_type=EventType.STATE_CHANGE,
+            source_id=agent_id,
+            timestamp=datetime.now().timestamp(),
+            data=current_state
+        ))
 
     def get_agent_state(self, agent_id: str) -> Optional[Dict]:
+        if self.shared_store is not None:
+            return self.shared_store.get_agent_state(agent_id)
         return self.agent_states.get(agent_id)
 
+    def get_agent_states(self, agent_ids: Iterable[str]) -> Dict[str, Dict]:
+        """Return the states of the given agents, omitting agents without one."""
+        if self.shared_store is not None:
+            return self.shared_store.get_agent_states(agent_ids)
+        with self.lock:
+            return {agent_id: self.agent_states[agent_id] for agent_id in agent_ids if agent_id in self.agent_states}
+
+    def flush(self) -> int:
+        """Append pending updates to the journal, compacting when it is long enough."""
+        with self._io_lock:
+            appended = self._append_pending()
+            if self._journal_entries >= self.compact_every:
+                self._persist_states()
+            return appended
+
+    def compact(self) -> None:
+        with self._io_lock:
+            self._append_pending()
+            self._persist_states()
+
+    def _append_pending(self) -> int:
+        # Caller holds _io_lock. Appends share the file lock with each other
+        # but not with a compaction, which would orphan them in the old journal
+        with self.lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            lines = "".join(
+                json.dumps({"agent_id": agent_id, "state": state}) + "\n"
+                for agent_id, state in pending
+            )
+            with _file_lock(self.lock_file, exclusive=False), open(self.journal_file, 'a+b') as f:
+                # Start on a fresh line after a torn append from a crashed writer
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        lines = "\n" + lines
+                f.write(lines.encode())
+            self._journal_entries += len(pending)
+        return len(pending)
+
     def _persist_states(self) -> None:
-        with open(self.state_file, 'w') as f:
-            json.dump(self.agent_states, f)
+        # Caller holds _io_lock. The snapshot is rebuilt from disk, not from
+        # agent_states, so updates journaled by other StateManagers on the same
+        # files survive the truncation; updates made since the last append are
+        # still pending for the new journal
+        with _file_lock(self.lock_file):
+            states = self._read_disk(repair=False)
+            _atomic_write(self.state_file, json.dumps(states))
+            _atomic_write(self.journal_file, "")
+            self._snapshot_signature = _file_signature(self.state_file)
+            self._journal_inode = os.stat(self.journal_file).st_ino
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._merge(states)
 
-    def load_states(self) -> None:
+    def _run(self):
+        while not self._closed:
+            # Sleep until an update arrives, then debounce for flush_interval.
+            # Cleared before flushing so an update racing the flush re-arms it
+            self._queued.wait()
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._queued.clear()
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Failed to flush agent state journal")
+
+    def _read_disk(self, repair: bool) -> Dict[str, Dict[str, Any]]:
+        # Snapshot plus every complete journal line; records where reading
+        # stopped so refresh() can continue from there
         try:
             with open(self.state_file, 'r') as f:
-                self.agent_states = json.load(f)
+                states = json.load(f)
+        except FileNotFoundError:
+            states = {}
+        self._snapshot_signature = _file_signature(self.state_file)
+        entries = 0
+        valid_bytes = 0
+        self._journal_inode = None
+        try:
+            with open(self.journal_file, 'rb') as f:
+                self._journal_inode = os.fstat(f.fileno()).st_ino
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    valid_bytes += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn append that a later writer moved past
+                        if line.strip():
+                            logging.warning(f"Skipping corrupt line in {self.journal_file}")
+                        continue
+                    states[record["agent_id"]] = record["state"]
+                    entries += 1
+            if repair and valid_bytes < os.path.getsize(self.journal_file):
+                # Cut a torn final line from an interrupted append so later
+                # appends start on a fresh line
+                with self._io_lock, _file_lock(self.lock_file), open(self.journal_file, 'r+b') as f:
+                    f.truncate(valid_bytes)
+        except FileNotFoundError:
+            pass
+        self._journal_offset = valid_bytes
+        self._journal_entries = entries
+        return states
+
+    def load_states(self) -> None:
+        """Load the snapshot and replay the journal over it."""
+        states = self._read_disk(repair=True)
+        with self.lock:
+            self.agent_states = states
+
+    def refresh(self) -> int:
+        """Apply changes other processes wrote since the last load or refresh.
+
+        Normally only the journal bytes past the last read offset are parsed;
+        a replaced snapshot or journal (compaction) triggers a full reread.
+        States are merged by ``last_updated`` so newer local updates win.
+        Returns the number of agent states that changed.
+        """
+        try:
+            stat = os.stat(self.journal_file)
         except FileNotFoundError:
-            self.agent_states = {}
+            stat = None
+        if (stat is None or stat.st_ino != self._journal_inode or stat.st_size < self._journal_offset
+                or _file_signature(self.state_file) != self._snapshot_signature):
+            return self._merge(self._read_disk(repair=False))
+        if stat.st_size == self._journal_offset:
+            return 0
+        with open(self.journal_file, 'rb') as f:
+            f.seek(self._journal_offset)
+            data = f.read(stat.st_size - self._journal_offset)
+        # A line still being appended is left for the next refresh
+        complete = data[:data.rfind(b"\n") + 1]
+        states = {}
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping corrupt line in {self.journal_file}")
+                continue
+            states[record["agent_id"]] = record["state"]
+        self._journal_offset += len(complete)
+        return self._merge(states)
+
+    def _merge(self, states: Dict[str, Dict[str, Any]]) -> int:
+        changed = 0
+        with self.lock:
+            for agent_id, state in states.items():
+                current = self.agent_states.get(agent_id)
+                if current is None or state.get("last_updated", "") > current.get("last_updated", ""):
+                    self.agent_states[agent_id] = state
+                    changed += 1
+        return changed
+
+    def close(self) -> None:
+        self._closed = True
+        self._queued.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
 
 class AgentStateHandler:
-    def __init__(self, agent_id: str):
+    def __init__(self, agent_id: str, state_manager: Optional[StateManager] = None):
         self.agent_id = agent_id
-        self.state_manager = StateManager()
+        self.state_manager = state_manager or StateManager.default()
         self.event_bus = EventBus()
         self._setup_event_handlers()
 
     def _setup_event_handlers(self) -> None:
-        self.event_bus.subscribe(EventType.TASK_ASSIGNED, self._handle_task_assigned)
-        self.event_bus.subscribe(EventType.TASK_COMPLETED, self._handle_task_completed)
-        self.event_bus.subscribe(EventType.ERROR, self._handle_error)
+        # Routed by id, so each event only wakes the handler of its agent
+        self.event_bus.subscribe(EventType.TASK_ASSIGNED, self._handle_task_assigned, target_id=self.agent_id)
+        self.event_bus.subscribe(EventType.TASK_COMPLETED, self._handle_task_completed, source_id=self.agent_id)
+        self.event_bus.subscribe(EventType.ERROR, self._handle_error, source_id=self.agent_id)
 
     async def _handle_task_assigned(self, event: Event) -> None:
-        if event.target_id == self.agent_id:
-            await self.state_manager.update_agent_state(
-                self.agent_id,
-                AgentState.BUSY,
-                {"task_id": event.data.get("task_id")}
-            )
+        await self.state_manager.update_agent_state(
+            self.agent_id,
+            AgentState.BUSY,
+            {"task_id": event.data.get("task_id")}
+        )
 
     async def _handle_task_completed(self, event: Event) -> None:
-        if event.source_id == self.agent_id:
-            await self.state_manager.update_agent_state(
-                self.agent_id,
-                AgentState.IDLE,
-                {"last_task_id": event.data.get("task_id")}
-            )
+        await self.state_manager.update_agent_state(
+            self.agent_id,
+            AgentState.IDLE,
+            {"last_task_id": event.data.get("task_id")}
+        )
 
     async def _handle_error(self, event: Event) -> None:
-        if event.source_id == self.agent_id:
-            await self.state_manager.update_agent_state(
-                self.agent_id,
-                AgentState.ERROR,
-                {"error": event.data.get("error")}
-            )
+        await self.state_manager.update_agent_state(
+            self.agent_id,
+            AgentState.ERROR,
+            {"error": event.data.get("error")}
+        )
+
+class RuntimeCheckpointer:
+    """Periodic snapshots of agent states and durable subscription cursors.
+
+    Each snapshot records the last event sequence it covers. ``recover`` loads
+    the snapshot and replays only the STATE_CHANGE events logged after it, so
+    cold start costs one snapshot read plus at most one interval of events.
+    After a snapshot, log segments older than both the snapshot and every
+    durable cursor are deleted.
+    """
+
+    def __init__(
+        self,
+        state_manager: StateManager,
+        event_bus: Optional[EventBus] = None,
+        path: str = "agent_runtime.snapshot",
+        interval: float = 300.0
+    ):
+        self.state_manager = state_manager
+        self.event_bus = event_bus or state_manager.event_bus
+        self.path = os.path.abspath(path)
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def snapshot(self) -> int:
+        """Write a snapshot and compact the event log; returns the covered sequence."""
+        # The sequence is read first, so the states are at least as new as it;
+        # replaying later events over them is harmless because merges keep the
+        # newest state. The log is made durable through that sequence before
+        # the snapshot claims it, or a restart could reuse the numbers
+        sequence = self.event_bus.next_sequence - 1
+        if self.event_bus.event_log is not None:
+            self.event_bus.event_log.sync()
+        with self.state_manager.lock:
+            states = dict(self.state_manager.agent_states)
+        cursors = self.event_bus.cursor_positions()
+        _atomic_write(self.path, json.dumps({
+            "sequence": sequence,
+            "created_at": datetime.now().isoformat(),
+            "agent_states": states,
+            "cursors": cursors,
+            "released": dict(self.event_bus.cursor_released)
+        }))
+        if self.event_bus.event_log is not None:
+            oldest_needed = min([sequence] + list(cursors.values())) + 1
+            self.event_bus.event_log.compact(oldest_needed)
+        return sequence
+
+    def recover(self) -> int:
+        """Restore states and cursors from the snapshot plus the log tail.
+
+        Returns the number of events replayed.
+        """
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = {"sequence": 0, "agent_states": {}, "cursors": {}}
+        # States loaded from the journal may be newer than the snapshot
+        self.state_manager._merge(snapshot["agent_states"])
+        self.event_bus.cursors.update(snapshot["cursors"])
+        # Names nobody subscribes under again expire a full period after now
+        # unless the snapshot already knew when they were released
+        released = snapshot.get("released", {})
+        now = time.time()
+        for name in snapshot["cursors"]:
+            self.event_bus.cursor_released.setdefault(name, released.get(name, now))
+        # A log that lost its tail must not reissue sequences the snapshot covers
+        self.event_bus.skip_to(snapshot["sequence"] + 1)
+        replayed = 0
+        if self.event_bus.event_log is not None:
+            for _, event in self.event_bus.event_log.read(after=snapshot["sequence"]):
+                if event.event_type == EventType.STATE_CHANGE:
+                    self.state_manager._merge({event.source_id: event.data})
+                    replayed += 1
+        return replayed
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.snapshot()
+            except Exception:
+                logging.exception("Runtime snapshot failed")
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+class _Inotify:
+    """Minimal inotify watch on one directory through libc (Linux only)."""
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, directory: str):
+        library = ctypes.util.find_library("c")
+        if library is None:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(library, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"cannot watch {directory}")
+
+    def read_names(self) -> set:
+        """Return the names of files changed since the last call."""
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                names.add(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+                offset += length
+
+    def close(self):
+        os.close(self.fd)
 
 class StateSynchronizer:
-    def __init__(self):
-        self.state_manager = StateManager()
+    """Keeps a StateManager in step with state files written by other processes.
+
+    Changes are detected with inotify where available and by polling the
+    files' inode, size and mtime every ``poll_interval`` seconds otherwise;
+    each change applies only the new journal entries. ``sync_interval`` is a
+    safety net that checks even when no change was signalled.
+    """
+
+    def __init__(self, state_manager: Optional[StateManager] = None, poll_interval: float = 0.05):
+        self.state_manager = state_manager or StateManager.default()
         self.event_bus = EventBus()
         self.sync_interval = 60  # seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = True
+
+    def _watched_names(self) -> set:
+        return {os.path.basename(self.state_manager.state_file), os.path.basename(self.state_manager.journal_file)}
+
+    def _signature(self) -> tuple:
+        return (
+            _file_signature(self.state_manager.state_file),
+            _file_signature(self.state_manager.journal_file)
+        )
+
+    def _open_watcher(self) -> Optional[_Inotify]:
+        if not self.use_inotify:
+            return None
+        try:
+            return _Inotify(os.path.dirname(os.path.abspath(self.state_manager.state_file)))
+        except (OSError, AttributeError):
+            logging.info("inotify unavailable; polling state files for changes")
+            return None
 
     async def start_sync(self):
+        self.state_manager.refresh()
+        watcher = self._open_watcher()
+        if watcher is None:
+            await self._poll()
+            return
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        loop.add_reader(watcher.fd, changed.set)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(changed.wait(), self.sync_interval)
+                except asyncio.TimeoutError:
+                    pass
+                changed.clear()
+                names = watcher.read_names()
+                if not names or names & self._watched_names():
+                    self.state_manager.refresh()
+        finally:
+            loop.remove_reader(watcher.fd)
+            watcher.close()
+
+    async def _poll(self):
+        last = self._signature()
         while True:
-            self.state_manager.load_states()
-            await asyncio.sleep(self.sync_interval)
+            await asyncio.sleep(self.poll_interval)
+            current = self._signature()
+            if current != last:
+                last = current
+                self.state_manager.refresh()
 
     async def force_sync(self):
-        self.state_manager.load_states()
+        self.state_manager.refresh()
 
 # Example usage
 async def main():
     # Initialize state management system
-    state_manager = StateManager()
-    synchronizer = StateSynchronizer()
+    state_manager = StateManager.default()
+    synchronizer = StateSynchronizer(state_manager)
     
     # Create agent state handlers
-    agent1_handler = AgentStateHandler("agent1")
-    agent2_handler = AgentStateHandler("agent2")
+    agent1_handler = AgentStateHandler("agent1", state_manager)
+    agent2_handler = AgentStateHandler("agent2", state_manager)
     
     # Start state synchronization
     await synchronizer.start_sync()
@@ -0,0 +1,218 @@
+"""Throughput, latency and footprint benchmark for agent_memory.
+
+For each store size the benchmark ingests that many memories into a fresh
+database in a temporary directory and then measures:
+
+- ingest rate through AgentMemory.add_memory, including the final flush
+- latency of each short-term consolidation (eviction to the write buffer)
+- retrieve_memories latency, both uncached and from the retrieval cache
+- learn_from_experience time for an instance that must fold in the history
+- database size on disk (SQLite, WAL, embedding file and cold segments)
+- process RSS
+
+With --tracemalloc the top allocation sites after ingest are reported too.
+Everything runs offline, so results can be compared between revisions.
+
+    python benchmark_agent_memory.py --sizes 10000 100000 1000000 --output memory.json
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from agent_memory import AgentMemory, MemoryStore
+from benchmark_utils import format_ms, percentile
+
+CATEGORIES = ["task", "conversation", "observation", "decision", "error"]
+OUTCOMES = ["success", "failure", "partial", "deferred"]
+
+class InstrumentedAgentMemory(AgentMemory):
+    """AgentMemory that records the duration of every consolidation."""
+
+    def __init__(self, *args, **kwargs):
+        self.consolidation_times: List[float] = []
+        super().__init__(*args, **kwargs)
+
+    def _consolidate_memories(self):
+        start = time.perf_counter()
+        super()._consolidate_memories()
+        self.consolidation_times.append(time.perf_counter() - start)
+
+def _rss_mb() -> float:
+    # Current RSS from /proc where available, otherwise the peak
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return _peak_rss_mb()
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if os.uname().sysname == "Darwin" else peak / 2 ** 10
+
+def _disk_usage_mb(directory: str) -> float:
+    total = 0
+    for root, _, files in os.walk(directory):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 2 ** 20
+
+def _make_memory(i: int, rng: random.Random, embedding_dim: int) -> Dict:
+    return {
+        "category": CATEGORIES[i % len(CATEGORIES)],
+        "content": {
+            "outcome": rng.choice(OUTCOMES),
+            "step": i,
+            "detail": f"processed request {i} for workflow {i % 97}"
+        },
+        "importance": rng.random(),
+        "context": {"session": f"session-{i % 1000}", "attempt": i % 3},
+        "embedding": [rng.random() for _ in range(embedding_dim)] if embedding_dim else None
+    }
+
+def _top_allocations(snapshot: tracemalloc.Snapshot, limit: int) -> List[Dict]:
+    stats = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>")
+    ]).statistics("lineno")
+    return [
+        {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+         "size_mb": stat.size / 2 ** 20, "count": stat.count}
+        for stat in stats[:limit]
+    ]
+
+def run_benchmark(
+    size: int,
+    capacity: int = 1000,
+    retrievals: int = 200,
+    retrieve_limit: int = 10,
+    embedding_dim: int = 0,
+    batch_size: int = 256,
+    trace: bool = False,
+    trace_limit: int = 10,
+    seed: int = 0
+) -> Dict:
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory(prefix="agent-memory-bench-") as directory:
+        if trace:
+            tracemalloc.start()
+        rss_before = _rss_mb()
+        store = MemoryStore(os.path.join(directory, "memory.db"), batch_size=batch_size)
+        memory = InstrumentedAgentMemory("bench-agent", capacity=capacity, store=store)
+
+        start = time.perf_counter()
+        for i in range(size):
+            memory.add_memory(**_make_memory(i, rng, embedding_dim))
+        memory.flush()
+        ingest_seconds = time.perf_counter() - start
+        persisted = store.reader().execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+
+        allocations = None
+        if trace:
+            allocations = _top_allocations(tracemalloc.take_snapshot(), trace_limit)
+            tracemalloc.stop()
+        rss_after_ingest = _rss_mb()
+
+        uncached = AgentMemory("bench-agent", store=store, cache_size=0)
+        uncached_times = []
+        for i in range(retrievals):
+            category = CATEGORIES[i % len(CATEGORIES)]
+            start = time.perf_counter()
+            uncached.retrieve_memories(category, retrieve_limit)
+            uncached_times.append(time.perf_counter() - start)
+        cached_times = []
+        for i in range(retrievals):
+            category = CATEGORIES[i % len(CATEGORIES)]
+            start = time.perf_counter()
+            memory.retrieve_memories(category, retrieve_limit)
+            cached_times.append(time.perf_counter() - start)
+
+        # A fresh instance has to fold in the whole persisted history
+        start = time.perf_counter()
+        AgentMemory("bench-agent", store=store).learn_from_experience(CATEGORIES[0])
+        learn_seconds = time.perf_counter() - start
+
+        store.close()
+        consolidations = memory.consolidation_times
+        return {
+            "size": size,
+            "persisted": persisted,
+            "capacity": capacity,
+            "embedding_dim": embedding_dim,
+            "ingest_seconds": ingest_seconds,
+            "ingest_rate": size / ingest_seconds,
+            "consolidations": len(consolidations),
+            "consolidation_p50": percentile(consolidations, 50),
+            "consolidation_p99": percentile(consolidations, 99),
+            "consolidation_max": max(consolidations, default=None),
+            "retrieve_p50": percentile(uncached_times, 50),
+            "retrieve_p95": percentile(uncached_times, 95),
+            "retrieve_cached_p50": percentile(cached_times, 50),
+            "retrieve_cached_p95": percentile(cached_times, 95),
+            "learn_seconds": learn_seconds,
+            "disk_mb": _disk_usage_mb(directory),
+            "rss_growth_mb": rss_after_ingest - rss_before,
+            "rss_mb": _rss_mb(),
+            "peak_rss_mb": _peak_rss_mb(),
+            "allocations": allocations
+        }
+
+def print_report(result: Dict):
+    print(f"\n=== size={result['size']} persisted={result['persisted']} capacity={result['capacity']} "
+          f"embedding_dim={result['embedding_dim']} ===")
+    print(f"ingest          {result['ingest_rate']:>12.0f} records/s ({result['ingest_seconds']:.2f}s)")
+    print(f"consolidation   p50 {format_ms(result['consolidation_p50'])}  p99 {format_ms(result['consolidation_p99'])}"
+          f"  max {format_ms(result['consolidation_max'])}  ({result['consolidations']} calls)")
+    print(f"retrieve        p50 {format_ms(result['retrieve_p50'])}  p95 {format_ms(result['retrieve_p95'])}")
+    print(f"retrieve cached p50 {format_ms(result['retrieve_cached_p50'])}  "
+          f"p95 {format_ms(result['retrieve_cached_p95'])}")
+    print(f"learn           {result['learn_seconds']:.3f}s")
+    print(f"disk            {result['disk_mb']:.1f}MB")
+    print(f"rss             {result['rss_mb']:.1f}MB (+{result['rss_growth_mb']:.1f}MB during ingest, "
+          f"peak {result['peak_rss_mb']:.1f}MB)")
+    if result["allocations"]:
+        print("top allocations after ingest:")
+        for allocation in result["allocations"]:
+            print(f"  {allocation['size_mb']:>9.2f}MB {allocation['count']:>9} blocks  {allocation['site']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                        help="records to ingest per run, e.g. 10000 up to 10000000")
+    parser.add_argument("--capacity", type=int, default=1000, help="short-term memory capacity")
+    parser.add_argument("--retrievals", type=int, default=200)
+    parser.add_argument("--retrieve-limit", type=int, default=10)
+    parser.add_argument("--embedding-dim", type=int, default=0, help="attach random embeddings of this size")
+    parser.add_argument("--batch-size", type=int, default=256, help="write buffer batch size")
+    parser.add_argument("--tracemalloc", action="store_true", help="report the top allocation sites after ingest")
+    parser.add_argument("--trace-limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        result = run_benchmark(
+            size,
+            capacity=args.capacity,
+            retrievals=args.retrievals,
+            retrieve_limit=args.retrieve_limit,
+            embedding_dim=args.embedding_dim,
+            batch_size=args.batch_size,
+            trace=args.tracemalloc,
+            trace_limit=args.trace_limit,
+            seed=args.seed
+        )
+        print_report(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Throughput and latency benchmark for the agent_state event bus.
+
+Each run builds a fresh EventBus, event log and StateManager in a temporary
+directory, registers one AgentStateHandler per agent plus any number of
+untargeted subscribers, and publishes TASK_ASSIGNED events at random agents.
+It measures:
+
+- publish rate (time until the last publish returns) and end-to-end rate
+  (time until every handler has finished)
+- publish-to-handler latency percentiles over every handler invocation
+- the cost of one StateManager._persist_states call with every agent's
+  state, i.e. what each update cost when the state file was rewritten
+  per update
+
+By default events are published as fast as possible, so latency includes
+the time handlers wait for the publisher to yield; --rate paces publishing
+to measure latency at a given load instead. Slow handlers simulate a
+handler awaiting I/O, so the report shows whether they hold back the fast
+ones. Every combination of --handlers, --subscribers and --slow-handlers is
+run; results can be saved with --output and compared between revisions.
+
+    python benchmark_agent_state.py --handlers 100 1000 --slow-handlers 0 10 --output bus.json
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+from agent_state import AgentStateHandler, Event, EventBus, EventType, StateManager
+from benchmark_utils import format_ms, percentile
+
+class TimedAgentStateHandler(AgentStateHandler):
+    """AgentStateHandler that records the latency of every task assignment."""
+
+    def __init__(self, agent_id: str, state_manager: StateManager, latencies: List[float], cost: float = 0.0):
+        self.latencies = latencies
+        self.cost = cost
+        super().__init__(agent_id, state_manager)
+
+    async def _handle_task_assigned(self, event: Event) -> None:
+        if self.cost:
+            await asyncio.sleep(self.cost)
+        await super()._handle_task_assigned(event)
+        self.latencies.append(time.perf_counter() - event.data["published_at"])
+
+def _fresh_bus(directory: str) -> EventBus:
+    EventBus._instance = None
+    EventBus.log_directory = os.path.join(directory, "event_log")
+    return EventBus()
+
+def run_benchmark(
+    handlers: int,
+    subscribers: int = 0,
+    slow_handlers: int = 0,
+    events: int = 20000,
+    handler_cost: float = 0.0,
+    slow_cost: float = 0.01,
+    batch_size: int = 0,
+    rate: float = 0.0,
+    persist_rounds: int = 5,
+    seed: int = 0
+) -> Dict:
+    rng = random.Random(seed)
+    log_directory = EventBus.log_directory
+    with tempfile.TemporaryDirectory(prefix="agent-state-bench-") as directory:
+        bus = _fresh_bus(directory)
+        manager = StateManager(os.path.join(directory, "agent_states.json"))
+        latencies: List[float] = []
+        agent_ids = [f"agent{i}" for i in range(handlers)]
+        for i, agent_id in enumerate(agent_ids):
+            cost = slow_cost if i < slow_handlers else handler_cost
+            TimedAgentStateHandler(agent_id, manager, latencies, cost)
+
+        async def observe(event: Event):
+            if handler_cost:
+                await asyncio.sleep(handler_cost)
+            latencies.append(time.perf_counter() - event.data["published_at"])
+
+        for _ in range(subscribers):
+            bus.subscribe(EventType.TASK_ASSIGNED, observe)
+
+        def make_event(i: int) -> Event:
+            return Event(
+                EventType.TASK_ASSIGNED,
+                "scheduler",
+                time.time(),
+                {"task_id": i, "published_at": time.perf_counter()},
+                rng.choice(agent_ids)
+            )
+
+        async def run():
+            start = time.perf_counter()
+            if batch_size:
+                for first in range(0, events, batch_size):
+                    await bus.publish_many(make_event(i) for i in range(first, min(first + batch_size, events)))
+            else:
+                for i in range(events):
+                    if rate:
+                        delay = start + i / rate - time.perf_counter()
+                        await asyncio.sleep(max(delay, 0))
+                    await bus.publish(make_event(i))
+            published = time.perf_counter() - start
+            await bus.join()
+            return published, time.perf_counter() - start
+
+        publish_seconds, total_seconds = asyncio.run(run())
+        manager.close()
+
+        # Persist cost with every agent's state in the snapshot
+        persist_times = []
+        for _ in range(persist_rounds):
+            start = time.perf_counter()
+            with manager._io_lock:
+                manager._persist_states()
+            persist_times.append(time.perf_counter() - start)
+
+        slow_lag = max(
+            (subscription.max_lag
+             for agent_id in agent_ids[:slow_handlers]
+             for subscription in bus.by_target.get((EventType.TASK_ASSIGNED, agent_id), ())),
+            default=0.0
+        )
+        bus.close()
+        EventBus._instance = None
+        EventBus.log_directory = log_directory
+
+        return {
+            "handlers": handlers,
+            "subscribers": subscribers,
+            "slow_handlers": slow_handlers,
+            "events": events,
+            "handler_cost": handler_cost,
+            "slow_cost": slow_cost,
+            "batch_size": batch_size,
+            "rate": rate,
+            "publish_rate": events / publish_seconds,
+            "end_to_end_rate": events / total_seconds,
+            "total_seconds": total_seconds,
+            "invocations": len(latencies),
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_p99": percentile(latencies, 99),
+            "latency_max": max(latencies, default=None),
+            "slow_queue_max_lag": slow_lag,
+            "agents_with_state": len(manager.agent_states),
+            "persist_seconds": percentile(persist_times, 50)
+        }
+
+def print_report(result: Dict):
+    print(f"\n=== handlers={result['handlers']} subscribers={result['subscribers']} "
+          f"slow_handlers={result['slow_handlers']} events={result['events']} batch={result['batch_size']} "
+          f"rate={result['rate'] or 'max'} ===")
+    print(f"publish         {result['publish_rate']:>12.0f} events/s")
+    print(f"end to end      {result['end_to_end_rate']:>12.0f} events/s ({result['total_seconds']:.2f}s, "
+          f"{result['invocations']} handler calls)")
+    print(f"latency         p50 {format_ms(result['latency_p50'])}  p95 {format_ms(result['latency_p95'])}"
+          f"  p99 {format_ms(result['latency_p99'])}  max {format_ms(result['latency_max'])}")
+    if result["slow_handlers"]:
+        print(f"slow queue lag  max {format_ms(result['slow_queue_max_lag'])}")
+    print(f"persist states  {format_ms(result['persist_seconds'])} per call for "
+          f"{result['agents_with_state']} agents (per update when rewriting on every update)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--handlers", type=int, nargs="+", default=[100, 1000],
+                        help="AgentStateHandlers per run, one per agent")
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[0, 10],
+                        help="extra untargeted TASK_ASSIGNED subscribers per run")
+    parser.add_argument("--slow-handlers", type=int, nargs="+", default=[0, 10],
+                        help="handlers that await --slow-cost per event")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--handler-cost", type=float, default=0.0, help="seconds every handler awaits per event")
+    parser.add_argument("--slow-cost", type=float, default=0.01)
+    parser.add_argument("--batch-size", type=int, default=0, help="publish with publish_many in batches of this size")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="target events/s when publishing one at a time, 0 for as fast as possible")
+    parser.add_argument("--persist-rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for handlers, subscribers, slow_handlers in itertools.product(args.handlers, args.subscribers, args.slow_handlers):
+        result = run_benchmark(
+            handlers,
+            subscribers=subscribers,
+            slow_handlers=min(slow_handlers, handlers),
+            events=args.events,
+            handler_cost=args.handler_cost,
+            slow_cost=args.slow_cost,
+            batch_size=args.batch_size,
+            rate=args.rate,
+            persist_rounds=args.persist_rounds,
+            seed=args.seed
+        )
+        print_report(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
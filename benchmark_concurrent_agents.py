@@ -0,0 +1,228 @@
+"""Load generator and throughput benchmark for ConcurrentSuperClaude.
+
+Drives open-loop (Poisson) arrivals from a set of ConcurrentAgents spread across
+all RequestPriority tiers and records per-tier throughput, queue wait and
+compute pool utilization. The compute pool is what bounds how many requests
+run at once, so sweeping compute units gives the data needed to size
+SuperClaudeResourceManager.
+
+    python benchmark_concurrent_agents.py --agents 20 --rate 40 --duration 10 \\
+        --compute-units 50 100 200 --output results.json
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+import json
+import random
+import threading
+import time
+from concurrent_agents import (
+    ConcurrentAgent,
+    ConcurrentSuperClaude,
+    Request,
+    RequestPriority,
+    ServiceAccount,
+    SuperClaudeResourceManager,
+    Workflow,
+    WorkflowStep
+)
+from benchmark_utils import format_ms, percentile
+
+@dataclass
+class TierStats:
+    submitted: int = 0
+    completed: int = 0
+    queue_waits: List[float] = field(default_factory=list)
+
+class InstrumentedResourceManager(SuperClaudeResourceManager):
+    """Resource manager that records per-tier timings and scales service time."""
+
+    def __init__(self, compute_units: int, service_scale: float):
+        self.service_scale = service_scale
+        self.stats_lock = threading.Lock()
+        self.stats: Dict[RequestPriority, TierStats] = {p: TierStats() for p in RequestPriority}
+        super().__init__(compute_units=compute_units)
+
+    def submit_request(self, priority: RequestPriority, agent_id: str, task: Dict):
+        with self.stats_lock:
+            self.stats[priority].submitted += 1
+        super().submit_request(priority, agent_id, task)
+
+    async def _process_request(self, request: Request):
+        # Queue wait covers both time in the priority queue and waiting on the pool
+        queue_wait = time.time() - request.timestamp
+        await asyncio.sleep(self.service_scale * 0.1 * request.priority.value)
+        with self.stats_lock:
+            tier = self.stats[request.priority]
+            tier.completed += 1
+            tier.queue_waits.append(queue_wait)
+
+    def outstanding(self) -> int:
+        with self.stats_lock:
+            return sum(t.submitted - t.completed for t in self.stats.values())
+
+async def _create_agents(count: int) -> List[ConcurrentAgent]:
+    tiers = list(RequestPriority)
+    agents = []
+    for i in range(count):
+        priority = tiers[i % len(tiers)]
+        account = ServiceAccount(
+            account_id=f"bench-{i}",
+            api_key="benchmark",
+            permissions={"submit_task", "submit_workflow"},
+            metadata={}
+        )
+        agent = ConcurrentAgent(f"Bench_{priority.name}_{i}", priority, account)
+        await agent.connect()
+        agents.append(agent)
+    return agents
+
+def _build_workflow(step_count: int) -> Workflow:
+    steps = [WorkflowStep(name="step_0", task={"type": "benchmark", "step": 0})]
+    for i in range(1, step_count):
+        steps.append(WorkflowStep(
+            name=f"step_{i}",
+            task={"type": "benchmark", "step": i},
+            depends_on=[f"step_{i - 1}"]
+        ))
+    return Workflow("benchmark_workflow", steps)
+
+async def _generate_load(
+    agent: ConcurrentAgent,
+    manager: SuperClaudeResourceManager,
+    rate: float,
+    duration: float,
+    workflow_fraction: float,
+    workflow_steps: int,
+    rng: random.Random
+):
+    # Open loop: arrivals are scheduled independently of completions
+    deadline = time.monotonic() + duration
+    while True:
+        await asyncio.sleep(rng.expovariate(rate))
+        if time.monotonic() >= deadline:
+            return
+        if rng.random() < workflow_fraction:
+            manager.submit_workflow(_build_workflow(workflow_steps), agent)
+        else:
+            await agent.submit_task({"type": "benchmark"})
+
+async def _sample_pool(manager: InstrumentedResourceManager, interval: float, timeline: List[Dict]):
+    start = time.monotonic()
+    pool = manager.compute_pool
+    while True:
+        with pool.lock:
+            in_use = pool.size - pool.available
+        timeline.append({
+            "t": round(time.monotonic() - start, 3),
+            "utilization": in_use / pool.size,
+            "queue_depth": manager.request_queue.qsize()
+        })
+        await asyncio.sleep(interval)
+
+async def run_benchmark(
+    agent_count: int,
+    rate: float,
+    duration: float,
+    compute_units: int,
+    workflow_fraction: float = 0.1,
+    workflow_steps: int = 3,
+    service_scale: float = 0.1,
+    drain_timeout: float = 30.0,
+    sample_interval: float = 0.25,
+    seed: int = 0
+) -> Dict:
+    super_claude = ConcurrentSuperClaude()
+    super_claude.resource_manager.shutdown()
+    manager = InstrumentedResourceManager(compute_units, service_scale)
+    super_claude.resource_manager = manager
+    super_claude.connected_agents.clear()
+
+    agents = await _create_agents(agent_count)
+    rng = random.Random(seed)
+    timeline: List[Dict] = []
+    sampler = asyncio.create_task(_sample_pool(manager, sample_interval, timeline))
+
+    start = time.monotonic()
+    await asyncio.gather(*[
+        _generate_load(
+            agent, manager, rate / agent_count, duration,
+            workflow_fraction, workflow_steps, random.Random(rng.random())
+        )
+        for agent in agents
+    ])
+    drain_deadline = time.monotonic() + drain_timeout
+    while manager.outstanding() and time.monotonic() < drain_deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - start
+
+    sampler.cancel()
+    manager.shutdown()
+
+    tiers = {}
+    for priority, stats in manager.stats.items():
+        tiers[priority.name] = {
+            "submitted": stats.submitted,
+            "completed": stats.completed,
+            "throughput": stats.completed / elapsed,
+            "queue_wait_p50": percentile(stats.queue_waits, 50),
+            "queue_wait_p95": percentile(stats.queue_waits, 95),
+            "queue_wait_p99": percentile(stats.queue_waits, 99)
+        }
+    utilization = [sample["utilization"] for sample in timeline]
+    return {
+        "compute_units": compute_units,
+        "agents": agent_count,
+        "rate": rate,
+        "elapsed": elapsed,
+        "drained": manager.outstanding() == 0,
+        "mean_utilization": sum(utilization) / len(utilization) if utilization else 0.0,
+        "tiers": tiers,
+        "timeline": timeline
+    }
+
+def print_report(result: Dict):
+    print(f"\n=== compute_units={result['compute_units']} "
+          f"rate={result['rate']}/s elapsed={result['elapsed']:.1f}s "
+          f"utilization={result['mean_utilization']:.0%} drained={result['drained']} ===")
+    print(f"{'tier':<8}{'submitted':>10}{'completed':>10}{'req/s':>9}{'p50':>11}{'p95':>11}{'p99':>11}")
+    for tier, stats in result["tiers"].items():
+        print(f"{tier:<8}{stats['submitted']:>10}{stats['completed']:>10}{stats['throughput']:>9.1f}"
+              f"{format_ms(stats['queue_wait_p50'], 1):>11}{format_ms(stats['queue_wait_p95'], 1):>11}"
+              f"{format_ms(stats['queue_wait_p99'], 1):>11}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=20.0, help="total arrivals per second")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of load generation")
+    parser.add_argument("--compute-units", type=int, nargs="+", default=[100])
+    parser.add_argument("--workflow-fraction", type=float, default=0.1)
+    parser.add_argument("--workflow-steps", type=int, default=3)
+    parser.add_argument("--service-scale", type=float, default=0.1,
+                        help="multiplier on the simulated 0.1s * priority service time")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write full results including timelines as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for compute_units in args.compute_units:
+        result = await run_benchmark(
+            args.agents, args.rate, args.duration, compute_units,
+            workflow_fraction=args.workflow_fraction,
+            workflow_steps=args.workflow_steps,
+            service_scale=args.service_scale,
+            drain_timeout=args.drain_timeout,
+            seed=args.seed
+        )
+        print_report(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,14 @@
+"""Helpers shared by the benchmark scripts."""
+from typing import List, Optional
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of ``values``, or None when there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def format_ms(value: Optional[float], digits: int = 3) -> str:
+    """Format seconds as milliseconds, or "-" for a missing value."""
+    return "-" if value is None else f"{value * 1000:.{digits}f}ms"
@@ -1,20 +1,32 @@
 from typing import Dict, List, Optional, Set
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 import json
 import logging
+import sqlite3
 from datetime import datetime
 from prometheus_client import Counter, Histogram, start_http_server
 from enum import Enum
 import threading
-from queue import PriorityQueue
+from queue import Empty, PriorityQueue
 import time
 import uuid
 from concurrent.futures import ThreadPoolExecutor
 
 # Metrics collection
 class MetricsCollector:
-    def __init__(self):
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        # Prometheus metrics can only be registered once per process
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(MetricsCollector, cls).__new__(cls)
+                cls._instance._initialize()
+            return cls._instance
+
+    def _initialize(self):
         self.task_counter = Counter('tasks_total', 'Total tasks processed', ['priority', 'status'])
         self.processing_time = Histogram('task_processing_seconds', 'Time spent processing tasks')
         start_http_server(8000)
@@ -103,317 +115,186 @@ class ResourcePool:
             self.available += count
             self.condition.notify_all()
 
-class WorkflowExecution:
-    def __init__(self, workflow: Workflow):
-        self.workflow = workflow
-        self.completed_steps: Set[str] = set()
-        self.failed_steps: Dict[str, Exception] = {}
-        self.metrics = MetricsCollector()
-        
-    async def execute(self, agent: 'ConcurrentAgent'):
-        while len(self.completed_steps) < len(self.workflow.steps):
-            ready_steps = self.workflow.get_ready_steps(self.completed_steps)
-            if not ready_steps:
-                break
-                
-            for step in ready_steps:
-                try:
-                    with self.metrics.processing_time.time():
-                        await agent.submit_task(step.task)
-                    self.completed_steps.add(step.name)
-                    self.metrics.task_counter.labels(
-                        priority=agent.priority.name,
-                        status='success'
-                    ).inc()
-                except Exception as e:
-                    self.failed_steps[step.name] = e
-                    self.metrics.task_counter.labels(
-                        priority=agent.priority.name,
-                        status='failed'
-                    ).inc()
-                    
-        return len(self.failed_steps) == 0
-
-class SuperClaudeResourceManager:
-    def __init__(self, compute_units: int = 100):
-        self.metrics = MetricsCollector()
-        self.compute_pool = ResourcePool(compute_units)
-        self.workflows: Dict[str, WorkflowExecution] = {}
-        self.request_queue = PriorityQueue()
-        self.processing = True
-        self.processing_thread = threading.Thread(target=self._process_queue)
-        self.processing_thread.daemon = True
-        self.processing_thread.start()
-    
-    def submit_workflow(self, workflow: Workflow, agent: ConcurrentAgent) -> str:
-        workflow_id = str(uuid.uuid4())
-        self.workflows[workflow_id] = WorkflowExecution(workflow)
-        asyncio.create_task(self.workflows[workflow_id].execute(agent))
-        return workflow_id
-        
-    def submit_request(self, priority: RequestPriority, agent_id: str, task: Dict):
-        request = Request(
-            priority=priority,
-            agent_id=agent_id,
-            task=task,
-            timestamp=time.time()
-        )
-        self.request_queue.put(request)
-    
-    def _process_queue(self):
-        while self.processing:
-            try:
-                request = self.request_queue.get(timeout=1)
-                # Simulate processing with appropriate resource allocation
-                required_resources = self._calculate_required_resources(request)
-                self._acquire_and_process(request, required_resources)
-            except:
-                continue
-    
-    def _calculate_required_resources(self, request: Request) -> int:
-        # Resource calculation based on priority and task complexity
-        base_resources = {
-            RequestPriority.CEO: 20,
-            RequestPriority.R1: 15,
-            RequestPriority.R2: 10,
-            RequestPriority.R3: 8,
-            RequestPriority.GROUND: 5
-        }
-        return base_resources[request.priority]
-    
-    async def _acquire_and_process(self, request: Request, required_resources: int):
-        await self.compute_pool.acquire(required_resources)
-        try:
-            # Process the request
-            await self._process_request(request)
-        finally:
-            self.compute_pool.release(required_resources)
-    
-    async def _process_request(self, request: Request):
-        # Simulate processing time based on priority
-        processing_time = 0.1 * request.priority.value
-        await asyncio.sleep(processing_time)
-
-class ConcurrentSuperClaude:
-    _instance = None
-    _lock = threading.Lock()
-    
-    def __new__(cls):
-        with cls._lock:
-            if cls._instance is None:
-                cls._instance = super(ConcurrentSuperClaude, cls).__new__(cls)
-                cls._instance._initialize()
-            return cls._instance
-    
-    def _initialize(self):
-        self.resource_manager = SuperClaudeResourceManager()
-        self.connected_agents: Dict[str, 'ConcurrentAgent'] = {}
-        self.executor = ThreadPoolExecutor(max_workers=10)
-    
-    async def process_agent_request(self, agent_id: str, priority: RequestPriority, task: Dict):
-        if agent_id not in self.connected_agents:
-            raise ValueError(f"Agent {agent_id} not registered")
-        
-        self.resource_manager.submit_request(priority, agent_id, task)
-        
-    def register_agent(self, agent: 'ConcurrentAgent') -> bool:
-        with self._lock:
-            if agent.id not in self.connected_agents:
-                self.connected_agents[agent.id] = agent
-                return True
-            return False
-
-class ConcurrentAgent:
-    def __init__(self, name: str, priority: RequestPriority, service_account: ServiceAccount):
-        self.id = str(uuid.uuid4())
-        self.name = name
-        self.priority = priority
-        self.service_account = service_account
-        self.metrics = MetricsCollector()
-        self.super_claude = ConcurrentSuperClaude()
-        self.connected = False
-    
-    async def connect(self):
-        if not self.connected:
-            self.connected = self.super_claude.register_agent(self)
-        return self.connected
-    
-    async def submit_task(self, task: Dict):
-        if not self.connected:
-            raise RuntimeError("Agent not connected to Super Claude")
-        
-        await self.super_claude.process_agent_request(
-            self.id,
-            self.priority,
-            task
-        )
-
-# Example usage
-async def main():
-    # Create agents with different priorities
-    ceo_agent = ConcurrentAgent("Lucy_01", RequestPriority.CEO)
-    r1_agent = ConcurrentAgent("Core_Agent_1", RequestPriority.R1)
-    ground_agent = ConcurrentAgent("Security_GA", RequestPriority.GROUND)
-    
-    # Connect agents
-    await asyncio.gather(
-        ceo_agent.connect(),
-        r1_agent.connect(),
-        ground_agent.connect()
-    )
-    
-    # Submit tasks concurrently
-    tasks = [
-        ceo_agent.submit_task({"type": "strategic_decision"}),
-        r1_agent.submit_task({"type": "core_processing"}),
-        ground_agent.submit_task({"type": "security_check"})
-    ]
-    
-    await asyncio.gather(*tasks)
+class WorkflowCheckpointStore:
+    """Durable record of workflow step outcomes so executions survive restarts."""
 
-if __name__ == "__main__":
-    asyncio.run(main())
+    def __init__(self, db_path: str = "workflow_checkpoints.db", batch_size: int = 64, flush_interval: float = 0.5):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self._pending: List[tuple] = []
+        self._last_flush = time.monotonic()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._initialize_db()
 
-from typing import Dict, List, Optional, Set
-import asyncio
-from dataclasses import dataclass
-import json
-import logging
-from datetime import datetime
-from prometheus_client import Counter, Histogram, start_http_server
-from enum import Enum
-import threading
-from queue import PriorityQueue
-import time
-import uuid
-from concurrent.futures import ThreadPoolExecutor
+    def _initialize_db(self):
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS workflows (
+                workflow_id TEXT PRIMARY KEY,
+                name TEXT,
+                steps TEXT,
+                created_at DATETIME
+            )
+            """)
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS workflow_checkpoints (
+                seq INTEGER PRIMARY KEY,
+                workflow_id TEXT,
+                step_name TEXT,
+                status TEXT,
+                error TEXT,
+                recorded_at REAL
+            )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_checkpoint_workflow ON workflow_checkpoints(workflow_id, seq)")
 
-# Metrics collection
-class MetricsCollector:
-    def __init__(self):
-        self.task_counter = Counter('tasks_total', 'Total tasks processed', ['priority', 'status'])
-        self.processing_time = Histogram('task_processing_seconds', 'Time spent processing tasks')
-        start_http_server(8000)
+    def register_workflow(self, workflow_id: str, workflow: 'Workflow'):
+        steps = [asdict(step) for step in workflow.steps.values()]
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO workflows (workflow_id, name, steps, created_at) VALUES (?, ?, ?, ?)",
+                (workflow_id, workflow.name, json.dumps(steps), datetime.now().isoformat())
+            )
 
-@dataclass
-class ServiceAccount:
-    account_id: str
-    api_key: str
-    permissions: Set[str]
-    metadata: Dict
-    
-    def authenticate(self) -> bool:
-        # Simulate auth check
-        return len(self.api_key) > 0
-    
-    def has_permission(self, permission: str) -> bool:
-        return permission in self.permissions
+    def record_step(self, workflow_id: str, step_name: str, status: str, error: Optional[str] = None):
+        with self.lock:
+            self._pending.append((workflow_id, step_name, status, error, time.time()))
+            due = (
+                len(self._pending) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
 
-@dataclass 
-class WorkflowStep:
-    name: str
-    task: Dict
-    depends_on: List[str] = None
-    retry_count: int = 3
-    timeout: int = 30
-    
-class Workflow:
-    def __init__(self, name: str, steps: List[WorkflowStep]):
-        self.name = name
-        self.steps = {step.name: step for step in steps}
-        self.validate_dependencies()
-        
-    def validate_dependencies(self):
-        for step in self.steps.values():
-            if step.depends_on:
-                for dep in step.depends_on:
-                    if dep not in self.steps:
-                        raise ValueError(f"Invalid dependency {dep} in step {step.name}")
-                        
-    def get_ready_steps(self, completed: Set[str]) -> List[WorkflowStep]:
-        ready = []
-        for step in self.steps.values():
-            if step.name not in completed and (not step.depends_on or all(d in completed for d in step.depends_on)):
-                ready.append(step)
-        return ready
+    def flush(self):
+        with self.lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if not pending:
+                return
+            with self.conn:
+                self.conn.executemany("""
+                INSERT INTO workflow_checkpoints (workflow_id, step_name, status, error, recorded_at)
+                VALUES (?, ?, ?, ?, ?)
+                """, pending)
 
-class RequestPriority(Enum):
-    CEO = 1
-    R1 = 2
-    R2 = 3
-    R3 = 4
-    GROUND = 5
+    def load_workflow(self, workflow_id: str) -> Optional['Workflow']:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT name, steps FROM workflows WHERE workflow_id = ?", (workflow_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return Workflow(row[0], [WorkflowStep(**step) for step in json.loads(row[1])])
 
-@dataclass
-class Request:
-    priority: RequestPriority
-    agent_id: str
-    task: Dict
-    timestamp: float
-    
-    def __lt__(self, other):
-        if self.priority.value == other.priority.value:
-            return self.timestamp < other.timestamp
-        return self.priority.value < other.priority.value
+    def load_progress(self, workflow_id: str) -> Dict[str, str]:
+        """Replay checkpoints in order and return the latest status of each step."""
+        self.flush()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT step_name, status FROM workflow_checkpoints WHERE workflow_id = ? ORDER BY seq",
+                (workflow_id,)
+            ).fetchall()
+        return dict(rows)
 
-class ResourcePool:
-    def __init__(self, size: int):
-        self.size = size
-        self.available = size
-        self.lock = threading.Lock()
-        self.condition = threading.Condition(self.lock)
-    
-    async def acquire(self, count: int = 1) -> bool:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._acquire, count)
-    
-    def _acquire(self, count: int) -> bool:
-        with self.condition:
-            while self.available < count:
-                self.condition.wait()
-            self.available -= count
-            return True
-    
-    def release(self, count: int = 1):
-        with self.condition:
-            self.available += count
-            self.condition.notify_all()
+    def close(self):
+        self.flush()
+        self.conn.close()
 
 class WorkflowExecution:
-    def __init__(self, workflow: Workflow):
+    def __init__(
+        self,
+        workflow: Workflow,
+        workflow_id: Optional[str] = None,
+        checkpoint_store: Optional[WorkflowCheckpointStore] = None
+    ):
         self.workflow = workflow
+        self.workflow_id = workflow_id or str(uuid.uuid4())
+        self.checkpoint_store = checkpoint_store
         self.completed_steps: Set[str] = set()
         self.failed_steps: Dict[str, Exception] = {}
+        self.attempts: Dict[str, int] = {}
         self.metrics = MetricsCollector()
-        
+        if self.checkpoint_store:
+            self.checkpoint_store.register_workflow(self.workflow_id, workflow)
+
+    @classmethod
+    def resume(cls, workflow_id: str, checkpoint_store: WorkflowCheckpointStore) -> 'WorkflowExecution':
+        workflow = checkpoint_store.load_workflow(workflow_id)
+        if workflow is None:
+            raise ValueError(f"No checkpointed workflow {workflow_id}")
+        execution = cls(workflow, workflow_id=workflow_id, checkpoint_store=checkpoint_store)
+        # Failed steps are left out so they are retried on resume
+        execution.completed_steps = {
+            step_name
+            for step_name, status in checkpoint_store.load_progress(workflow_id).items()
+            if status == 'completed' and step_name in workflow.steps
+        }
+        return execution
+
+    def _checkpoint(self, step_name: str, status: str, error: Optional[Exception] = None):
+        if self.checkpoint_store:
+            self.checkpoint_store.record_step(
+                self.workflow_id,
+                step_name,
+                status,
+                repr(error) if error else None
+            )
+
     async def execute(self, agent: 'ConcurrentAgent'):
-        while len(self.completed_steps) < len(self.workflow.steps):
-            ready_steps = self.workflow.get_ready_steps(self.completed_steps)
-            if not ready_steps:
-                break
-                
-            for step in ready_steps:
-                try:
-                    with self.metrics.processing_time.time():
-                        await agent.submit_task(step.task)
-                    self.completed_steps.add(step.name)
-                    self.metrics.task_counter.labels(
-                        priority=agent.priority.name,
-                        status='success'
-                    ).inc()
-                except Exception as e:
-                    self.failed_steps[step.name] = e
-                    self.metrics.task_counter.labels(
-                        priority=agent.priority.name,
-                        status='failed'
-                    ).inc()
-                    
+        """Run the ready steps until the workflow completes.
+
+        A failing step is retried up to its ``retry_count`` times; once a step
+        runs out of retries execution stops and False is returned.
+        """
+        exhausted = False
+        try:
+            while not exhausted and len(self.completed_steps) < len(self.workflow.steps):
+                ready_steps = self.workflow.get_ready_steps(self.completed_steps)
+                if not ready_steps:
+                    break
+
+                for step in ready_steps:
+                    try:
+                        with self.metrics.processing_time.time():
+                            await agent.submit_task(step.task)
+                        self.completed_steps.add(step.name)
+                        self.failed_steps.pop(step.name, None)
+                        self._checkpoint(step.name, 'completed')
+                        self.metrics.task_counter.labels(
+                            priority=agent.priority.name,
+                            status='success'
+                        ).inc()
+                    except Exception as e:
+                        self.failed_steps[step.name] = e
+                        self.attempts[step.name] = self.attempts.get(step.name, 0) + 1
+                        self._checkpoint(step.name, 'failed', e)
+                        self.metrics.task_counter.labels(
+                            priority=agent.priority.name,
+                            status='failed'
+                        ).inc()
+                        if self.attempts[step.name] > step.retry_count:
+                            exhausted = True
+                            break
+        finally:
+            if self.checkpoint_store:
+                self.checkpoint_store.flush()
+
         return len(self.failed_steps) == 0
 
 class SuperClaudeResourceManager:
-    def __init__(self, compute_units: int = 100):
+    def __init__(
+        self,
+        compute_units: int = 100,
+        checkpoint_store: Optional[WorkflowCheckpointStore] = None
+    ):
         self.metrics = MetricsCollector()
         self.compute_pool = ResourcePool(compute_units)
+        self.checkpoint_store = checkpoint_store
         self.workflows: Dict[str, WorkflowExecution] = {}
         self.request_queue = PriorityQueue()
         self.processing = True
@@ -421,9 +302,16 @@ class SuperClaudeResourceManager:
         self.processing_thread.daemon = True
         self.processing_thread.start()
     
-    def submit_workflow(self, workflow: Workflow, agent: ConcurrentAgent) -> str:
+    def submit_workflow(self, workflow: Workflow, agent: 'ConcurrentAgent') -> str:
         workflow_id = str(uuid.uuid4())
-        self.workflows[workflow_id] = WorkflowExecution(workflow)
+        self.workflows[workflow_id] = WorkflowExecution(workflow, workflow_id, self.checkpoint_store)
+        asyncio.create_task(self.workflows[workflow_id].execute(agent))
+        return workflow_id
+
+    def resume_workflow(self, workflow_id: str, agent: 'ConcurrentAgent') -> str:
+        if self.checkpoint_store is None:
+            raise RuntimeError("Workflow checkpointing is not enabled")
+        self.workflows[workflow_id] = WorkflowExecution.resume(workflow_id, self.checkpoint_store)
         asyncio.create_task(self.workflows[workflow_id].execute(agent))
         return workflow_id
         
@@ -436,15 +324,37 @@ class SuperClaudeResourceManager:
         )
         self.request_queue.put(request)
     
+    def shutdown(self):
+        """Stop dequeuing and wait for the requests already in flight."""
+        self.processing = False
+        self.processing_thread.join()
+
     def _process_queue(self):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._dispatch())
+        finally:
+            loop.close()
+
+    async def _dispatch(self):
+        # Requests leave the queue in priority order and each runs as its own
+        # task once the pool grants its units, so the pool alone bounds how
+        # many are in flight
+        loop = asyncio.get_running_loop()
+        in_flight: Set[asyncio.Task] = set()
         while self.processing:
             try:
-                request = self.request_queue.get(timeout=1)
-                # Simulate processing with appropriate resource allocation
-                required_resources = self._calculate_required_resources(request)
-                self._acquire_and_process(request, required_resources)
-            except:
+                request = await loop.run_in_executor(None, self.request_queue.get, True, 0.1)
+            except Empty:
                 continue
+            # Requests larger than the pool would never be granted
+            required_resources = min(self._calculate_required_resources(request), self.compute_pool.size)
+            await self.compute_pool.acquire(required_resources)
+            task = loop.create_task(self._run_request(request, required_resources))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.gather(*in_flight)
     
     def _calculate_required_resources(self, request: Request) -> int:
         # Resource calculation based on priority and task complexity
@@ -457,11 +367,12 @@ class SuperClaudeResourceManager:
         }
         return base_resources[request.priority]
     
-    async def _acquire_and_process(self, request: Request, required_resources: int):
-        await self.compute_pool.acquire(required_resources)
+    async def _run_request(self, request: Request, required_resources: int):
+        # Runs with the units already acquired by the dispatcher
         try:
-            # Process the request
             await self._process_request(request)
+        except Exception:
+            logging.exception("Failed to process request from agent %s", request.agent_id)
         finally:
             self.compute_pool.release(required_resources)
     
@@ -549,4 +460,3 @@ async def main():
 
 if __name__ == "__main__":
     asyncio.run(main())
-
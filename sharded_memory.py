@@ -0,0 +1,205 @@
+"""Sharded memory backend that spreads agents over several SQLite files.
+
+Each shard is a full MemoryStore with its own writer, so agents on different
+shards commit in parallel instead of queueing on one database lock. Agents
+are placed by a consistent hash of ``agent_id``; growing from N to N+1 shards
+only relocates about 1/(N+1) of the agents.
+
+    python sharded_memory.py agent_memory_shards --shards 8
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from bisect import bisect
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import os
+from agent_memory import AgentMemory, MemoryRecord, MemoryStore, _search_text
+
+LAYOUT_FILE = "shards.json"
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+class ConsistentHashRing:
+    """Maps keys to nodes, with ``vnodes`` points per node on a 64-bit ring."""
+
+    def __init__(self, nodes: Sequence[str], vnodes: int = 64):
+        if not nodes:
+            raise ValueError("A hash ring needs at least one node")
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        return self.nodes[bisect(self.hashes, _hash(key)) % len(self.nodes)]
+
+class ShardedMemoryStore:
+    """Routes agents to MemoryStore shards by consistent hash.
+
+    The shard list lives in ``shards.json`` inside ``directory``, so reopening
+    keeps the existing placement regardless of ``shard_count``; use
+    ``rebalance`` to change it. Pass the sharded store to AgentMemory like a
+    MemoryStore and each agent is bound to its own shard.
+    """
+
+    def __init__(
+        self,
+        directory: str = "agent_memory_shards",
+        shard_count: int = 4,
+        vnodes: int = 64,
+        **store_kwargs: Any
+    ):
+        self.directory = directory
+        self.store_kwargs = store_kwargs
+        os.makedirs(directory, exist_ok=True)
+        layout_path = os.path.join(directory, LAYOUT_FILE)
+        if os.path.exists(layout_path):
+            with open(layout_path) as f:
+                layout = json.load(f)
+        else:
+            layout = {"shards": [f"shard-{i:03d}.db" for i in range(shard_count)], "vnodes": vnodes}
+            self._write_layout(layout)
+        self.vnodes = layout["vnodes"]
+        self.shards: Dict[str, MemoryStore] = {name: self._open(name) for name in layout["shards"]}
+        self.ring = ConsistentHashRing(list(self.shards), self.vnodes)
+        self.executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="memory-shard")
+
+    def _open(self, name: str) -> MemoryStore:
+        return MemoryStore(os.path.join(self.directory, name), **self.store_kwargs)
+
+    def _write_layout(self, layout: Dict[str, Any]):
+        path = os.path.join(self.directory, LAYOUT_FILE)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(layout, f)
+        os.replace(f"{path}.tmp", path)
+
+    def store_for(self, agent_id: str) -> MemoryStore:
+        return self.shards[self.ring.node_for(agent_id)]
+
+    def scatter(self, fn: Callable[[MemoryStore], Any]) -> List[Any]:
+        """Run ``fn`` against every shard concurrently and return the results."""
+        return list(self.executor.map(fn, self.shards.values()))
+
+    def flush(self) -> int:
+        return sum(self.scatter(lambda store: store.write_buffer.flush()))
+
+    def agent_ids(self) -> Dict[str, List[str]]:
+        """Return the agents stored on each shard."""
+        return {name: sorted(agents) for name, agents in zip(self.shards, self.scatter(MemoryStore.agent_ids))}
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        category: Optional[str] = None,
+        importance_weight: float = 0.0
+    ) -> List[Tuple[str, MemoryRecord, float]]:
+        """Full-text search across every agent, as (agent id, record, score) triples.
+
+        BM25 statistics are per shard, so scores from different shards are
+        comparable but not identical to a single-database ranking.
+        """
+        def search_shard(store: MemoryStore) -> List[tuple]:
+            hits = store.search(query, None, limit, category, importance_weight)
+            records = store.fetch_memories([memory_id for memory_id, _, _ in hits])
+            return [(agent_id, records[memory_id], score)
+                    for memory_id, agent_id, score in hits if memory_id in records]
+
+        results = [hit for hits in self.scatter(search_shard) for hit in hits]
+        return heapq.nlargest(limit, results, key=lambda hit: hit[2])
+
+    def recall_similar(
+        self,
+        vector: Sequence[float],
+        k: int = 10,
+        categories: Optional[List[str]] = None,
+        min_importance: Optional[float] = None
+    ) -> List[Tuple[MemoryRecord, float]]:
+        """Return the k memories most similar to ``vector`` across every agent."""
+        def recall_shard(store: MemoryStore) -> List[tuple]:
+            store.write_buffer.flush()
+            index = store.sync_embeddings()
+            hits = index.search(vector, k, categories=categories, min_importance=min_importance)
+            records = store.fetch_memories([memory_id for memory_id, _ in hits])
+            return [(records[memory_id], score) for memory_id, score in hits if memory_id in records]
+
+        results = [hit for hits in self.scatter(recall_shard) for hit in hits]
+        return heapq.nlargest(k, results, key=lambda hit: hit[1])
+
+    def rebalance(self, shard_count: int) -> Dict[str, Tuple[str, str]]:
+        """Resize the ring to ``shard_count`` shards and move agents whose owner changed.
+
+        Returns {agent_id: (old shard, new shard)}. Moved memories get new ids
+        on their new shard. Run this while no AgentMemory is bound to the
+        store; retired shard files are left in place for the operator.
+        """
+        names = [f"shard-{i:03d}.db" for i in range(shard_count)]
+        for name in names:
+            if name not in self.shards:
+                self.shards[name] = self._open(name)
+        ring = ConsistentHashRing(names, self.vnodes)
+
+        moves = {}
+        for name, agents in self.agent_ids().items():
+            for agent_id in agents:
+                target = ring.node_for(agent_id)
+                if target != name:
+                    self._move_agent(agent_id, self.shards[name], self.shards[target])
+                    moves[agent_id] = (name, target)
+
+        for name in [name for name in self.shards if name not in names]:
+            self.shards.pop(name).close()
+        self.ring = ring
+        self._write_layout({"shards": names, "vnodes": self.vnodes})
+        self.executor.shutdown()
+        self.executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="memory-shard")
+        return moves
+
+    def _move_agent(self, agent_id: str, source: MemoryStore, target: MemoryStore, batch_size: int = 1000):
+        # Copy through the source's merged warm and cold view, then drop it
+        batch = []
+        for record in AgentMemory(agent_id, store=source).iter_memories(batch_size=batch_size):
+            batch.append((
+                agent_id,
+                record.timestamp.isoformat(),
+                record.category,
+                target.codec.encode(record.content, agent_id),
+                record.importance,
+                target.codec.encode(record.context, agent_id) if record.context else None,
+                None if record.embedding is None else record.embedding.copy(),
+                _search_text(record.content, record.context)
+            ))
+            if len(batch) >= batch_size:
+                target.insert_rows(batch)
+                batch = []
+        if batch:
+            target.insert_rows(batch)
+        moved = source.drop_agent(agent_id)
+        logging.info(f"Moved {moved} memories of {agent_id} to {target.db_path}")
+
+    def close(self):
+        self.executor.shutdown()
+        for store in self.shards.values():
+            store.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--shards", type=int, required=True, help="target number of shards")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = ShardedMemoryStore(args.directory)
+    try:
+        moves = store.rebalance(args.shards)
+    finally:
+        store.close()
+    for agent_id, (source, target) in sorted(moves.items()):
+        print(f"{agent_id}: {source} -> {target}")
+    print(f"Moved {len(moves)} agents onto {args.shards} shards")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from agent_memory import (
+    AgentMemory,
+    EmbeddingFile,
+    EmbeddingIndex,
+    MemoryCodec,
+    MemoryStore,
+    RetentionPolicy,
+    SpaceSavingCounter,
+    StreamingQuantile,
+    decay_importance
+)
+
+@pytest.fixture
+def store(tmp_path):
+    store = MemoryStore(str(tmp_path / "memory.db"))
+    yield store
+    store.close()
+
+@pytest.fixture
+def memory(store):
+    return AgentMemory("agent-1", capacity=10, store=store)
+
+def test_store_uses_wal(store):
+    assert store.writer.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert store.reader().execute("PRAGMA synchronous").fetchone()[0] == 1
+
+def test_persisted_memories_are_retrieved(memory):
+    memory.add_memory("task", {"outcome": "success"}, 0.9, {"env": "prod"})
+    memory.add_memory("task", {"outcome": "failure"}, 0.8)
+    memory.add_memory("task", {"outcome": "ignored"}, 0.1)
+
+    records = memory.retrieve_memories("task")
+    assert [r.content["outcome"] for r in records] == ["success", "failure"]
+    assert records[0].context == {"env": "prod"}
+
+def test_readers_are_per_thread(store):
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(store.reader()))
+    thread.start()
+    thread.join()
+    assert store.reader() is store.reader()
+    assert connections[0] is not store.reader()
+
+def test_evictions_are_persisted_in_one_commit(tmp_path):
+    store = MemoryStore(str(tmp_path / "memory.db"), batch_size=10000, flush_interval=60)
+    memory = AgentMemory("agent-1", capacity=1000, store=store)
+    statements = []
+    store.writer.set_trace_callback(statements.append)
+    for i in range(2000):
+        memory.add_memory("task", {"step": i}, i / 4000)
+
+    memory.flush()
+    assert statements.count("COMMIT") == 1
+    persisted = memory.retrieve_memories("task", limit=2000)
+    assert sorted(r.content["step"] for r in persisted) == list(range(1000))
+    assert [r.content["step"] for r in memory.short_term[:2]] == [1999, 1998]
+    store.close()
+
+def test_important_memories_are_not_persisted_twice(memory):
+    for i in range(30):
+        memory.add_memory("task", {"step": i}, 0.9)
+
+    assert len(memory.short_term) == memory.capacity
+    assert len(memory.retrieve_memories("task", limit=100)) == 30
+
+def test_buffered_writes_flush_on_demand(tmp_path):
+    store = MemoryStore(str(tmp_path / "memory.db"), batch_size=1000, flush_interval=60)
+    memory = AgentMemory("agent-1", store=store)
+    memory.add_memory("task", {"outcome": "success"}, 0.9)
+    assert store.write_buffer.pending == 1
+
+    assert memory.flush() == 1
+    count = store.reader().execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+    assert count == 1
+    store.close()
+
+def test_failed_flush_keeps_buffered_rows(tmp_path):
+    store = MemoryStore(str(tmp_path / "memory.db"), batch_size=1000, flush_interval=60)
+    memory = AgentMemory("agent-1", store=store)
+    memory.add_memory("task", {"outcome": "success"}, 0.9)
+    store.write_buffer.record_access([7])
+    store.writer.execute("PRAGMA busy_timeout=0")
+
+    # Another connection holds the write lock, so the flush fails
+    blocker = sqlite3.connect(store.db_path)
+    blocker.execute("BEGIN IMMEDIATE")
+    with pytest.raises(sqlite3.OperationalError):
+        memory.flush()
+    assert store.write_buffer.pending == 1
+    assert store.write_buffer._accesses == {7: 1}
+    blocker.rollback()
+    blocker.close()
+
+    assert memory.flush() == 1
+    assert [r.content["outcome"] for r in memory.retrieve_memories("task")] == ["success"]
+    store.close()
+
+def test_bad_rows_are_rejected_before_they_reach_a_batch(store, memory):
+    other = AgentMemory("agent-2", store=store)
+    other.add_memory("task", {"name": "theirs"}, 0.9, embedding=[1.0, 0.0])
+    # Neither file nor batch has a dimension yet; the first queued row sets it
+    row = ("agent-1", "2024-01-01T00:00:00", "task", b"{}", 0.9, None, np.ones(3, dtype=np.float32))
+    with pytest.raises(ValueError):
+        store.write_buffer.append(row)
+    with pytest.raises(ValueError):
+        store.write_buffer.append(row[:5])
+    assert store.write_buffer.pending == 1
+    assert memory.flush() == 1
+
+def test_recall_similar_ranks_by_cosine(memory):
+    memory.add_memory("task", {"name": "east"}, 0.9, embedding=[1.0, 0.0, 0.0])
+    memory.add_memory("task", {"name": "north"}, 0.9, embedding=[0.0, 1.0, 0.0])
+    memory.add_memory("note", {"name": "north-east"}, 0.9, embedding=[0.7, 0.7, 0.0])
+
+    results = memory.recall_similar([1.0, 0.1, 0.0], k=2)
+    assert [r.content["name"] for r, _ in results] == ["east", "north-east"]
+    assert results[0][1] > results[1][1]
+
+    filtered = memory.recall_similar([1.0, 0.1, 0.0], k=2, filters={"category": "note"})
+    assert [r.content["name"] for r, _ in filtered] == ["north-east"]
+
+def test_recall_similar_is_scoped_to_agent(store, memory):
+    other = AgentMemory("agent-2", store=store)
+    other.add_memory("task", {"name": "theirs"}, 0.9, embedding=[1.0, 0.0])
+    memory.add_memory("task", {"name": "mine"}, 0.9, embedding=[0.0, 1.0])
+
+    results = memory.recall_similar([1.0, 0.0], k=5)
+    assert [r.content["name"] for r, _ in results] == ["mine"]
+
+def test_partitioned_search_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(2000, 16)).astype(np.float32)
+    embedding_file = EmbeddingFile(str(tmp_path / "vectors.embeddings"))
+    positions = embedding_file.append(vectors)
+    rows = [(i + 1, "agent", "task", 0.9, "2024-01-01T00:00:00", int(p)) for i, p in enumerate(positions)]
+
+    brute = EmbeddingIndex(embedding_file, ivf_threshold=10 ** 9)
+    brute.add(rows)
+    partitioned = EmbeddingIndex(embedding_file, ivf_threshold=1000, nprobe=4)
+    partitioned.add(rows)
+    assert partitioned.centroids is not None
+
+    query = vectors[17] + 0.01
+    assert partitioned.search(query, 1)[0][0] == brute.search(query, 1)[0][0] == 18
+
+def test_embeddings_are_memory_mapped(tmp_path, store, memory):
+    memory.add_memory("task", {"name": "east"}, 0.9, embedding=[2.0, 0.0])
+    memory.flush()
+
+    row = store.reader().execute("SELECT embedding, embedding_row FROM memories").fetchone()
+    assert row == (None, 0)
+    assert isinstance(store.embedding_file.view(), np.memmap)
+
+    # A second store on the same files sees the vectors without copying them in
+    other = MemoryStore(store.db_path)
+    results = AgentMemory("agent-1", store=other).recall_similar([1.0, 0.0], k=1)
+    assert results[0][0].embedding.tolist() == [1.0, 0.0]
+    other.close()
+
+def test_store_opened_before_the_embedding_file_sees_its_dimension(store, memory):
+    other = MemoryStore(store.db_path)
+    memory.add_memory("task", {"name": "east"}, 0.9, embedding=[1.0, 0.0, 0.0])
+    memory.flush()
+
+    mine = AgentMemory("agent-1", store=other)
+    assert mine.recall_similar([1.0, 0.0, 0.0], k=1)[0][1] == pytest.approx(1.0)
+    with pytest.raises(ValueError):
+        mine.add_memory("task", {"name": "flat"}, 0.9, embedding=[1.0, 0.0])
+    assert other.write_buffer.pending == 0
+    other.close()
+
+def test_deleted_ids_are_not_reused(store, memory):
+    other = MemoryStore(store.db_path)
+    mine = AgentMemory("agent-1", store=other)
+    memory.add_memory("task", {"name": "east"}, 0.9, embedding=[1.0, 0.0, 0.0])
+    memory.flush()
+    assert mine.recall_similar([1.0, 0.0, 0.0], k=1)[0][0].id == 1
+
+    store.delete_memories([1])
+    memory.add_memory("task", {"name": "north"}, 0.9, embedding=[0.0, 1.0, 0.0])
+    memory.flush()
+    assert store.max_id() == 2
+
+    # The other store's index still maps id 1 to the deleted vector
+    for agent in (memory, mine):
+        record, score = agent.recall_similar([0.0, 1.0, 0.0], k=1)[0]
+        assert (record.id, record.content["name"]) == (2, "north")
+        assert score == pytest.approx(1.0)
+    other.close()
+
+def test_legacy_blob_embeddings_are_migrated(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+        CREATE TABLE memories (
+            id INTEGER PRIMARY KEY, agent_id TEXT, timestamp DATETIME, category TEXT,
+            content TEXT, importance REAL, context TEXT, embedding BLOB
+        )
+        """)
+        conn.execute(
+            "INSERT INTO memories VALUES (1, 'agent-1', '2024-01-01T00:00:00', 'task', '{}', 0.9, NULL, ?)",
+            (np.array([0.0, 3.0], dtype=np.float32).tobytes(),)
+        )
+
+    store = MemoryStore(db_path, embedding_dtype=np.float16)
+    results = AgentMemory("agent-1", store=store).recall_similar([0.0, 1.0], k=1)
+    assert results[0][0].id == 1
+    assert results[0][1] == pytest.approx(1.0)
+    store.close()
+
+def test_retrieval_cache_hits_and_invalidates(memory):
+    memory.add_memory("task", {"step": 1}, 0.9)
+    memory.add_memory("note", {"text": "hello"}, 0.9)
+
+    assert len(memory.retrieve_memories("task")) == 1
+    assert len(memory.retrieve_memories("task")) == 1
+    memory.retrieve_memories("note")
+    assert memory.cache_stats() == {"hits": 1, "misses": 2, "entries": 2}
+
+    # Writing a task memory only drops the cached task results
+    memory.add_memory("task", {"step": 2}, 0.9)
+    assert len(memory.retrieve_memories("task")) == 2
+    memory.retrieve_memories("note")
+    assert memory.cache_stats() == {"hits": 2, "misses": 3, "entries": 2}
+
+def test_retrieval_cache_is_bounded(store):
+    memory = AgentMemory("agent-1", store=store, cache_size=2)
+    for category in ("a", "b", "c"):
+        memory.retrieve_memories(category)
+    memory.retrieve_memories("a")
+    assert memory.cache_stats() == {"hits": 0, "misses": 4, "entries": 2}
+
+def test_learn_from_experience_covers_full_history(store):
+    earlier = AgentMemory("agent-1", store=store)
+    for i in range(150):
+        earlier.add_memory("task", {"outcome": "success" if i % 3 else "failure"}, 0.9, {"env": "prod"})
+    earlier.flush()
+
+    # A fresh instance folds in persisted history, then counts new memories live
+    memory = AgentMemory("agent-1", store=store)
+    memory.add_memory("task", {"outcome": "failure", "retries": 2}, 0.75, {"env": "staging"})
+    learnings = memory.learn_from_experience("task")
+
+    assert learnings["patterns"] == {"outcome": "success", "retries": 2}
+    assert learnings["frequent_contexts"] == {'{"env": "prod"}': 150, '{"env": "staging"}': 1}
+    assert learnings["importance_threshold"] == pytest.approx(0.9)
+    assert memory.learn_from_experience("unknown") == {}
+
+def test_streaming_quantile_tracks_percentile():
+    rng = np.random.default_rng(2)
+    values = rng.uniform(size=5000)
+    estimator = StreamingQuantile(0.75)
+    for value in values:
+        estimator.add(value)
+    assert estimator.value() == pytest.approx(np.percentile(values, 75), abs=0.02)
+
+def test_space_saving_keeps_heavy_hitters():
+    counter = SpaceSavingCounter(capacity=4)
+    for i in range(1000):
+        counter.add("common" if i % 2 else f"rare-{i}")
+    assert counter.most_common(1)[0][0] == "common"
+    assert len(counter.counts) == 4
+
+def test_iter_memories_pages_through_history(store):
+    memory = AgentMemory("agent-1", store=store)
+    for i in range(25):
+        memory.add_memory("task" if i % 2 else "note", {"step": i}, 0.8 + (i % 5) / 100)
+    AgentMemory("agent-2", store=store).add_memory("task", {"step": 99}, 0.9)
+
+    streamed = list(memory.iter_memories(batch_size=4))
+    assert len(streamed) == 25
+    assert len({r.id for r in streamed}) == 25
+    ranks = [(r.importance, r.timestamp, r.id) for r in streamed]
+    assert ranks == sorted(ranks, reverse=True)
+
+    tasks = list(memory.iter_memories(category="task", batch_size=3))
+    assert [r.content["step"] for r in tasks] == [r.content["step"] for r in streamed if r.category == "task"]
+
+    plan = store.reader().execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM memories WHERE agent_id = ? AND category = ? "
+        "AND (importance, timestamp, id) < (?, ?, ?) ORDER BY importance DESC, timestamp DESC, id DESC",
+        ("agent-1", "task", 1, "z", 1)
+    ).fetchall()
+    assert "idx_agent_category_rank" in str(plan)
+    assert "TEMP B-TREE" not in str(plan)
+
+def test_cold_tier_is_queried_and_promoted(store, memory):
+    for i in range(6):
+        memory.add_memory("task", {"step": i}, 0.75 + i / 100, embedding=[1.0, i])
+    memory.flush()
+
+    archived = store.archive(datetime.now() + timedelta(seconds=1), max_importance=0.78)
+    assert archived == 3
+    assert store.reader().execute("SELECT COUNT(*) FROM memories").fetchone()[0] == 3
+    assert len(os.listdir(store.cold_tier.directory)) == 1
+
+    # Ids are never handed out again once archived
+    memory.add_memory("note", {"text": "new"}, 0.9)
+    memory.flush()
+    assert store.reader().execute("SELECT MAX(id) FROM memories").fetchone()[0] == 7
+
+    fresh = AgentMemory("agent-1", store=MemoryStore(store.db_path))
+    steps = [r.content["step"] for r in fresh.iter_memories(category="task", batch_size=2)]
+    assert steps == [5, 4, 3, 2, 1, 0]
+
+    retrieved = fresh.retrieve_memories("task", limit=5)
+    assert [r.content["step"] for r in retrieved] == [5, 4, 3, 2, 1]
+    assert store.reader().execute("SELECT COUNT(*) FROM memories WHERE category = 'task'").fetchone()[0] == 5
+
+    # Promoted records are not duplicated across tiers
+    assert len(list(fresh.iter_memories(category="task"))) == 6
+    results = fresh.recall_similar([1.0, 0.0], k=1)
+    assert results[0][0].content == {"step": 0}
+    fresh.store.close()
+
+def test_deleted_promoted_memories_stay_deleted(store, memory):
+    ids = _insert_aged(store, 45, 0.5, count=3)
+    store.archive_ids(ids)
+    other = AgentMemory("agent-1", store=MemoryStore(store.db_path))
+    assert len(other.retrieve_memories("task")) == 3
+
+    # Promoted by the retrieve, then deleted from SQLite
+    assert len(memory.retrieve_memories("task")) == 3
+    memory.cleanup_old_memories(days_threshold=30)
+    assert memory.retrieve_memories("task") == []
+    assert list(memory.iter_memories()) == []
+    assert store.reader().execute("SELECT COUNT(*) FROM memories").fetchone()[0] == 0
+
+    # Another store that already had the segment open sees the tombstones
+    assert other.retrieve_memories("task", limit=4) == []
+    assert other.store.fetch_memories(ids) == {}
+    other.store.close()
+
+def test_cold_ranking_streams_in_bounded_batches(store):
+    ids = []
+    for age in range(30):
+        ids += _insert_aged(store, 100 + age, (age % 7) / 10, count=2)
+    store.archive_ids(ids, segment_size=12)
+    store.cold_tier.max_open_segments = 2
+    assert len(store.cold_tier.segment_ids()) == 5
+
+    streamed = list(store.cold_tier.ranked("agent-1", batch_size=4))
+    ranks = [(row[5], datetime.fromisoformat(row[2]).timestamp(), row[0]) for row in streamed]
+    assert len(streamed) == 60
+    assert ranks == sorted(ranks, reverse=True)
+    assert [row[0] for row in store.cold_tier.ranked("agent-1", limit=7)] == [row[0] for row in streamed[:7]]
+    assert len(store.cold_tier.open_segments) == 2
+
+def test_legacy_json_rows_are_still_readable(store, memory):
+    with store.write() as conn:
+        conn.execute(
+            "INSERT INTO memories (id, agent_id, timestamp, category, content, importance, context) "
+            "VALUES (100, 'agent-1', '2024-01-01T00:00:00', 'task', '{\"legacy\": true}', 0.9, '{\"env\": \"prod\"}')"
+        )
+    memory.add_memory("task", {"legacy": False}, 0.8)
+
+    records = memory.retrieve_memories("task")
+    assert [r.content for r in records] == [{"legacy": True}, {"legacy": False}]
+    assert records[0].context == {"env": "prod"}
+    stored = store.reader().execute("SELECT content FROM memories WHERE id != 100").fetchone()[0]
+    assert isinstance(stored, bytes)
+
+def test_json_codec_without_optional_dependencies():
+    codec = MemoryCodec(serializer="json", compress=False)
+    encoded = codec.encode({"outcome": "success"})
+    assert encoded[0] == MemoryCodec.FORMAT_JSON
+    assert codec.decode(encoded) == {"outcome": "success"}
+
+def test_trained_dictionary_compresses_agent_payloads(store, memory):
+    pytest.importorskip("msgpack")
+    pytest.importorskip("zstandard")
+    for i in range(500):
+        memory.add_memory("task", {"outcome": "success", "step": i, "detail": f"processed batch {i} of pipeline"}, 0.9,
+                          {"env": "prod", "region": "us-west1", "service": "ingest"})
+    memory.flush()
+    before = store.reader().execute("SELECT AVG(LENGTH(content)) FROM memories").fetchone()[0]
+
+    dictionary_id = memory.train_compression_dictionary()
+    assert dictionary_id is not None
+    memory.add_memory("task", {"outcome": "success", "step": 1000, "detail": "processed batch 1000 of pipeline"}, 0.95,
+                      {"env": "prod", "region": "us-west1", "service": "ingest"})
+    memory.flush()
+    latest = store.reader().execute("SELECT content FROM memories ORDER BY id DESC LIMIT 1").fetchone()[0]
+    assert latest[0] & MemoryCodec.FORMAT_ZSTD
+    assert len(latest) < before
+
+    # Another store resolves the dictionary id from the database
+    other = MemoryStore(store.db_path)
+    assert other.codec.decode(latest)["step"] == 1000
+    other.close()
+
+def test_search_matches_content_and_context(store, memory):
+    memory.add_memory("task", {"summary": "deployed billing service"}, 0.9, {"region": "us-west1"})
+    memory.add_memory("task", {"summary": "rotated credentials"}, 0.8)
+    memory.add_memory("alert", {"summary": "billing latency spike"}, 0.75)
+    other = AgentMemory("agent-2", store=store)
+    other.add_memory("task", {"summary": "billing export"}, 0.9)
+
+    results = memory.search("billing")
+    assert {r.content["summary"] for r, _ in results} == {"deployed billing service", "billing latency spike"}
+    assert [r.content["summary"] for r, _ in memory.search("billing", category="alert")] == ["billing latency spike"]
+    assert [r.content["summary"] for r, _ in memory.search("region")] == ["deployed billing service"]
+
+def test_search_finds_archived_memories(store, memory):
+    memory.add_memory("task", {"summary": "old incident postmortem"}, 0.8)
+    memory.flush()
+    store.archive(datetime.now() + timedelta(days=1), max_importance=1.0)
+    assert store.reader().execute("SELECT COUNT(*) FROM memories").fetchone()[0] == 0
+
+    results = memory.search("postmortem")
+    assert [r.content["summary"] for r, _ in results] == ["old incident postmortem"]
+
+def test_search_index_is_backfilled(tmp_path):
+    db_path = str(tmp_path / "memory.db")
+    store = MemoryStore(db_path)
+    AgentMemory("agent-1", store=store).add_memory("task", {"summary": "backfilled note"}, 0.9)
+    store.write_buffer.flush()
+    with store.write() as conn:
+        conn.execute("DROP TABLE memories_fts")
+    store.close()
+
+    reopened = MemoryStore(db_path)
+    assert [r.content for r, _ in AgentMemory("agent-1", store=reopened).search("backfilled")] == [
+        {"summary": "backfilled note"}
+    ]
+    reopened.close()
+
+def _insert_aged(store, age_days, importance, count=1, agent_id="agent-1"):
+    timestamp = (datetime.now() - timedelta(days=age_days)).isoformat()
+    payload = store.codec.encode({"text": "x" * 200})
+    return store.insert_rows([(agent_id, timestamp, "task", payload, importance, None, None)] * count)
+
+def test_decay_halves_per_half_life():
+    now = np.datetime64("2024-03-01T00:00:00", "us")
+    timestamps = np.array(["2024-03-01T00:00:00", "2024-01-31T00:00:00", "2024-01-31T00:00:00"],
+                          dtype="datetime64[us]")
+    last_accessed = np.array([None, None, "2024-03-01T00:00:00"], dtype="datetime64[us]")
+    policy = RetentionPolicy(half_life_days=30, access_weight=0.0)
+    scores, age = decay_importance(np.full(3, 0.8), timestamps, np.zeros(3), last_accessed, now, policy)
+    assert np.allclose(scores, [0.8, 0.4, 0.8])
+    assert np.allclose(age, [0, 30, 30])
+
+def test_retention_deletes_and_archives_faded_memories(store, memory):
+    fresh = _insert_aged(store, 0, 0.01)
+    faded = _insert_aged(store, 300, 0.5)
+    fading = _insert_aged(store, 60, 0.3)
+    kept = _insert_aged(store, 10, 0.9)
+
+    stats = store.apply_retention(RetentionPolicy(half_life_days=30), chunk_size=2)
+    assert stats["scanned"] == 4 and stats["deleted"] == 1 and stats["archived"] == 1
+    warm = {row[0] for row in store.reader().execute("SELECT id FROM memories")}
+    assert warm == set(fresh + kept)
+    assert store.cold_tier.contains(faded + fading) == set(fading)
+
+def test_accessed_memories_survive_retention(store, memory):
+    ids = _insert_aged(store, 120, 0.2, count=2)
+    accessed = memory.retrieve_memories("task", limit=1)
+    memory.retrieve_memories("task", limit=1)
+    memory.flush()
+    policy = RetentionPolicy(half_life_days=30, archive_below=0.0)
+    assert store.apply_retention(policy)["deleted"] == 1
+    assert memory.retrieve_memories("task", limit=5) == accessed
+    assert accessed[0].id in ids
+
+def test_retention_releases_free_pages(store):
+    _insert_aged(store, 400, 0.1, count=2000)
+    stats = store.apply_retention()
+    assert stats["deleted"] == 2000
+    assert stats["vacuumed_pages"] > 0
+    assert store.reader().execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+def test_cleanup_old_memories(store, memory):
+    old = _insert_aged(store, 45, 0.5)
+    recent = _insert_aged(store, 5, 0.5)
+    memory.cleanup_old_memories(days_threshold=30)
+    assert [row[0] for row in store.reader().execute("SELECT id FROM memories")] == recent
+    assert old[0] not in recent
@@ -0,0 +1,706 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import pytest
+from agent_state import (
+    AgentState,
+    AgentStateHandler,
+    Event,
+    EventBus,
+    EventLog,
+    EventType,
+    OverflowPolicy,
+    RuntimeCheckpointer,
+    SharedStateStore,
+    StateManager,
+    StateSynchronizer
+)
+
+@pytest.fixture(autouse=True)
+def bus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    EventBus._instance = None
+    bus = EventBus()
+    yield bus
+    bus.close()
+    EventBus._instance = None
+
+def make_event(i=0, event_type=EventType.TASK_ASSIGNED, source_id="agent", target_id=None):
+    return Event(event_type, source_id, time.time(), {"task_id": i}, target_id)
+
+def test_slow_subscriber_does_not_delay_others(bus):
+    fast = []
+
+    async def slow_handler(event):
+        await asyncio.sleep(0.5)
+
+    async def fast_handler(event):
+        fast.append(event.data["task_id"])
+
+    bus.subscribe(EventType.TASK_ASSIGNED, slow_handler)
+    bus.subscribe(EventType.TASK_ASSIGNED, fast_handler)
+
+    async def run():
+        start = time.monotonic()
+        for i in range(5):
+            await bus.publish(make_event(i))
+        published = time.monotonic() - start
+        while len(fast) < 5:
+            await asyncio.sleep(0.01)
+        return published, time.monotonic() - start
+
+    published, handled = asyncio.run(run())
+    assert published < 0.1
+    assert handled < 0.3
+    assert fast == [0, 1, 2, 3, 4]
+
+@pytest.mark.parametrize("overflow, expected", [
+    (OverflowPolicy.DROP_OLDEST, [0, 7, 8, 9]),
+    (OverflowPolicy.DROP_NEWEST, [0, 1, 2, 3]),
+])
+def test_drop_policies(bus, overflow, expected):
+    seen = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def handler(event):
+            await gate.wait()
+            seen.append(event.data["task_id"])
+
+        subscription = bus.subscribe(EventType.TASK_ASSIGNED, handler, max_queue=3, overflow=overflow)
+        for i in range(10):
+            await bus.publish(make_event(i))
+            await asyncio.sleep(0)
+        assert subscription.metrics()["depth"] == 3
+        gate.set()
+        await bus.join()
+        return subscription
+
+    subscription = asyncio.run(run())
+    assert seen == expected
+    assert subscription.dropped == 6
+
+def test_block_policy_applies_backpressure(bus):
+    async def run():
+        gate = asyncio.Event()
+
+        async def handler(event):
+            await gate.wait()
+
+        bus.subscribe(EventType.TASK_ASSIGNED, handler, max_queue=1)
+        await bus.publish(make_event(0))
+        await asyncio.sleep(0)
+        await bus.publish(make_event(1))
+        blocked = asyncio.ensure_future(bus.publish(make_event(2)))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        gate.set()
+        await asyncio.wait_for(blocked, 1)
+        await bus.join()
+
+    asyncio.run(run())
+
+def test_failing_handler_keeps_consuming(bus):
+    handled = []
+
+    async def handler(event):
+        if event.data["task_id"] == 0:
+            raise RuntimeError("boom")
+        handled.append(event.data["task_id"])
+
+    async def run():
+        subscription = bus.subscribe(EventType.TASK_ASSIGNED, handler)
+        await bus.publish(make_event(0))
+        await bus.publish(make_event(1))
+        await bus.join()
+        return subscription
+
+    subscription = asyncio.run(run())
+    assert handled == [1]
+    assert subscription.failed == 1 and subscription.delivered == 1
+
+def test_handler_updates_state_from_events(bus):
+    handler = AgentStateHandler("agent1")
+
+    async def run():
+        await bus.publish(make_event(7, target_id="agent1"))
+        await bus.join()
+
+    asyncio.run(run())
+    state = handler.state_manager.get_agent_state("agent1")
+    assert state["state"] == "busy"
+    assert state["metadata"] == {"task_id": 7}
+
+def publish_all(bus, events):
+    async def run():
+        for event in events:
+            await bus.publish(event)
+    asyncio.run(run())
+
+def test_history_is_bounded_and_replayable(bus, monkeypatch):
+    monkeypatch.setattr(EventBus, "history_size", 5)
+    monkeypatch.setattr(EventBus, "log_directory", "event_log")
+    monkeypatch.setattr(EventBus, "segment_bytes", 2000)
+    bus.close()
+    EventBus._instance = None
+    bus = EventBus()
+    events = [
+        make_event(i, EventType.TASK_COMPLETED if i % 2 else EventType.TASK_ASSIGNED)
+        for i in range(100)
+    ]
+    for i, event in enumerate(events):
+        event.timestamp = 1000.0 + i
+    publish_all(bus, events)
+
+    assert len(bus.event_history) == 5
+    assert len(bus.event_log.segments) > 3
+    assert [e.data["task_id"] for e in bus.replay()] == list(range(100))
+    assert [e.data["task_id"] for e in bus.replay(since=1090.0)] == list(range(90, 100))
+    completed = [e.data["task_id"] for e in bus.replay(since=1050.0, event_types=[EventType.TASK_COMPLETED])]
+    assert completed == list(range(51, 100, 2))
+    bus.close()
+
+def test_event_log_survives_reopen_and_torn_writes(tmp_path):
+    log = EventLog(str(tmp_path / "log"), segment_bytes=500, index_interval=4)
+    for i in range(30):
+        log.append(make_event(i))
+    log.close()
+    segments = sorted((tmp_path / "log").glob("*.log"))
+    with open(segments[-1], "ab") as f:
+        f.write(b'{"seq": 31, "event_ty')
+
+    reopened = EventLog(str(tmp_path / "log"), segment_bytes=500, index_interval=4)
+    assert reopened.next_sequence == 31
+    reopened.append(make_event(30))
+    assert [seq for seq, _ in reopened.read()] == list(range(1, 32))
+    reopened.close()
+
+def test_event_log_is_opt_in_and_single_process(bus, tmp_path):
+    assert bus.event_log is None
+    publish_all(bus, [make_event(0)])
+    assert [e.data["task_id"] for e in bus.replay()] == [0]
+    assert not os.path.exists("event_log")
+
+    log = EventLog(str(tmp_path / "log"))
+    with pytest.raises(RuntimeError):
+        EventLog(str(tmp_path / "log"))
+    log.close()
+    EventLog(str(tmp_path / "log")).close()
+
+def test_replay_seeks_with_unordered_timestamps(tmp_path):
+    log = EventLog(str(tmp_path / "log"), segment_bytes=10 ** 6, index_interval=2)
+    timestamps = [5.0, 1.0, 2.0, 9.0, 3.0, 4.0, 10.0, 6.0]
+    for i, timestamp in enumerate(timestamps):
+        event = make_event(i)
+        event.timestamp = timestamp
+        log.append(event)
+    assert [event.timestamp for _, event in log.read(since=4.0)] == [5.0, 9.0, 4.0, 10.0, 6.0]
+    log.close()
+
+def test_targeted_subscriptions_only_wake_matching_agents(bus):
+    handlers = [AgentStateHandler(f"agent{i}") for i in range(50)]
+    subscriptions = {
+        (m["event_type"], m["target_id"] or m["source_id"]): m for m in bus.metrics()
+    }
+    assert len(subscriptions) == 150
+
+    async def run():
+        await bus.publish(make_event(1, target_id="agent7"))
+        await bus.publish(make_event(2, EventType.TASK_COMPLETED, source_id="agent3"))
+        await bus.join()
+
+    asyncio.run(run())
+    delivered = {(m["event_type"], m["target_id"] or m["source_id"]) for m in bus.metrics() if m["delivered"]}
+    assert delivered == {("task_assigned", "agent7"), ("task_completed", "agent3")}
+    assert handlers[7].state_manager.get_agent_state("agent7")["state"] == "busy"
+    assert handlers[3].state_manager.get_agent_state("agent3")["state"] == "idle"
+
+def test_predicate_and_combined_filters(bus):
+    seen = []
+
+    async def handler(event):
+        seen.append(event.data["task_id"])
+
+    bus.subscribe(EventType.TASK_ASSIGNED, handler, target_id="a", source_id="planner",
+                  predicate=lambda event: event.data["task_id"] % 2 == 0)
+
+    async def run():
+        for i, source in enumerate(["planner", "planner", "other", "planner"]):
+            await bus.publish(make_event(i, source_id=source, target_id="a"))
+        await bus.publish(make_event(10, source_id="planner", target_id="b"))
+        await bus.join()
+
+    asyncio.run(run())
+    assert seen == [0]
+
+def update(manager, agent_id, state=AgentState.BUSY, **metadata):
+    asyncio.run(manager.update_agent_state(agent_id, state, metadata))
+
+def test_updates_are_journaled_not_rewritten(tmp_path):
+    manager = StateManager(str(tmp_path / "states.json"), flush_interval=60)
+    for i in range(100):
+        update(manager, f"agent{i % 10}", step=i)
+    assert not os.path.exists(manager.journal_file)
+
+    assert manager.flush() == 100
+    with open(manager.journal_file) as f:
+        assert len(f.readlines()) == 100
+    assert not os.path.exists(manager.state_file)
+    manager.close()
+
+    reloaded = StateManager(str(tmp_path / "states.json"))
+    reloaded.load_states()
+    assert reloaded.agent_states == manager.agent_states
+    assert reloaded.get_agent_state("agent3")["metadata"] == {"step": 93}
+
+def test_idle_flusher_does_not_wake(tmp_path):
+    manager = StateManager(str(tmp_path / "states.json"), flush_interval=0.01)
+    flushes = []
+    flush = manager.flush
+
+    def counting_flush():
+        flushes.append(flush())
+        return flushes[-1]
+
+    manager.flush = counting_flush
+    update(manager, "agent1")
+    time.sleep(0.2)
+    assert flushes == [1]
+    update(manager, "agent1", AgentState.IDLE)
+    time.sleep(0.05)
+    assert flushes == [1, 1]
+    manager.close()
+
+def test_handlers_share_one_manager_by_default(bus):
+    handlers = [AgentStateHandler(f"agent{i}") for i in range(10)]
+    assert len({id(handler.state_manager) for handler in handlers}) == 1
+    assert StateSynchronizer().state_manager is handlers[0].state_manager
+
+    # A fresh bus gets a fresh manager publishing to it
+    bus.close()
+    EventBus._instance = None
+    assert AgentStateHandler("agent0").state_manager is not handlers[0].state_manager
+    assert handlers[0].state_manager._closed
+
+def test_background_flush_and_compaction(tmp_path):
+    manager = StateManager(str(tmp_path / "states.json"), flush_interval=0.01, flush_updates=5, compact_every=20)
+    for i in range(45):
+        update(manager, f"agent{i % 3}", step=i)
+    deadline = time.monotonic() + 5
+    while manager._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    manager.close()
+
+    with open(manager.state_file) as f:
+        snapshot = json.load(f)
+    with open(manager.journal_file) as f:
+        journaled = len(f.readlines())
+    assert set(snapshot) == {"agent0", "agent1", "agent2"}
+    assert journaled < 20
+    reloaded = StateManager(str(tmp_path / "states.json"))
+    reloaded.load_states()
+    assert reloaded.get_agent_state("agent2")["metadata"] == {"step": 44}
+
+def test_torn_journal_line_is_discarded(tmp_path):
+    manager = StateManager(str(tmp_path / "states.json"), flush_interval=60)
+    update(manager, "agent1", step=1)
+    manager.close()
+    with open(manager.journal_file, "a") as f:
+        f.write('{"agent_id": "agent1", "sta')
+
+    recovered = StateManager(str(tmp_path / "states.json"), flush_interval=60)
+    recovered.load_states()
+    assert recovered.get_agent_state("agent1")["metadata"] == {"step": 1}
+    update(recovered, "agent2", AgentState.IDLE)
+    recovered.close()
+
+    again = StateManager(str(tmp_path / "states.json"))
+    again.load_states()
+    assert set(again.agent_states) == {"agent1", "agent2"}
+
+def test_refresh_applies_only_new_journal_entries(tmp_path):
+    path = str(tmp_path / "states.json")
+    writer = StateManager(path, flush_interval=60, compact_every=1000)
+    reader = StateManager(path, flush_interval=60)
+    reader.load_states()
+
+    update(writer, "agent1", step=1)
+    writer.flush()
+    assert reader.refresh() == 1
+    offset = reader._journal_offset
+    assert reader.refresh() == 0
+
+    with open(writer.journal_file, "a") as f:
+        f.write('{"agent_id": "agent9", "st')
+    update(writer, "agent2", step=2)
+    assert reader.refresh() == 0
+    assert reader._journal_offset == offset
+
+    writer.compact()
+    assert reader.refresh() == 1
+    assert reader.get_agent_state("agent2")["metadata"] == {"step": 2}
+    assert "agent9" not in reader.agent_states
+    writer.close()
+
+def test_compaction_keeps_other_writers_updates(tmp_path):
+    path = str(tmp_path / "states.json")
+    a = StateManager(path, flush_interval=60, compact_every=2)
+    b = StateManager(path, flush_interval=60)
+    update(b, "b")
+    b.flush()
+    update(a, "a", step=1)
+    a.flush()
+    update(a, "a", step=2)
+    a.flush()
+    assert os.path.getsize(a.journal_file) == 0
+
+    update(b, "b2")
+    b.flush()
+    fresh = StateManager(path)
+    fresh.load_states()
+    assert sorted(fresh.agent_states) == ["a", "b", "b2"]
+    assert fresh.get_agent_state("a")["metadata"] == {"step": 2}
+    assert "b" in a.agent_states
+
+def test_refresh_keeps_newer_local_updates(tmp_path):
+    path = str(tmp_path / "states.json")
+    writer = StateManager(path, flush_interval=60)
+    reader = StateManager(path, flush_interval=60)
+    update(writer, "agent1", AgentState.BUSY)
+    writer.flush()
+    update(reader, "agent1", AgentState.IDLE)
+    reader.refresh()
+    assert reader.get_agent_state("agent1")["state"] == "idle"
+    writer.close()
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_synchronizer_propagates_changes_quickly(tmp_path, use_inotify):
+    path = str(tmp_path / "states.json")
+    writer = StateManager(path, flush_interval=60)
+    synchronizer = StateSynchronizer(StateManager(path, flush_interval=60), poll_interval=0.01)
+    synchronizer.use_inotify = use_inotify
+
+    async def run():
+        task = asyncio.ensure_future(synchronizer.start_sync())
+        await asyncio.sleep(0.05)
+        await writer.update_agent_state("agent1", AgentState.BUSY, {"step": 1})
+        writer.flush()
+        start = time.monotonic()
+        while synchronizer.state_manager.get_agent_state("agent1") is None:
+            assert time.monotonic() - start < 1
+            await asyncio.sleep(0.005)
+        task.cancel()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.5
+    writer.close()
+
+def _increment(db_path, agent_id, times):
+    store = SharedStateStore(db_path)
+
+    def bump(current):
+        count = current["metadata"]["count"] if current else 0
+        return {"state": "busy", "last_updated": time.time(), "metadata": {"count": count + 1}}
+
+    for _ in range(times):
+        store.update(agent_id, bump, retries=10000)
+    store.close()
+
+def test_shared_store_has_no_lost_updates_across_processes(tmp_path):
+    db_path = str(tmp_path / "states.db")
+    SharedStateStore(db_path).close()
+    workers = [multiprocessing.Process(target=_increment, args=(db_path, "agent1", 50)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    state = SharedStateStore(db_path).get_agent_state("agent1")
+    assert state["metadata"]["count"] == 200
+    assert state["version"] == 200
+
+def test_compare_and_set_rejects_stale_versions(tmp_path):
+    store = SharedStateStore(str(tmp_path / "states.db"))
+    manager = StateManager(str(tmp_path / "states.json"), shared_store=store)
+
+    async def run():
+        assert await manager.compare_and_set_agent_state("agent1", 0, AgentState.IDLE)
+        assert not await manager.compare_and_set_agent_state("agent1", 0, AgentState.BUSY)
+        await manager.update_agent_state("agent1", AgentState.BUSY, {"task_id": 1})
+        assert not await manager.compare_and_set_agent_state("agent1", 1, AgentState.ERROR)
+        assert await manager.compare_and_set_agent_state("agent1", 2, AgentState.IDLE)
+
+    asyncio.run(run())
+    assert manager.get_agent_state("agent1")["state"] == "idle"
+    assert manager.get_agent_state("agent1")["version"] == 3
+    other = StateManager(str(tmp_path / "other.json"), shared_store=SharedStateStore(store.db_path))
+    assert other.get_agent_state("agent1")["version"] == 3
+
+def test_shared_store_writes_do_not_block_the_loop(tmp_path):
+    store = SharedStateStore(str(tmp_path / "states.db"))
+    manager = StateManager(str(tmp_path / "states.json"), shared_store=store)
+    # Another process holds the write lock for a while
+    blocker = sqlite3.connect(store.db_path, isolation_level=None, check_same_thread=False)
+    blocker.execute("BEGIN IMMEDIATE")
+    release = threading.Timer(0.3, blocker.rollback)
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def run():
+        ticker = asyncio.ensure_future(tick())
+        release.start()
+        await manager.update_agent_state("agent1", AgentState.BUSY)
+        assert await manager.compare_and_set_agent_state("agent1", 1, AgentState.IDLE)
+        ticker.cancel()
+
+    asyncio.run(run())
+    assert len(ticks) >= 10
+    assert manager.get_agent_state("agent1")["version"] == 2
+    blocker.close()
+    store.close()
+
+def test_batch_get_agent_states(tmp_path):
+    store = SharedStateStore(str(tmp_path / "states.db"))
+    for i in range(1200):
+        store.set_agent_state(f"agent{i}", {"state": "idle", "last_updated": "t", "metadata": {"i": i}})
+    states = store.get_agent_states([f"agent{i}" for i in range(0, 1300, 3)])
+    assert len(states) == 400
+    assert states["agent999"]["metadata"] == {"i": 999}
+    store.close()
+
+def restart_bus(monkeypatch, segment_bytes=2000):
+    monkeypatch.setattr(EventBus, "log_directory", "event_log")
+    monkeypatch.setattr(EventBus, "segment_bytes", segment_bytes)
+    EventBus().close()
+    EventBus._instance = None
+    return EventBus()
+
+def test_recovery_is_snapshot_plus_log_tail(tmp_path, monkeypatch):
+    bus = restart_bus(monkeypatch)
+    manager = StateManager(str(tmp_path / "states.json"), flush_interval=60)
+    checkpointer = RuntimeCheckpointer(manager, path=str(tmp_path / "runtime.snapshot"))
+    for i in range(60):
+        update(manager, f"agent{i % 7}", step=i)
+    assert checkpointer.snapshot() == 60
+    for i in range(60, 75):
+        update(manager, f"agent{i % 7}", step=i)
+    expected = dict(manager.agent_states)
+
+    bus = restart_bus(monkeypatch)
+    recovered = StateManager(str(tmp_path / "other.json"), flush_interval=60)
+    assert RuntimeCheckpointer(recovered, path=str(tmp_path / "runtime.snapshot")).recover() == 15
+    assert recovered.agent_states == expected
+    bus.close()
+
+def test_recovery_keeps_newer_journaled_states(tmp_path):
+    manager = StateManager(str(tmp_path / "states.json"), flush_interval=60)
+    checkpointer = RuntimeCheckpointer(manager, path=str(tmp_path / "runtime.snapshot"))
+    update(manager, "agent1", AgentState.IDLE)
+    checkpointer.snapshot()
+    update(manager, "agent1", AgentState.BUSY)
+    manager.close()
+
+    # No event log, so only the journal knows about the BUSY update
+    restarted = StateManager(str(tmp_path / "states.json"), flush_interval=60)
+    restarted.load_states()
+    assert restarted.get_agent_state("agent1")["state"] == AgentState.BUSY.value
+    RuntimeCheckpointer(restarted, path=str(tmp_path / "runtime.snapshot")).recover()
+    assert restarted.get_agent_state("agent1")["state"] == AgentState.BUSY.value
+    restarted.close()
+
+def test_snapshot_makes_the_log_durable_first(tmp_path, monkeypatch):
+    bus = restart_bus(monkeypatch)
+    manager = StateManager(str(tmp_path / "states.json"), flush_interval=60)
+    for i in range(3):
+        update(manager, "agent1", step=i)
+    assert RuntimeCheckpointer(manager, path=str(tmp_path / "runtime.snapshot")).snapshot() == 3
+    logged = b"".join(path.read_bytes() for path in (tmp_path / "event_log").glob("*.log"))
+    assert logged.count(b"\n") == 3
+
+    # Even a log that lost its tail does not reissue covered sequences
+    bus.close()
+    shutil.rmtree(tmp_path / "event_log")
+    bus = restart_bus(monkeypatch)
+    recovered = StateManager(str(tmp_path / "other.json"), flush_interval=60)
+    RuntimeCheckpointer(recovered, path=str(tmp_path / "runtime.snapshot")).recover()
+    publish_all(bus, [make_event(0)])
+    assert [seq for seq, _ in bus.event_log.read()] == [4]
+    bus.close()
+
+def test_snapshot_compacts_log_up_to_slowest_cursor(tmp_path, monkeypatch):
+    bus = restart_bus(monkeypatch, segment_bytes=1000)
+    checkpointer = RuntimeCheckpointer(StateManager(flush_interval=60), path=str(tmp_path / "runtime.snapshot"))
+    seen = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def audit(event):
+            seen.append(event.data["task_id"])
+            if event.data["task_id"] == 40:
+                await release.wait()
+
+        # Only every 20th event matches, and the handler stalls on task 40
+        bus.subscribe(EventType.TASK_ASSIGNED, audit, predicate=lambda e: e.data["task_id"] % 20 == 0, name="audit")
+        for i in range(100):
+            await bus.publish(make_event(i))
+        while 40 not in seen:
+            await asyncio.sleep(0)
+
+        before = len(bus.event_log.segments)
+        assert checkpointer.snapshot() == 100
+        assert len(bus.event_log.segments) < before
+        assert bus.event_log.segments[0] <= 22
+        assert next(bus.event_log.read(after=21))[0] == 22
+
+        release.set()
+        await bus.join()
+        # The cursor moves past the events that never matched, up to the end
+        checkpointer.snapshot()
+        assert bus.cursor_positions() == {"audit": 100}
+        assert len(bus.event_log.segments) == 1
+
+    asyncio.run(run())
+    assert seen == [0, 20, 40, 60, 80]
+    bus.close()
+
+def test_released_cursor_expires(tmp_path, monkeypatch):
+    monkeypatch.setattr(EventBus, "stale_cursor_after", 0.2)
+    bus = restart_bus(monkeypatch, segment_bytes=1000)
+    checkpointer = RuntimeCheckpointer(StateManager(flush_interval=60), path=str(tmp_path / "runtime.snapshot"))
+
+    async def handler(event):
+        pass
+
+    async def run():
+        subscription = bus.subscribe(EventType.TASK_ASSIGNED, handler, name="gone")
+        for i in range(10):
+            await bus.publish(make_event(i))
+        await bus.join()
+        bus.unsubscribe(subscription)
+        for i in range(10, 100):
+            await bus.publish(make_event(i))
+
+    asyncio.run(run())
+    checkpointer.snapshot()
+    assert bus.event_log.segments[0] <= 11
+
+    # Nobody subscribes as "gone" again, even after a restart
+    bus = restart_bus(monkeypatch, segment_bytes=1000)
+    checkpointer = RuntimeCheckpointer(StateManager(flush_interval=60), path=str(tmp_path / "runtime.snapshot"))
+    checkpointer.recover()
+    assert bus.cursors == {"gone": 10}
+    time.sleep(0.3)
+    checkpointer.snapshot()
+    assert bus.cursors == {}
+    assert len(bus.event_log.segments) == 1
+    bus.close()
+
+def test_named_subscription_catches_up_after_restart(tmp_path, monkeypatch):
+    bus = restart_bus(monkeypatch)
+    seen = []
+
+    async def handler(event):
+        seen.append(event.data["task_id"])
+
+    async def run():
+        subscription = bus.subscribe(EventType.TASK_ASSIGNED, handler, name="worker")
+        for i in range(5):
+            await bus.publish(make_event(i))
+        await bus.join()
+        return subscription
+
+    subscription = asyncio.run(run())
+    RuntimeCheckpointer(StateManager(flush_interval=60), path=str(tmp_path / "runtime.snapshot")).snapshot()
+    # The worker goes away before these are delivered
+    bus.unsubscribe(subscription)
+    publish_all(bus, [make_event(i) for i in range(5, 8)])
+
+    bus = restart_bus(monkeypatch)
+    RuntimeCheckpointer(StateManager(flush_interval=60), path=str(tmp_path / "runtime.snapshot")).recover()
+    seen.clear()
+
+    async def resume():
+        subscription = bus.subscribe(EventType.TASK_ASSIGNED, handler, name="worker")
+        assert subscription.cursor == 5
+        assert await bus.catch_up(subscription) == 3
+        await bus.join()
+
+    asyncio.run(resume())
+    assert seen == [5, 6, 7]
+    bus.close()
+
+def state_event(agent_id, state):
+    return Event(EventType.STATE_CHANGE, agent_id, time.time(), {"state": state})
+
+def test_publish_many_delivers_in_order(bus):
+    seen = []
+
+    async def handler(event):
+        seen.append((event.target_id, event.data["task_id"]))
+
+    async def run():
+        bus.subscribe(EventType.TASK_ASSIGNED, handler)
+        bus.subscribe(EventType.TASK_ASSIGNED, handler, target_id="agent1")
+        delivered = await bus.publish_many(make_event(i, target_id=f"agent{i % 2}") for i in range(6))
+        await bus.join()
+        return delivered
+
+    assert asyncio.run(run()) == 9
+    assert [task_id for target_id, task_id in seen if target_id == "agent0"] == [0, 2, 4]
+    assert len(bus.event_history) == 6
+
+def test_coalescing_delivers_latest_state_per_source(bus):
+    seen = []
+
+    async def handler(event):
+        seen.append((event.source_id, event.data["state"]))
+
+    async def run():
+        bus.subscribe(EventType.STATE_CHANGE, handler)
+        bus.set_coalescing(EventType.STATE_CHANGE, 0.05)
+        states = ["busy", "idle"]
+        await bus.publish_many(state_event(f"agent{i % 3}", states[i % 2]) for i in range(100))
+        await bus.publish(state_event("agent0", "error"))
+        await asyncio.sleep(0.02)
+        assert seen == []
+        await asyncio.sleep(0.1)
+        handled = sorted(seen)
+        await bus.publish(state_event("agent1", "busy"))
+        await bus.join()
+        return handled
+
+    assert asyncio.run(run()) == [("agent0", "error"), ("agent1", "idle"), ("agent2", "busy")]
+    assert seen[-1] == ("agent1", "busy")
+    assert bus.coalesced == 98
+    assert len(list(bus.replay(event_types=[EventType.STATE_CHANGE]))) == 102
+
+def test_coalescing_keeps_latest_event_per_target(bus):
+    seen = []
+
+    async def handler(event):
+        seen.append((event.target_id, event.data["task_id"]))
+
+    async def run():
+        bus.subscribe(EventType.TASK_ASSIGNED, handler)
+        bus.set_coalescing(EventType.TASK_ASSIGNED, 0.05)
+        # One scheduler assigns to several agents; no assignment may be lost
+        await bus.publish_many(
+            make_event(i, source_id="scheduler", target_id=f"agent{i % 3}") for i in range(9)
+        )
+        await bus.join()
+
+    asyncio.run(run())
+    assert sorted(seen) == [("agent0", 6), ("agent1", 7), ("agent2", 8)]
+    assert bus.coalesced == 6
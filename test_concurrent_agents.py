@@ -0,0 +1,130 @@
+import asyncio
+import time
+import pytest
+from concurrent_agents import (
+    RequestPriority,
+    SuperClaudeResourceManager,
+    Workflow,
+    WorkflowCheckpointStore,
+    WorkflowExecution,
+    WorkflowStep
+)
+
+class RecordingAgent:
+    def __init__(self, fail_on=None, failures=None):
+        self.priority = RequestPriority.R1
+        self.fail_on = fail_on or set()
+        # Optional limit on how often each step in fail_on fails
+        self.failures = failures
+        self.attempts = {}
+        self.executed = []
+
+    async def submit_task(self, task):
+        await asyncio.sleep(0)
+        step = task["step"]
+        self.attempts[step] = self.attempts.get(step, 0) + 1
+        if step in self.fail_on and (self.failures is None or self.attempts[step] <= self.failures):
+            raise RuntimeError(f"step {step} failed")
+        self.executed.append(step)
+
+def build_workflow(step_count: int = 5) -> Workflow:
+    steps = [WorkflowStep(name="step_0", task={"step": "step_0"})]
+    for i in range(1, step_count):
+        steps.append(WorkflowStep(
+            name=f"step_{i}",
+            task={"step": f"step_{i}"},
+            depends_on=[f"step_{i - 1}"]
+        ))
+    return Workflow("pipeline", steps)
+
+@pytest.fixture
+def checkpoint_store(tmp_path):
+    store = WorkflowCheckpointStore(str(tmp_path / "checkpoints.db"), batch_size=2)
+    yield store
+    store.close()
+
+def test_resume_skips_completed_steps(checkpoint_store):
+    execution = WorkflowExecution(build_workflow(), checkpoint_store=checkpoint_store)
+    first_agent = RecordingAgent(fail_on={"step_3"})
+
+    assert not asyncio.run(execution.execute(first_agent))
+    assert first_agent.executed == ["step_0", "step_1", "step_2"]
+    # One attempt plus retry_count retries, then execution gives up
+    assert first_agent.attempts["step_3"] == 4
+
+    resumed = WorkflowExecution.resume(execution.workflow_id, checkpoint_store)
+    assert resumed.completed_steps == {"step_0", "step_1", "step_2"}
+
+    second_agent = RecordingAgent()
+    assert asyncio.run(resumed.execute(second_agent))
+    assert second_agent.executed == ["step_3", "step_4"]
+
+def test_flaky_step_succeeds_within_retries(checkpoint_store):
+    execution = WorkflowExecution(build_workflow(3), checkpoint_store=checkpoint_store)
+    agent = RecordingAgent(fail_on={"step_1"}, failures=2)
+    assert asyncio.run(execution.execute(agent))
+    assert agent.executed == ["step_0", "step_1", "step_2"]
+    assert execution.failed_steps == {}
+
+def test_checkpoints_survive_reopen(tmp_path):
+    db_path = str(tmp_path / "checkpoints.db")
+    store = WorkflowCheckpointStore(db_path, batch_size=1000, flush_interval=60)
+    execution = WorkflowExecution(build_workflow(3), checkpoint_store=store)
+    asyncio.run(execution.execute(RecordingAgent()))
+    store.close()
+
+    reopened = WorkflowCheckpointStore(db_path)
+    resumed = WorkflowExecution.resume(execution.workflow_id, reopened)
+    assert resumed.completed_steps == {"step_0", "step_1", "step_2"}
+    reopened.close()
+
+def test_resume_unknown_workflow(checkpoint_store):
+    with pytest.raises(ValueError):
+        WorkflowExecution.resume("missing", checkpoint_store)
+
+class CountingResourceManager(SuperClaudeResourceManager):
+    def __init__(self, service_time=0.0, **kwargs):
+        self.processed = []
+        self.service_time = service_time
+        self.running = 0
+        self.max_running = 0
+        super().__init__(**kwargs)
+
+    async def _process_request(self, request):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.service_time)
+        self.running -= 1
+        self.processed.append(request.priority)
+
+def wait_for_processed(manager, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(manager.processed) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_resource_manager_processes_queued_requests():
+    # CEO requests need more units than the pool holds and must still run
+    manager = CountingResourceManager(compute_units=10)
+    for priority in RequestPriority:
+        manager.submit_request(priority, "agent", {"type": "test"})
+
+    wait_for_processed(manager, len(RequestPriority))
+    manager.shutdown()
+
+    assert sorted(p.value for p in manager.processed) == [p.value for p in RequestPriority]
+    assert manager.compute_pool.available == 10
+
+def test_pool_size_bounds_concurrent_requests():
+    # GROUND requests take 5 units, so a 20 unit pool runs 4 at a time
+    manager = CountingResourceManager(service_time=0.1, compute_units=20)
+    for _ in range(12):
+        manager.submit_request(RequestPriority.GROUND, "agent", {"type": "test"})
+
+    start = time.monotonic()
+    wait_for_processed(manager, 12)
+    elapsed = time.monotonic() - start
+    manager.shutdown()
+
+    assert manager.max_running == 4
+    assert elapsed < 0.6
+    assert manager.compute_pool.available == 20
@@ -0,0 +1,72 @@
+import threading
+import pytest
+from agent_memory import AgentMemory
+from sharded_memory import ConsistentHashRing, ShardedMemoryStore
+
+@pytest.fixture
+def sharded(tmp_path):
+    store = ShardedMemoryStore(str(tmp_path / "shards"), shard_count=3)
+    yield store
+    store.close()
+
+def test_ring_moves_few_keys_when_growing():
+    keys = [f"agent-{i}" for i in range(2000)]
+    before = ConsistentHashRing([f"s{i}" for i in range(4)])
+    after = ConsistentHashRing([f"s{i}" for i in range(5)])
+    moved = sum(before.node_for(k) != after.node_for(k) for k in keys)
+    assert moved < len(keys) * 0.35
+    assert len({before.node_for(k) for k in keys}) == 4
+
+def test_agents_are_isolated_on_their_shards(sharded):
+    agents = [AgentMemory(f"agent-{i}", store=sharded) for i in range(12)]
+    assert len({id(agent.store) for agent in agents}) == 3
+
+    def write(agent):
+        for j in range(50):
+            agent.add_memory("task", {"step": j, "owner": agent.agent_id}, 0.9)
+
+    threads = [threading.Thread(target=write, args=(agent,)) for agent in agents]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sharded.flush()
+
+    for agent in agents:
+        records = agent.retrieve_memories("task", limit=100)
+        assert len(records) == 50
+        assert {r.content["owner"] for r in records} == {agent.agent_id}
+
+def test_scatter_gather_queries(sharded):
+    for i in range(6):
+        AgentMemory(f"agent-{i}", store=sharded).add_memory(
+            "task", {"summary": f"deploy number {i}"}, 0.8, embedding=[1.0, float(i)]
+        )
+    results = sharded.search("deploy", limit=10)
+    assert sorted(agent_id for agent_id, _, _ in results) == [f"agent-{i}" for i in range(6)]
+    nearest = sharded.recall_similar([1.0, 0.0], k=2)
+    assert [r.content["summary"] for r, _ in nearest] == ["deploy number 0", "deploy number 1"]
+
+def test_rebalance_moves_warm_and_cold_memories(tmp_path):
+    directory = str(tmp_path / "shards")
+    store = ShardedMemoryStore(directory, shard_count=2)
+    for i in range(20):
+        memory = AgentMemory(f"agent-{i}", store=store)
+        memory.add_memory("task", {"step": "old"}, 0.75)
+        memory.flush()
+        memory.store.archive(memory.short_term[0].timestamp.replace(year=3000), max_importance=1.0)
+        memory.add_memory("task", {"step": "new"}, 0.9, embedding=[0.0, 1.0])
+    moves = store.rebalance(3)
+    store.close()
+    assert moves and all(target == "shard-002.db" for _, target in moves.values())
+
+    reopened = ShardedMemoryStore(directory)
+    assert len(reopened.shards) == 3
+    placement = reopened.agent_ids()
+    assert sorted(a for agents in placement.values() for a in agents) == sorted(f"agent-{i}" for i in range(20))
+    for i in range(20):
+        memory = AgentMemory(f"agent-{i}", store=reopened)
+        assert f"agent-{i}" in placement[reopened.ring.node_for(f"agent-{i}")]
+        assert sorted(r.content["step"] for r in memory.iter_memories()) == ["new", "old"]
+    assert len(reopened.recall_similar([0.0, 1.0], k=50)) == 20
+    reopened.close()